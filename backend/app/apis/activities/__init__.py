@@ -36,7 +36,17 @@ from enum import Enum
 import asyncpg
 import databutton as db
 from app.auth import AuthorizedUser
-from datetime import datetime, date
+from app.libs.leaderboard_service import note_competition_write
+from app.libs.competition_totals import ensure_entry_totals_table
+from app.libs.activity_rollup import ensure_activity_rollup
+from app.libs.streaks import ensure_streaks, advance_streak
+from app.libs.rank_index import rank_indexes
+from app.libs.outbox import enqueue, outbox_handler
+from app.libs.team_stats import team_stats_builder, team_stats_snapshots, note_team_stats_write
+from app.libs.workdays import quarter_workdays
+from app.libs.local_time import SQL_LOCAL_TODAY, local_today
+from datetime import datetime
+import json
 import uuid
 import time
 import asyncio
@@ -111,6 +121,7 @@ class TeamStatsResponse(BaseModel):
     planet_status: dict
     race_position: dict
     quarter_info: dict
+    generated_at: datetime
 
 class UpdateActivityRequest(BaseModel):
     type: ActivityType
@@ -158,9 +169,11 @@ async def ensure_test_quarter():
     finally:
         await conn.close()
 
-async def get_current_quarter():
-    """Get the current active quarter"""
-    conn = await get_db_connection()
+async def get_current_quarter(conn=None):
+    """Get the current active quarter (on the caller's connection when given)"""
+    own_conn = conn is None
+    if own_conn:
+        conn = await get_db_connection()
     try:
         # For now, get the latest quarter - in future this could be configurable
         quarter = await conn.fetchrow("""
@@ -181,11 +194,14 @@ async def get_current_quarter():
             
         return quarter
     finally:
-        await conn.close()
+        if own_conn:
+            await conn.close()
 
-async def get_or_create_profile(user_id: str, quarter_id: int):
+async def get_or_create_profile(user_id: str, quarter_id: int, conn=None):
     """Get or create user profile for current quarter using selected player"""
-    conn = await get_db_connection()
+    own_conn = conn is None
+    if own_conn:
+        conn = await get_db_connection()
     try:
         # Convert user_id to UUID format if it's not already
         try:
@@ -246,7 +262,96 @@ async def get_or_create_profile(user_id: str, quarter_id: int):
         print(f"Created new profile for user {user_uuid} as player {player_name}")
         return profile
     finally:
-        await conn.close()
+        if own_conn:
+            await conn.close()
+
+# Activity type -> challenge target_type it counts towards
+ACTIVITY_TO_TARGET_TYPE = {
+    "book": "meetings",
+    "opp": "opportunities",
+    "deal": "deals"
+}
+
+# One round trip for the whole logging write path: insert the activity, add the
+# race points, read the aggregates for progress/streak feedback and apply team
+# challenge progress. The aggregates come from the statement snapshot, which
+# does not include the new activity yet; log_activity adds it back in Python.
+LOG_ACTIVITY_SQL = f"""
+    WITH ins AS (
+        INSERT INTO activities (profile_id, quarter_id, type, points)
+        VALUES ($1, $2, $3, $4)
+        RETURNING id
+    ), prof AS (
+        UPDATE profiles
+        SET points = points + $4
+        WHERE id = $1
+        RETURNING id, name, points, goal_books, goal_opps, goal_deals
+    ), counts AS (
+        SELECT
+            COUNT(*) FILTER (WHERE type = 'book') AS books,
+            COUNT(*) FILTER (WHERE type = 'opp') AS opps,
+            COUNT(*) FILTER (WHERE type = 'deal') AS deals,
+            COUNT(*) FILTER (WHERE local_date = {SQL_LOCAL_TODAY}) AS today_count
+        FROM activities
+        WHERE profile_id = $1 AND quarter_id = $2
+    ), streak AS (
+        -- The row before the trigger advances it
+        SELECT current_streak, last_local_date
+        FROM streaks
+        WHERE scope = 'profile' AND scope_id = $1
+    ), matched AS (
+        SELECT id, title, target_value, reward_points, reward_description, progress_mode
+        FROM challenges
+        WHERE quarter_id = $2 AND status = 'active' AND end_time > CURRENT_TIMESTAMP
+          AND (target_type = 'activities' OR target_type = $6)
+    ), team AS (
+        -- Atomic increment + completion; the status guard is rechecked on the
+        -- locked row so exactly one concurrent logger completes a challenge
+        UPDATE challenges c
+        SET current_progress = c.current_progress + $5,
+            status = CASE WHEN c.current_progress + $5 >= c.target_value THEN 'completed' ELSE c.status END,
+            completed_by = CASE WHEN c.current_progress + $5 >= c.target_value THEN $7 ELSE c.completed_by END,
+            completed_at = CASE WHEN c.current_progress + $5 >= c.target_value THEN CURRENT_TIMESTAMP ELSE c.completed_at END,
+            updated_at = CURRENT_TIMESTAMP
+        FROM matched m
+        WHERE c.id = m.id AND m.progress_mode IS DISTINCT FROM 'per_person' AND c.status = 'active'
+        RETURNING c.id, c.current_progress, c.status = 'completed' AS completed
+    ), contrib AS (
+        -- Team challenges count only where team updated the row (a concurrent
+        -- logger may have completed it since matched was read)
+        INSERT INTO challenge_participants (challenge_id, player_name, contribution)
+        SELECT id, $7, $5 FROM team
+        UNION ALL
+        SELECT id, $7, $5 FROM matched WHERE progress_mode IS NOT DISTINCT FROM 'per_person'
+        ON CONFLICT (challenge_id, player_name)
+        DO UPDATE SET contribution = challenge_participants.contribution + EXCLUDED.contribution
+        RETURNING challenge_id, contribution
+    )
+    SELECT
+        ins.id AS activity_id,
+        prof.name, prof.points, prof.goal_books, prof.goal_opps, prof.goal_deals,
+        counts.books, counts.opps, counts.deals, counts.today_count,
+        streak.current_streak, streak.last_local_date,
+        {SQL_LOCAL_TODAY} AS today,
+        (
+            SELECT COALESCE(json_agg(json_build_object(
+                'id', m.id,
+                'title', m.title,
+                'target_value', m.target_value,
+                'reward_points', m.reward_points,
+                'reward_description', m.reward_description,
+                'per_person', m.progress_mode IS NOT DISTINCT FROM 'per_person',
+                'team_progress', t.current_progress,
+                'team_completed', t.completed,
+                'contribution', ct.contribution
+            )), '[]')
+            FROM matched m
+            LEFT JOIN team t ON t.id = m.id
+            LEFT JOIN contrib ct ON ct.challenge_id = m.id
+        ) AS challenges
+    FROM ins, prof, counts
+    LEFT JOIN streak ON TRUE
+"""
 
 @router.post("/log", response_model=LogActivityResponse)
 async def log_activity(request: LogActivityRequest, user: AuthorizedUser):
@@ -255,90 +360,106 @@ async def log_activity(request: LogActivityRequest, user: AuthorizedUser):
     - Individual: Add race points (1/2/5) to player
     - Team: Add +1 count to team totals (regardless of type)
     - Enhanced: Progress context, streak info, and thematic messaging
+
+    Everything runs in one transaction on one connection; the common path is
+    three round trips (quarter, profile, LOG_ACTIVITY_SQL).
     """
     try:
-        # Get current quarter
-        quarter = await get_current_quarter()
-        if not quarter:
-            raise HTTPException(status_code=400, detail="No active quarter found")
-            
-        # Get or create user profile
-        profile = await get_or_create_profile(user.sub, quarter['id'])
-        
-        # Calculate points for this activity type
-        points = ACTIVITY_POINTS[request.type]
-        
-        # Database transaction to update both systems
         conn = await get_db_connection()
         try:
+            # Get current quarter
+            quarter = await get_current_quarter(conn)
+            if not quarter:
+                raise HTTPException(status_code=400, detail="No active quarter found")
+
+            # Get or create user profile
+            profile = await get_or_create_profile(user.sub, quarter['id'], conn)
+
+            # The streak trigger must exist before the insert (once per process)
+            await ensure_streaks(conn)
+
+            # Calculate points for this activity type
+            points = ACTIVITY_POINTS[request.type]
+
             async with conn.transaction():
-                # 1. Log the activity
-                activity = await conn.fetchrow("""
-                    INSERT INTO activities (profile_id, quarter_id, type, points)
-                    VALUES ($1, $2, $3, $4)
-                    RETURNING id
-                """, profile['id'], quarter['id'], request.type.value, points)
-                
-                # 2. Update player's total points (Track 1: Race Points)
-                updated_profile = await conn.fetchrow("""
-                    UPDATE profiles 
-                    SET points = points + $1
-                    WHERE id = $2
-                    RETURNING *
-                """, points, profile['id'])
-                
-                # 3. Calculate enhanced feedback context
-                progress_context = await calculate_progress_context(
-                    updated_profile, quarter['id'], request.type.value, conn
-                )
-                
-                streak_info = await calculate_streak_info(
-                    profile['id'], quarter['id'], conn
+                # 1-4. Log the activity, add race points, gather feedback aggregates
+                # and apply challenge progress
+                row = await conn.fetchrow(
+                    LOG_ACTIVITY_SQL,
+                    profile['id'], quarter['id'], request.type.value, points,
+                    1, ACTIVITY_TO_TARGET_TYPE.get(request.type.value), str(profile['name'])
                 )
-                
-                # 4. Process bonus challenges (NEW)
-                challenge_rewards = await process_challenge_progress(
-                    profile, quarter['id'], request.type.value, conn
+                total_points = row['points']
+
+                # 3. Calculate enhanced feedback context (counting the new activity)
+                counts = {"books": row['books'], "opps": row['opps'], "deals": row['deals']}
+                counts[request.type.value + "s"] += 1
+                progress_context = build_progress_context(row, counts)
+
+                current_streak = advance_streak(row['current_streak'] or 0, row['last_local_date'], row['today'])
+                streak_info = build_streak_info(current_streak, row['today_count'] + 1)
+
+                # 4. Completions and rewards for bonus challenges
+                challenge_rewards = await apply_challenge_results(
+                    conn, profile, json.loads(row['challenges'])
                 )
-                
+                rewarded_points = sum(c['reward_points'] for c in challenge_rewards['completed_challenges'])
+                latest_points = total_points
+                if rewarded_points:
+                    latest_points = await conn.fetchval("""
+                        UPDATE profiles
+                        SET points = points + $1
+                        WHERE id = $2
+                        RETURNING points
+                    """, rewarded_points, profile['id'])
+
                 # 5. Generate team impact information
                 team_impact = {
                     "team_contribution": f"+1 {request.type.value} to team totals",
                     "race_points_added": points
                 }
-                
+
                 # 6. Generate thematic message based on activity type
                 thematic_messages = {
                     "book": "📡 Signal detected! New contact established",
-                    "opp": "🧭 Navigation locked! Opportunity mapped", 
+                    "opp": "🧭 Navigation locked! Opportunity mapped",
                     "deal": "🤝 Landing successful! Partnership secured"
                 }
-                
-                # 7. TWO-WAY LOGGING: If this is a "book" activity and not triggered by competition, 
-                # automatically log in all active booking competitions
-                if (request.type == ActivityType.BOOK and 
-                    request.triggered_by != "competition"):
-                    await trigger_competition_logging(
-                        profile['name'], updated_profile['points'], activity['id'], conn
-                    )
-                
-                return LogActivityResponse(
-                    success=True,
-                    points_earned=points,
-                    total_points=updated_profile['points'],
-                    activity_id=activity['id'],
-                    message=thematic_messages.get(request.type.value, "Activity logged!"),
-                    activity_type=request.type.value,
-                    player_name=profile['name'],
-                    progress_context=progress_context,
-                    team_impact=team_impact,
-                    streak_info=streak_info,
-                    challenge_updates=challenge_rewards
-                )
-                
+
+                # 7. Post-commit side effects (two-way competition logging, challenge
+                # cache) are delivered by the outbox dispatcher
+                await enqueue(conn, "activity.logged", {
+                    "activity_id": row['activity_id'],
+                    "quarter_id": quarter['id'],
+                    "player_name": profile['name'],
+                    "type": request.type.value,
+                    "triggered_by": request.triggered_by,
+                    "total_points": total_points,
+                    "challenges_updated": bool(challenge_rewards['updated_challenges']),
+                })
+
+            rank_indexes.set_quarter_points(quarter['id'], profile['name'], latest_points)
+            note_team_stats_write(quarter['id'])
+
+            return LogActivityResponse(
+                success=True,
+                points_earned=points,
+                total_points=total_points,
+                activity_id=row['activity_id'],
+                message=thematic_messages.get(request.type.value, "Activity logged!"),
+                activity_type=request.type.value,
+                player_name=profile['name'],
+                progress_context=progress_context,
+                team_impact=team_impact,
+                streak_info=streak_info,
+                challenge_updates=challenge_rewards
+            )
+
         finally:
             await conn.close()
-            
+
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error logging activity: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to log activity")
@@ -500,147 +621,141 @@ async def get_dynamic_team_goals(quarter_id: int, conn) -> dict:
         'deals': team_totals['total_goal_deals']
     }
 
+@team_stats_builder
+async def build_team_stats(conn):
+    """
+    Compute team-level progress stats for the race visualization.
+    Uses COUNT-based logic (not points) for team progress.
+    Served from the in-memory snapshot by /team-stats.
+    """
+    quarter = await get_current_quarter(conn)
+
+    # Get team totals (COUNT-based, not points) from the daily rollup
+    await ensure_activity_rollup(conn)
+    team_counts = await conn.fetchrow("""
+        SELECT 
+            COALESCE(SUM(activity_count) FILTER (WHERE activity_type = 'book'), 0)::int as books_count,
+            COALESCE(SUM(activity_count) FILTER (WHERE activity_type = 'opp'), 0)::int as opps_count,
+            COALESCE(SUM(activity_count) FILTER (WHERE activity_type = 'deal'), 0)::int as deals_count,
+            COALESCE(SUM(activity_count), 0)::int as total_activities
+        FROM activity_daily_rollup
+        WHERE quarter_id = $1
+    """, quarter['id'])
+
+    # Get dynamic team goals from database (replaces hardcoded values)
+    TEAM_GOALS = await get_dynamic_team_goals(quarter['id'], conn)
+
+    # Total team goal for race (sum of all activity counts needed)
+    total_team_goal = sum(TEAM_GOALS.values())  # 204 total activities
+
+    # Current team progress (sum of all activity counts)
+    team_total_count = (
+        team_counts['books_count'] + 
+        team_counts['opps_count'] + 
+        team_counts['deals_count']
+    )
+
+    # Calculate benchmark progress based on time elapsed
+    quarter_start = quarter['start_date']
+    quarter_end = quarter['end_date']
+    today = local_today()
+
+    # Calculate days elapsed and total days
+    if isinstance(quarter_start, str):
+        quarter_start = datetime.strptime(quarter_start, '%Y-%m-%d').date()
+    if isinstance(quarter_end, str):
+        quarter_end = datetime.strptime(quarter_end, '%Y-%m-%d').date()
+
+    days_elapsed = max(0, (today - quarter_start).days)
+    total_days = (quarter_end - quarter_start).days
+
+    # Benchmark calculation: ghost position based on workdays (weekends and holidays pause it)
+    workdays = quarter_workdays(quarter_start, quarter_end, today)
+    time_progress = workdays.progress
+    benchmark_position = total_team_goal * time_progress
+
+    # Team vs benchmark race position
+    team_progress_pct = team_total_count / total_team_goal if total_team_goal > 0 else 0
+    benchmark_progress_pct = benchmark_position / total_team_goal if total_team_goal > 0 else 0
+
+    # Planet status (each lights up when goal is reached)
+    planet_status = {
+        'books': {
+            'current': team_counts['books_count'],
+            'goal': TEAM_GOALS['books'],
+            'completed': team_counts['books_count'] >= TEAM_GOALS['books'],
+            'progress_pct': min(100, (team_counts['books_count'] / TEAM_GOALS['books']) * 100)
+        },
+        'opps': {
+            'current': team_counts['opps_count'],
+            'goal': TEAM_GOALS['opps'],
+            'completed': team_counts['opps_count'] >= TEAM_GOALS['opps'],
+            'progress_pct': min(100, (team_counts['opps_count'] / TEAM_GOALS['opps']) * 100)
+        },
+        'deals': {
+            'current': team_counts['deals_count'],
+            'goal': TEAM_GOALS['deals'],
+            'completed': team_counts['deals_count'] >= TEAM_GOALS['deals'],
+            'progress_pct': min(100, (team_counts['deals_count'] / TEAM_GOALS['deals']) * 100)
+        }
+    }
+
+    # Race position info
+    is_team_ahead = team_total_count >= benchmark_position
+    race_position = {
+        'team_ahead': is_team_ahead,
+        'team_position': team_total_count,
+        'benchmark_position': benchmark_position,
+        'gap': abs(team_total_count - benchmark_position),
+        'team_wins': team_total_count >= total_team_goal,
+        'race_complete': max(team_total_count, benchmark_position) >= total_team_goal
+    }
+
+    return quarter['id'], dict(
+        team_progress={
+            'current_count': team_total_count,
+            'total_goal': total_team_goal,
+            'progress_percentage': min(100, team_progress_pct * 100),
+            'breakdown': {
+                'books': team_counts['books_count'],
+                'opps': team_counts['opps_count'],
+                'deals': team_counts['deals_count']
+            }
+        },
+        benchmark_progress={
+            'current_position': benchmark_position,
+            'progress_percentage': min(100, benchmark_progress_pct * 100),
+            'time_elapsed_pct': time_progress * 100,
+            'days_elapsed': days_elapsed,
+            'total_days': total_days,
+            'workdays_passed': workdays.passed,
+            'total_workdays': workdays.total
+        },
+        planet_status=planet_status,
+        race_position=race_position,
+        quarter_info={
+            'id': quarter['id'],
+            'name': quarter['name'],
+            'start_date': str(quarter['start_date']),
+            'end_date': str(quarter['end_date'])
+        }
+    )
+
 @router.get("/team-stats", response_model=TeamStatsResponse)
 async def get_team_stats():
     """
     Get team-level progress stats for the race visualization.
-    Uses COUNT-based logic (not points) for team progress.
+    Served from the per-quarter snapshot, rebuilt after writes (see app.libs.team_stats).
     """
     try:
-        quarter = await get_current_quarter()
-        if not quarter:
-            raise HTTPException(status_code=400, detail="No active quarter found")
-            
-        conn = await get_db_connection()
-        try:
-            # Get team totals (COUNT-based, not points)
-            team_counts = await conn.fetchrow("""
-                SELECT 
-                    COALESCE(SUM(CASE WHEN a.type = 'book' THEN 1 ELSE 0 END), 0) as books_count,
-                    COALESCE(SUM(CASE WHEN a.type = 'opp' THEN 1 ELSE 0 END), 0) as opps_count,
-                    COALESCE(SUM(CASE WHEN a.type = 'deal' THEN 1 ELSE 0 END), 0) as deals_count,
-                    COUNT(*) as total_activities
-                FROM activities a
-                JOIN profiles p ON a.profile_id = p.id
-                WHERE a.quarter_id = $1
-            """, quarter['id'])
-            
-            # Get dynamic team goals from database (replaces hardcoded values)
-            TEAM_GOALS = await get_dynamic_team_goals(quarter['id'], conn)
-
-            # Total team goal for race (sum of all activity counts needed)
-            total_team_goal = sum(TEAM_GOALS.values())  # 204 total activities
-            
-            # Current team progress (sum of all activity counts)
-            team_total_count = (
-                team_counts['books_count'] + 
-                team_counts['opps_count'] + 
-                team_counts['deals_count']
-            )
-            
-            # Calculate benchmark progress based on time elapsed
-            quarter_start = quarter['start_date']
-            quarter_end = quarter['end_date']
-            today = date.today()
-            
-            # Calculate days elapsed and total days
-            if isinstance(quarter_start, str):
-                quarter_start = datetime.strptime(quarter_start, '%Y-%m-%d').date()
-            if isinstance(quarter_end, str):
-                quarter_end = datetime.strptime(quarter_end, '%Y-%m-%d').date()
-                
-            days_elapsed = max(0, (today - quarter_start).days)
-            total_days = (quarter_end - quarter_start).days
-            
-            # Benchmark calculation: ghost position based on time
-            time_progress = min(1.0, days_elapsed / total_days if total_days > 0 else 0)
-            benchmark_position = total_team_goal * time_progress
-            
-            # Team vs benchmark race position
-            team_progress_pct = team_total_count / total_team_goal if total_team_goal > 0 else 0
-            benchmark_progress_pct = benchmark_position / total_team_goal if total_team_goal > 0 else 0
-            
-            # Planet status (each lights up when goal is reached)
-            planet_status = {
-                'books': {
-                    'current': team_counts['books_count'],
-                    'goal': TEAM_GOALS['books'],
-                    'completed': team_counts['books_count'] >= TEAM_GOALS['books'],
-                    'progress_pct': min(100, (team_counts['books_count'] / TEAM_GOALS['books']) * 100)
-                },
-                'opps': {
-                    'current': team_counts['opps_count'],
-                    'goal': TEAM_GOALS['opps'],
-                    'completed': team_counts['opps_count'] >= TEAM_GOALS['opps'],
-                    'progress_pct': min(100, (team_counts['opps_count'] / TEAM_GOALS['opps']) * 100)
-                },
-                'deals': {
-                    'current': team_counts['deals_count'],
-                    'goal': TEAM_GOALS['deals'],
-                    'completed': team_counts['deals_count'] >= TEAM_GOALS['deals'],
-                    'progress_pct': min(100, (team_counts['deals_count'] / TEAM_GOALS['deals']) * 100)
-                }
-            }
-            
-            # Race position info
-            is_team_ahead = team_total_count >= benchmark_position
-            race_position = {
-                'team_ahead': is_team_ahead,
-                'team_position': team_total_count,
-                'benchmark_position': benchmark_position,
-                'gap': abs(team_total_count - benchmark_position),
-                'team_wins': team_total_count >= total_team_goal,
-                'race_complete': max(team_total_count, benchmark_position) >= total_team_goal
-            }
-            
-            return TeamStatsResponse(
-                team_progress={
-                    'current_count': team_total_count,
-                    'total_goal': total_team_goal,
-                    'progress_percentage': min(100, team_progress_pct * 100),
-                    'breakdown': {
-                        'books': team_counts['books_count'],
-                        'opps': team_counts['opps_count'],
-                        'deals': team_counts['deals_count']
-                    }
-                },
-                benchmark_progress={
-                    'current_position': benchmark_position,
-                    'progress_percentage': min(100, benchmark_progress_pct * 100),
-                    'time_elapsed_pct': time_progress * 100,
-                    'days_elapsed': days_elapsed,
-                    'total_days': total_days
-                },
-                planet_status=planet_status,
-                race_position=race_position,
-                quarter_info={
-                    'id': quarter['id'],
-                    'name': quarter['name'],
-                    'start_date': str(quarter['start_date']),
-                    'end_date': str(quarter['end_date'])
-                }
-            )
-            
-        finally:
-            await conn.close()
-            
+        return TeamStatsResponse(**await team_stats_snapshots.get())
     except Exception as e:
         print(f"Error getting team stats: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to get team stats")
 
-async def calculate_progress_context(profile, quarter_id, activity_type, conn):
+def build_progress_context(profile, activity_counts):
     """Calculate progress context for enhanced feedback"""
     
-    # Get current activity counts
-    activity_counts = await conn.fetchrow("""
-        SELECT 
-            COUNT(CASE WHEN type = 'book' THEN 1 END) as books,
-            COUNT(CASE WHEN type = 'opp' THEN 1 END) as opps,
-            COUNT(CASE WHEN type = 'deal' THEN 1 END) as deals
-        FROM activities 
-        WHERE profile_id = $1 AND quarter_id = $2
-    """, profile['id'], quarter_id)
-    
     # Calculate remaining activities to reach goals
     remaining_books = max(0, profile['goal_books'] - activity_counts['books'])
     remaining_opps = max(0, profile['goal_opps'] - activity_counts['opps'])
@@ -666,39 +781,8 @@ async def calculate_progress_context(profile, quarter_id, activity_type, conn):
         "next_milestone": calculate_next_milestone(profile['points'], total_goal_points)
     }
 
-async def calculate_streak_info(profile_id, quarter_id, conn):
-    """Calculate streak information for momentum feedback"""
-    
-    # Get recent activities (last 7 days)
-    recent_activities = await conn.fetch("""
-        SELECT DATE(created_at) as activity_date, COUNT(*) as daily_count
-        FROM activities 
-        WHERE profile_id = $1 AND quarter_id = $2 
-        AND created_at >= NOW() - INTERVAL '7 days'
-        GROUP BY DATE(created_at)
-        ORDER BY activity_date DESC
-    """, profile_id, quarter_id)
-    
-    # Calculate current streak
-    current_streak = 0
-    if recent_activities:
-        from datetime import date, timedelta
-        today = date.today()
-        
-        for activity in recent_activities:
-            expected_date = today - timedelta(days=current_streak)
-            if activity['activity_date'] == expected_date:
-                current_streak += 1
-            else:
-                break
-    
-    # Get today's activity count
-    today_count = await conn.fetchval("""
-        SELECT COUNT(*) FROM activities 
-        WHERE profile_id = $1 AND quarter_id = $2 
-        AND DATE(created_at) = CURRENT_DATE
-    """, profile_id, quarter_id)
-    
+def build_streak_info(current_streak, today_count):
+    """Streak information for momentum feedback (current_streak includes today)"""
     return {
         "current_streak_days": current_streak,
         "today_activities": today_count,
@@ -795,13 +879,16 @@ async def delete_activity(activity_id: int, user: AuthorizedUser):
                     WHERE id = $2
                     RETURNING points
                 """, activity['points'], profile['id'])
-                
-                return DeleteActivityResponse(
-                    success=True,
-                    message=f"{activity['type'].title()} activity deleted successfully",
-                    points_removed=activity['points'],
-                    new_total_points=updated_profile['points']
-                )
+                rank_indexes.set_quarter_points(quarter['id'], profile['name'], updated_profile['points'])
+
+            # Committed; refresh the team snapshot
+            note_team_stats_write(quarter['id'])
+            return DeleteActivityResponse(
+                success=True,
+                message=f"{activity['type'].title()} activity deleted successfully",
+                points_removed=activity['points'],
+                new_total_points=updated_profile['points']
+            )
                 
         finally:
             await conn.close()
@@ -861,14 +948,17 @@ async def update_activity(activity_id: int, request: UpdateActivityRequest, user
                     WHERE id = $2
                     RETURNING points
                 """, points_difference, profile['id'])
-                
-                return UpdateActivityResponse(
-                    success=True,
-                    message=f"Activity updated to {request.type.value.title()}",
-                    points_changed=points_difference,
-                    new_total_points=updated_profile['points'],
-                    activity_id=activity_id
-                )
+                rank_indexes.set_quarter_points(quarter['id'], profile['name'], updated_profile['points'])
+
+            # Committed; refresh the team snapshot
+            note_team_stats_write(quarter['id'])
+            return UpdateActivityResponse(
+                success=True,
+                message=f"Activity updated to {request.type.value.title()}",
+                points_changed=points_difference,
+                new_total_points=updated_profile['points'],
+                activity_id=activity_id
+            )
                 
         finally:
             await conn.close()
@@ -1002,7 +1092,7 @@ async def _fetch_challenges_summary(quarter_id: int, user_name: str) -> Challeng
             END as expiring_soon
         FROM challenges c
         WHERE c.quarter_id = $1 
-        AND c.status = 'active'
+        AND c.status IN ('active', 'expired')
         AND c.end_time > CURRENT_TIMESTAMP - INTERVAL '1 day'  -- Include recent expired
         ORDER BY c.end_time ASC
         """
@@ -1240,267 +1330,127 @@ async def _fetch_detailed_challenges(quarter_id: int, user_sub: str) -> list[Pla
 
 # ===== CHALLENGE PROGRESS PROCESSING =====
 
-async def process_challenge_progress(profile, quarter_id: int, activity_type: str, conn):
+async def apply_challenge_results(conn, profile, challenges):
     """
-    Process challenge progress when an activity is logged.
-    Returns dict with challenge completion info and rewards.
-    """
-    try:
-        # Map activity types to challenge target types
-        activity_to_target_map = {
-            "book": "meetings",
-            "opp": "opportunities", 
-            "deal": "deals"
-        }
-        
-        # Get relevant active challenges for this quarter - now with progress_mode
-        challenges = await conn.fetch("""
-            SELECT id, type, title, target_value, target_type, current_progress,
-                   reward_points, reward_description, end_time, progress_mode
-            FROM challenges 
-            WHERE quarter_id = $1 AND status = 'active' AND end_time > CURRENT_TIMESTAMP
-        """, quarter_id)
-        
-        completed_challenges = []
-        updated_challenges = []
-        
-        for challenge in challenges:
-            progress_added = 0
-            should_update = False
-            
-            # Check if this activity type matches the challenge target
-            if challenge['target_type'] == 'activities':
-                # Any activity counts for 'activities' target type
-                progress_added = 1
-                should_update = True
-            else:
-                # Specific activity type mapping
-                target_type = activity_to_target_map.get(activity_type)
-                if target_type == challenge['target_type']:
-                    progress_added = 1
-                    should_update = True
-            
-            # Update challenge progress if applicable
-            if should_update and progress_added > 0:
-                if challenge['progress_mode'] == 'per_person':
-                    # Per-person challenges: track individual progress using challenge_participants
-                    await handle_per_person_challenge(
-                        conn, challenge, profile, progress_added, completed_challenges, updated_challenges
-                    )
-                else:
-                    # Team challenges: use shared current_progress field
-                    await handle_team_challenge(
-                        conn, challenge, profile, progress_added, completed_challenges, updated_challenges
-                    )
-        
-        return {
-            'updated_challenges': updated_challenges,
-            'completed_challenges': completed_challenges
-        }
-        
-    except Exception as e:
-        print(f"Error processing challenge progress: {str(e)}")
-        return {'updated_challenges': [], 'completed_challenges': []}
-
-async def handle_per_person_challenge(conn, challenge, profile, progress_added, completed_challenges, updated_challenges):
-    """
-    Handle progress for per-person challenges (speed_run, streak, hidden_gem).
-    Each player has individual progress tracked in challenge_participants.
+    Turn the challenge rows returned by LOG_ACTIVITY_SQL into progress updates and completions.
+    Team progress was already applied atomically in that statement; per-person
+    completions are claimed here with a status guard so only one finisher wins.
+    Returns dict with challenge completion info and rewards (points are added by the caller).
     """
     player_name = str(profile['name'])
-    
-    # Get or create participant record for this player
-    participant = await conn.fetchrow("""
-        SELECT id, contribution FROM challenge_participants 
-        WHERE challenge_id = $1 AND player_name = $2
-    """, challenge['id'], player_name)
-    
-    if participant:
-        # Update existing participant
-        new_contribution = participant['contribution'] + progress_added
-        await conn.execute("""
-            UPDATE challenge_participants 
-            SET contribution = $1
-            WHERE challenge_id = $2 AND player_name = $3
-        """, new_contribution, challenge['id'], player_name)
-    else:
-        # Create new participant
-        new_contribution = progress_added
-        await conn.execute("""
-            INSERT INTO challenge_participants (challenge_id, player_name, contribution)
-            VALUES ($1, $2, $3)
-        """, challenge['id'], player_name, new_contribution)
-    
-    updated_challenges.append({
-        'id': challenge['id'],
-        'title': challenge['title'],
-        'progress_added': progress_added,
-        'new_progress': new_contribution,
-        'target_value': challenge['target_value']
-    })
-    
-    # Check if THIS PLAYER has completed the challenge
-    if new_contribution >= challenge['target_value']:
-        # Mark challenge as completed BY THIS PLAYER ONLY
-        await conn.execute("""
-            UPDATE challenges 
-            SET status = 'completed', completed_by = $1, completed_at = CURRENT_TIMESTAMP
-            WHERE id = $2
-        """, player_name, challenge['id'])
-        
-        # Award reward points to THIS PLAYER ONLY
-        await conn.execute("""
-            UPDATE profiles 
-            SET points = points + $1
-            WHERE id = $2
-        """, challenge['reward_points'], profile['id'])
-        
-        completed_challenges.append({
+    completed_challenges = []
+    updated_challenges = []
+    per_person_finished = []
+
+    for challenge in challenges:
+        if challenge['per_person']:
+            new_progress = challenge['contribution']
+            if new_progress >= challenge['target_value']:
+                per_person_finished.append(challenge)
+        elif challenge['team_progress'] is None:
+            # Completed (or expired) by someone else since it was read
+            continue
+        else:
+            new_progress = challenge['team_progress']
+            if challenge['team_completed']:
+                completed_challenges.append(challenge)
+
+        updated_challenges.append({
             'id': challenge['id'],
             'title': challenge['title'],
-            'reward_points': challenge['reward_points'],
-            'reward_description': challenge['reward_description']
+            'progress_added': 1,
+            'new_progress': new_progress,
+            'target_value': challenge['target_value']
         })
-        
-        print(f"Per-person challenge completed! {player_name} completed '{challenge['title']}' and earned {challenge['reward_points']} bonus points")
 
-async def handle_team_challenge(conn, challenge, profile, progress_added, completed_challenges, updated_challenges):
-    """
-    Handle progress for team challenges (team_push, boss_fight).
-    Uses shared current_progress field - when ANY player reaches target, entire team gets credit.
-    """
-    player_name = str(profile['name'])
-    
-    # Update shared progress
-    new_progress = challenge['current_progress'] + progress_added
-    
-    await conn.execute("""
-        UPDATE challenges 
-        SET current_progress = $1, updated_at = CURRENT_TIMESTAMP
-        WHERE id = $2
-    """, new_progress, challenge['id'])
-    
-    updated_challenges.append({
-        'id': challenge['id'],
-        'title': challenge['title'],
-        'progress_added': progress_added,
-        'new_progress': new_progress,
-        'target_value': challenge['target_value']
-    })
-    
-    # Check if team challenge is completed
-    if new_progress >= challenge['target_value']:
-        # Mark challenge as completed
-        await conn.execute("""
-            UPDATE challenges 
+    if per_person_finished:
+        # Mark challenges as completed BY THIS PLAYER ONLY
+        claimed = await conn.fetch("""
+            UPDATE challenges
             SET status = 'completed', completed_by = $1, completed_at = CURRENT_TIMESTAMP
-            WHERE id = $2
-        """, player_name, challenge['id'])
-        
-        # Award reward points to the completing player
-        await conn.execute("""
-            UPDATE profiles 
-            SET points = points + $1
-            WHERE id = $2
-        """, challenge['reward_points'], profile['id'])
-        
-        completed_challenges.append({
-            'id': challenge['id'],
-            'title': challenge['title'],
-            'reward_points': challenge['reward_points'],
-            'reward_description': challenge['reward_description']
-        })
-        
-        print(f"Team challenge completed! {player_name} completed '{challenge['title']}' and earned {challenge['reward_points']} bonus points")
-    
-    # Update team challenge participants for tracking contributions
-    await update_team_challenge_participant(conn, challenge['id'], player_name, progress_added)
+            WHERE id = ANY($2::int[]) AND status = 'active'
+            RETURNING id
+        """, player_name, [c['id'] for c in per_person_finished])
+        claimed_ids = {r['id'] for r in claimed}
+        completed_challenges.extend(c for c in per_person_finished if c['id'] in claimed_ids)
 
-async def update_team_challenge_participant(conn, challenge_id: int, player_name: str, contribution: int):
-    """
-    Update or insert team challenge participant contribution.
-    """
-    try:
-        # Check if participant already exists
-        existing = await conn.fetchrow("""
-            SELECT id, contribution FROM challenge_participants 
-            WHERE challenge_id = $1 AND player_name = $2
-        """, challenge_id, player_name)
-        
-        if existing:
-            # Update existing participant
-            await conn.execute("""
-                UPDATE challenge_participants 
-                SET contribution = contribution + $1
-                WHERE challenge_id = $2 AND player_name = $3
-            """, contribution, challenge_id, player_name)
-        else:
-            # Insert new participant
-            await conn.execute("""
-                INSERT INTO challenge_participants (challenge_id, player_name, contribution)
-                VALUES ($1, $2, $3)
-            """, challenge_id, player_name, contribution)
-            
-    except Exception as e:
-        print(f"Error updating team challenge participant: {str(e)}")
+    for challenge in completed_challenges:
+        print(f"Challenge completed! {player_name} completed '{challenge['title']}' and earned {challenge['reward_points']} bonus points")
+
+    return {
+        'updated_challenges': updated_challenges,
+        'completed_challenges': [
+            {
+                'id': c['id'],
+                'title': c['title'],
+                'reward_points': c['reward_points'],
+                'reward_description': c['reward_description']
+            }
+            for c in completed_challenges
+        ]
+    }
+
+@outbox_handler("activity.logged")
+async def on_activity_logged(conn, payload):
+    """Outbox delivery for log_activity side effects"""
+    # 7. TWO-WAY LOGGING: If this is a "book" activity and not triggered by competition,
+    # automatically log in all active booking competitions
+    if payload["type"] == ActivityType.BOOK.value and payload.get("triggered_by") != "competition":
+        await trigger_competition_logging(
+            payload["player_name"], payload["total_points"], payload["activity_id"], conn
+        )
+    if payload.get("challenges_updated"):
+        # Challenge progress moved; cached summaries are stale
+        invalidate_challenges_cache()
 
-# 7. TWO-WAY LOGGING: If this is a "book" activity and not triggered by competition, 
-# automatically log in all active booking competitions
 async def trigger_competition_logging(player_name: str, total_points: int, activity_id: int, conn):
     """
     Trigger competition logging when a Books activity is logged in Activity Center.
-    Find all active booking competitions and submit Books entries to them.
+    Auto-enrolls the player and submits a Books entry (10 points) to every active
+    booking competition in a single statement, keeping competition_entry_totals in step.
+    Runs from the outbox, so errors propagate and the delivery is retried.
     """
-    try:
-        # Find all active booking competitions
-        active_competitions = await conn.fetch("""
-            SELECT id, name, is_active, start_time, end_time 
-            FROM booking_competitions 
-            WHERE is_active = true 
-            AND is_hidden = false
-            AND start_time <= NOW() 
-            AND end_time >= NOW()
-        """)
-        
-        if not active_competitions:
-            print(f"No active competitions found for player {player_name}")
-            return
-            
-        # For each active competition, try to submit a Books entry
-        for comp in active_competitions:
-            try:
-                # Check if player is enrolled in this competition
-                participant = await conn.fetchrow("""
-                    SELECT id FROM booking_competition_participants 
-                    WHERE competition_id = $1 AND player_name = $2
-                """, comp['id'], player_name)
-                
-                if not participant:
-                    # Auto-enroll player if not already enrolled
-                    try:
-                        await conn.execute("""
-                            INSERT INTO booking_competition_participants (competition_id, player_name)
-                            VALUES ($1, $2)
-                            ON CONFLICT (competition_id, player_name) DO NOTHING
-                        """, comp['id'], player_name)
-                        print(f"Auto-enrolled {player_name} in competition {comp['name']}")
-                    except Exception as e:
-                        print(f"Failed to auto-enroll {player_name} in competition {comp['name']}: {e}")
-                        continue
-                        
-                # Submit Books entry (10 points for competition)
-                await conn.execute("""
-                    INSERT INTO booking_competition_entries 
-                    (competition_id, player_name, activity_id, activity_type, points, submitted_by)
-                    VALUES ($1, $2, $3, $4, $5, $6)
-                """, comp['id'], player_name, activity_id, 'book', 10, 'activity_center_trigger')
-                
-                print(f"Successfully logged Books activity for {player_name} in competition {comp['name']} (+10 points)")
-                
-            except Exception as e:
-                print(f"Failed to log Books activity for {player_name} in competition {comp['name']}: {e}")
-                continue
-                
-    except Exception as e:
-        print(f"Error triggering competition logging: {e}")
-        # Don't raise - this is optional functionality that shouldn't break main flow
+    await ensure_entry_totals_table(conn)
+    # The entry's activity_id keeps a retried delivery from logging twice
+    entries = await conn.fetch("""
+        WITH comps AS (
+            -- Competitions running when the activity was logged, not when delivered
+            SELECT c.id FROM booking_competitions c
+            JOIN activities a ON a.id = $2
+            WHERE c.is_active = true
+            AND c.is_hidden = false
+            AND c.start_time <= a.created_at
+            AND c.end_time >= a.created_at
+            AND NOT EXISTS (
+                SELECT 1 FROM booking_competition_entries e
+                WHERE e.competition_id = c.id AND e.activity_id = $2
+            )
+        ), enrolled AS (
+            INSERT INTO booking_competition_participants (competition_id, player_name)
+            SELECT id, $1 FROM comps
+            ON CONFLICT (competition_id, player_name) DO NOTHING
+        ), ins AS (
+            INSERT INTO booking_competition_entries
+            (competition_id, player_name, activity_id, activity_type, points, submitted_by)
+            SELECT id, $1, $2, 'book', 10, 'activity_center_trigger' FROM comps
+            RETURNING competition_id, created_at
+        ), totals AS (
+            INSERT INTO competition_entry_totals
+                (competition_id, player_name, activity_type, count, points, first_at, last_at)
+            SELECT competition_id, $1, 'book', 1, 10, created_at, created_at FROM ins
+            ON CONFLICT (competition_id, player_name, activity_type) DO UPDATE
+               SET count = competition_entry_totals.count + EXCLUDED.count,
+                   points = competition_entry_totals.points + EXCLUDED.points,
+                   first_at = LEAST(competition_entry_totals.first_at, EXCLUDED.first_at),
+                   last_at = GREATEST(competition_entry_totals.last_at, EXCLUDED.last_at)
+        )
+        SELECT competition_id FROM ins
+    """, player_name, activity_id)
+
+    if not entries:
+        print(f"No active competitions found for player {player_name}")
+        return
+
+    for entry in entries:
+        note_competition_write(entry['competition_id'], player_name=player_name, points_delta=10)
+    print(f"Logged Books activity for {player_name} in {len(entries)} competition(s) (+10 points each)")
@@ -6,9 +6,13 @@ import asyncpg
 import databutton as db
 from datetime import datetime, timedelta, date
 from app.auth import AuthorizedUser
-import uuid
-from app.libs.challenges import ensure_participants_for_challenge
-from app.libs.challenges import recalc_challenge_progress
+from app.libs.roster import NAMED_PLAYERS, provision_profiles, provision_participants, provision_roster
+from app.libs.challenges import recalc_challenges
+from app.libs.scheduler import scheduler
+from app.libs.outbox import ensure_outbox_table, retry_dead_letter
+from app.libs.team_stats import note_team_stats_write
+from app.libs.pace import PACE_METRICS, backtest
+from app.libs.local_time import local_today
 
 # Force reload to clear cached statement plans after schema change
 router = APIRouter(prefix="/admin")
@@ -32,10 +36,7 @@ ADMIN_USER_IDS = [
 ]
 
 # The 12 fixed players
-FIXED_PLAYERS = [
-    "RIKKE", "SIGGEN", "GARD", "THEA", "ITHY", "EMILIE", 
-    "SCHOLZ", "HEFF", "KAREN", "TOBIAS", "ANDREAS", "SONDRE"
-]
+FIXED_PLAYERS = NAMED_PLAYERS
 
 # Models
 class IsAdminResponse(BaseModel):
@@ -116,6 +117,81 @@ async def is_admin(user: AuthorizedUser) -> IsAdminResponse:
         user_id=user_id
     )
 
+@router.get("/scheduler/jobs")
+async def get_scheduler_jobs(user: AuthorizedUser) -> list[dict]:
+    """Scheduled maintenance jobs with this worker's timing metrics"""
+    check_admin_access(user)
+    return scheduler.metrics()
+
+@router.get("/outbox/dead-letters")
+async def get_outbox_dead_letters(user: AuthorizedUser, limit: int = 100) -> list[dict]:
+    """Outbox messages that exhausted their retries"""
+    check_admin_access(user)
+    conn = await asyncpg.connect(db.secrets.get("DATABASE_URL_DEV"))
+    try:
+        await ensure_outbox_table(conn)
+        rows = await conn.fetch(
+            "SELECT * FROM outbox_dead_letters ORDER BY id DESC LIMIT $1",
+            limit,
+        )
+        return [{**dict(r), "payload": json.loads(r["payload"]) if isinstance(r["payload"], str) else r["payload"]} for r in rows]
+    finally:
+        await conn.close()
+
+@router.post("/outbox/dead-letters/{message_id}/retry")
+async def retry_outbox_dead_letter(message_id: int, user: AuthorizedUser) -> dict:
+    """Requeue a dead outbox message"""
+    check_admin_access(user)
+    conn = await asyncpg.connect(db.secrets.get("DATABASE_URL_DEV"))
+    try:
+        if not await retry_dead_letter(conn, message_id):
+            raise HTTPException(status_code=404, detail="Dead-letter message not found")
+        return {"success": True, "message_id": message_id}
+    finally:
+        await conn.close()
+
+@router.get("/pace/backtest")
+async def backtest_pace(user: AuthorizedUser, metric: str = "points", quarter_id: Optional[int] = None) -> list[dict]:
+    """Error of the linear and EWMA goal projections replayed over finished quarters"""
+    check_admin_access(user)
+    if metric not in PACE_METRICS:
+        raise HTTPException(status_code=400, detail=f"metric must be one of {', '.join(PACE_METRICS)}")
+    conn = await asyncpg.connect(db.secrets.get("DATABASE_URL_DEV"))
+    try:
+        quarters = await conn.fetch(
+            """
+            SELECT id, name, start_date, end_date FROM quarters
+            WHERE end_date < $1 AND ($2::int IS NULL OR id = $2)
+            ORDER BY start_date
+            """,
+            local_today(), quarter_id,
+        )
+        rows = await conn.fetch(
+            """
+            SELECT quarter_id, profile_id, local_date,
+                   CASE WHEN $2 = 'points' THEN COALESCE(SUM(points), 0) ELSE COUNT(*) END::float8 AS value
+            FROM activities
+            WHERE quarter_id = ANY($1::int[]) AND ($2 = 'points' OR type::text = $2)
+            GROUP BY quarter_id, profile_id, local_date
+            """,
+            [q['id'] for q in quarters], metric,
+        )
+        series = {}
+        for r in rows:
+            series.setdefault(r['quarter_id'], {}).setdefault(r['profile_id'], []).append((r['local_date'], r['value']))
+        return [
+            {
+                "quarter_id": q['id'],
+                "quarter_name": q['name'],
+                "metric": metric,
+                "players": len(series.get(q['id'], {})),
+                **backtest(series.get(q['id'], {}), q['start_date'], q['end_date']),
+            }
+            for q in quarters
+        ]
+    finally:
+        await conn.close()
+
 @router.get("/quarters")
 async def get_quarters(user: AuthorizedUser) -> List[QuarterResponse]:
     """Get all quarters for admin management"""
@@ -165,6 +241,10 @@ async def create_quarter(request: CreateQuarterRequest, user: AuthorizedUser) ->
             VALUES ($1, $2, $3)
             RETURNING id, name, start_date, end_date, created_at
         """, request.name, request.start_date, request.end_date)
+
+        # New quarter: give every named player a profile in it
+        await provision_roster(conn, [row['id']])
+        note_team_stats_write()
         
         return QuarterResponse(
             id=row['id'],
@@ -317,25 +397,6 @@ def calculate_goal_points(books: int, opps: int, deals: int) -> int:
     """Calculate goal points: books=1pt, opps=2pts, deals=5pts"""
     return books * 1 + opps * 2 + deals * 5
 
-# Helper function to ensure all player profiles exist for a quarter
-async def ensure_player_profiles(quarter_id: int, conn):
-    """Ensure all 12 fixed players have profiles for the given quarter"""
-    for player_name in FIXED_PLAYERS:
-        # Generate a consistent UUID for the player 
-        player_uuid = str(uuid.uuid5(uuid.NAMESPACE_DNS, f"player.{player_name.lower()}"))
-        
-        # Check if profile already exists
-        existing = await conn.fetchval(
-            "SELECT id FROM profiles WHERE name = $1 AND quarter_id = $2",
-            player_name, quarter_id
-        )
-        
-        if not existing:
-            await conn.execute("""
-                INSERT INTO profiles (user_id, quarter_id, name, points, goal_books, goal_opps, goal_deals)
-                VALUES ($1, $2, $3, 0, 0, 0, 0)
-            """, player_uuid, quarter_id, player_name)
-
 @router.get("/players/{quarter_id}")
 async def get_player_goals(quarter_id: int, user: AuthorizedUser) -> List[PlayerGoalResponse]:
     """Get all player goals for a specific quarter"""
@@ -343,9 +404,6 @@ async def get_player_goals(quarter_id: int, user: AuthorizedUser) -> List[Player
     
     conn = await asyncpg.connect(db.secrets.get("DATABASE_URL_DEV"))
     try:
-        # Ensure all player profiles exist
-        await ensure_player_profiles(quarter_id, conn)
-        
         # Get quarter name
         quarter_name = await conn.fetchval(
             "SELECT name FROM quarters WHERE id = $1", quarter_id
@@ -419,7 +477,7 @@ async def update_player_goals(request: UpdatePlayerGoalsRequest, user: Authorize
     conn = await asyncpg.connect(db.secrets.get("DATABASE_URL_DEV"))
     try:
         # Ensure player profile exists
-        await ensure_player_profiles(request.quarter_id, conn)
+        await provision_profiles(conn, [request.quarter_id], [request.player_name])
         
         # Get quarter name
         quarter_name = await conn.fetchval(
@@ -439,6 +497,7 @@ async def update_player_goals(request: UpdatePlayerGoalsRequest, user: Authorize
             WHERE name = $4 AND quarter_id = $5
         """, request.goal_books, request.goal_opps, request.goal_deals, 
              request.player_name, request.quarter_id)
+        note_team_stats_write(request.quarter_id)
         
         # Get current activity counts
         current_stats = await conn.fetchrow("""
@@ -547,6 +606,10 @@ async def update_quarter_status(request: UpdateQuarterStatusRequest, user: Autho
         
         if not row:
             raise HTTPException(status_code=404, detail="Quarter not found")
+
+        if row['is_active']:
+            await provision_roster(conn, [row['id']])
+        note_team_stats_write()
         
         return QuarterResponse(
             id=row['id'],
@@ -991,24 +1054,32 @@ async def get_active_challenges(quarter_id: int | None = None, user: AuthorizedU
         """
         
         rows = await conn.fetch(query, *params)
+
+        # Participants for per-person and team challenges, loaded in one query
+        # (per-person participants are provisioned when the challenge is created)
+        with_participants = [
+            row['id'] for row in rows
+            if row['progress_mode'] == 'per_person' or row['type'] in ['team_push', 'boss_fight']
+        ]
+        participants_by_challenge: dict[int, list[dict]] = {cid: [] for cid in with_participants}
+        if with_participants:
+            participant_rows = await conn.fetch(
+                """
+                SELECT challenge_id, player_name, contribution
+                FROM challenge_participants
+                WHERE challenge_id = ANY($1::int[])
+                ORDER BY challenge_id, player_name
+                """,
+                with_participants
+            )
+            for p in participant_rows:
+                participants_by_challenge[p['challenge_id']].append(
+                    {'player_name': p['player_name'], 'contribution': p['contribution']}
+                )
         
         challenges = []
         for row in rows:
-            # For per_person challenges ensure participants exist and include them
-            participants = None
-            if row['progress_mode'] == 'per_person':
-                await ensure_participants_for_challenge(conn, row['id'], row['quarter_id'])
-                participant_rows = await conn.fetch(
-                    "SELECT player_name, contribution FROM challenge_participants WHERE challenge_id = $1 ORDER BY player_name",
-                    row['id']
-                )
-                participants = [{'player_name': p['player_name'], 'contribution': p['contribution']} for p in participant_rows]
-            elif row['type'] in ['team_push', 'boss_fight']:
-                participant_rows = await conn.fetch(
-                    "SELECT player_name, contribution FROM challenge_participants WHERE challenge_id = $1",
-                    row['id']
-                )
-                participants = [{'player_name': p['player_name'], 'contribution': p['contribution']} for p in participant_rows]
+            participants = participants_by_challenge.get(row['id'])
             
             challenges.append(ChallengeResponse(
                 id=row['id'],
@@ -1072,6 +1143,7 @@ async def create_challenge(challenge: CreateChallengeRequest, user: AuthorizedUs
         challenge.quarter_id,
         end_time
         )
+        await provision_participants(conn, challenge_ids=[row['id']])
         
         # Create response manually
         return ChallengeResponse(
@@ -1121,6 +1193,42 @@ async def recalculate_challenge_progress(challenge_id: int, user: AuthorizedUser
     finally:
         await conn.close()
 
+@router.post("/challenges/quarter/{quarter_id}/recalculate")
+async def recalculate_quarter_challenges(quarter_id: int, user: AuthorizedUser, dry_run: bool = True):
+    """Admin tool: Recalculate every challenge in a quarter from activities.
+
+    Defaults to a dry run that only reports the per-challenge and per-player
+    differences; pass dry_run=false to write them.
+    """
+    check_admin_access(user)
+    conn = await asyncpg.connect(db.secrets.get("DATABASE_URL_DEV"))
+    try:
+        result = await recalc_challenges(conn, quarter_id=quarter_id, dry_run=dry_run)
+        changed = {
+            cid: diff for cid, diff in result.items()
+            if diff["player_diffs"]
+            or diff["before_progress"] != diff["after_progress"]
+            or diff["before_status"] != diff["after_status"]
+        }
+        if not dry_run:
+            from app.apis.activities import invalidate_challenges_cache
+            invalidate_challenges_cache()
+            await conn.execute(
+                "INSERT INTO admin_audit_log (action, details, user_id) VALUES ($1, $2, $3)",
+                "recalculate_quarter_challenges",
+                json.dumps({"quarter_id": quarter_id, "changed_challenge_ids": list(changed)}),
+                user.sub,
+            )
+        return {
+            "success": True,
+            "dry_run": dry_run,
+            "quarter_id": quarter_id,
+            "challenges_checked": len(result),
+            "changes": changed,
+        }
+    finally:
+        await conn.close()
+
 # ===== CHALLENGE GENERATION EndPOINT =====
 
 # Challenge Generation Algorithm
@@ -1367,6 +1475,7 @@ async def create_challenge_from_template(conn, template, quarter_id, team_perfor
         target_value, template["target_type"], 0, start_time, end_time,
         reward_points, f"Auto-generated challenge reward: {reward_points} points"
     )
+    await provision_participants(conn, challenge_ids=[challenge_id])
     
     return {
         "id": challenge_id,
@@ -1565,6 +1674,7 @@ async def revoke_challenge_completion(challenge_id: int, user: AuthorizedUser):
                 INSERT INTO activities (profile_id, quarter_id, type, points, created_at)
                 VALUES ($1, $2, 'book', $3, CURRENT_TIMESTAMP)
             """, player_profile['id'], challenge['quarter_id'], -challenge['reward_points'])
+            note_team_stats_write(challenge['quarter_id'])
             
             print(f"Admin {user.sub} revoked challenge {challenge['title']} completion from {challenge['completed_by']}, removed {challenge['reward_points']} points")
             
@@ -1815,6 +1925,7 @@ async def delete_activity_admin(
                 "UPDATE profiles SET points = points - $1 WHERE id = $2",
                 activity['points'], activity['profile_id']
             )
+            note_team_stats_write(activity['quarter_id'])
             
             return {
                 "message": f"Deleted {activity['type']} activity. Removed {activity['points']} points from {activity['player_name']}",
@@ -1983,6 +2094,7 @@ class BackfillApplyRequest(BaseModel):
     challenge_ids: list[int]
     restrict_players: dict[int, list[str]] | None = None
     recalc: bool = True
+    dry_run: bool = False
 
 class BackfillApplyResultItem(BaseModel):
     challenge_id: int
@@ -1997,64 +2109,90 @@ class BackfillApplyResponse(BaseModel):
     success: bool
     applied: list[BackfillApplyResultItem]
     audit_id: int | None = None
+    dry_run: bool = False
 
 @router.post("/backfill/per-person/apply")
 async def apply_backfill_per_person(request: BackfillApplyRequest, user: AuthorizedUser) -> BackfillApplyResponse:
-    """Admin: Insert missing per-person participants for selected challenges and optionally recalc from activities."""
+    """Admin: Insert missing per-person participants for selected challenges and optionally recalc from activities.
+
+    All selected challenges are handled together: one query finds missing
+    players, one insert adds them and recalculation is a single set-based pass.
+    With dry_run nothing is written and the response shows what would change.
+    """
     check_admin_access(user)
     # get_db_connection() returns a connection, not an async context manager
     conn = await get_db_connection()
     try:
+        rows = await conn.fetch(
+            """
+            SELECT c.id, c.title, c.quarter_id, c.type, c.progress_mode, c.current_progress,
+                   COALESCE(array_agg(p.name ORDER BY p.name) FILTER (WHERE p.name IS NOT NULL AND cp.player_name IS NULL), '{}') AS missing
+            FROM challenges c
+            LEFT JOIN profiles p ON p.quarter_id = c.quarter_id
+            LEFT JOIN challenge_participants cp ON cp.challenge_id = c.id AND cp.player_name = p.name
+            WHERE c.id = ANY($1::int[])
+            GROUP BY c.id
+            """,
+            request.challenge_ids,
+        )
+        challenges_by_id = {r["id"]: r for r in rows}
+
+        per_person_ids: list[int] = []
+        added_by_id: dict[int, list[str]] = {}
+        for ch in challenges_by_id.values():
+            if ch["progress_mode"] not in ("per_person", None, ""):
+                continue
+            per_person_ids.append(ch["id"])
+            missing = list(ch["missing"])
+            if request.restrict_players and ch["id"] in request.restrict_players:
+                allowed = set(request.restrict_players[ch["id"]])
+                missing = [p for p in missing if p in allowed]
+            added_by_id[ch["id"]] = missing
+
+        async with conn.transaction():
+            if not request.dry_run:
+                ids, names = [], []
+                for challenge_id, added in added_by_id.items():
+                    ids.extend([challenge_id] * len(added))
+                    names.extend(added)
+                if ids:
+                    await conn.execute(
+                        """
+                        INSERT INTO challenge_participants (challenge_id, player_name, contribution)
+                        SELECT challenge_id, player_name, 0
+                        FROM unnest($1::int[], $2::text[]) AS t(challenge_id, player_name)
+                        ON CONFLICT (challenge_id, player_name) DO NOTHING
+                        """,
+                        ids, names,
+                    )
+
+            recalculated: dict[int, dict] = {}
+            if request.recalc and per_person_ids:
+                recalculated = await recalc_challenges(conn, challenge_ids=per_person_ids, dry_run=request.dry_run)
+
         applied: list[BackfillApplyResultItem] = []
-        audit_payload = {"changes": []}
+        audit_payload = {"dry_run": request.dry_run, "changes": []}
         for challenge_id in request.challenge_ids:
-            ch = await conn.fetchrow("SELECT id, title, quarter_id, type, progress_mode, current_progress FROM challenges WHERE id = $1", challenge_id)
+            ch = challenges_by_id.get(challenge_id)
             if not ch:
                 continue
-            warnings: list[str] = []
-            if ch["progress_mode"] not in ("per_person", None, "") and ch["progress_mode"] != "per_person":
-                warnings.append("Challenge progress_mode is team_total; skipping participant backfill")
+            before_progress = ch["current_progress"] or 0
+            if challenge_id not in added_by_id:
                 applied.append(BackfillApplyResultItem(
                     challenge_id=ch["id"],
                     title=ch["title"],
                     added_players=[],
-                    before_progress=ch["current_progress"] or 0,
-                    after_progress=ch["current_progress"] or 0,
+                    before_progress=before_progress,
+                    after_progress=before_progress,
                     player_diffs={},
-                    warnings=warnings,
+                    warnings=["Challenge progress_mode is team_total; skipping participant backfill"],
                 ))
                 continue
 
-            before_participants = await conn.fetch("SELECT player_name, contribution FROM challenge_participants WHERE challenge_id = $1", ch["id"])
-            before_progress = ch["current_progress"] or 0
-            before_map = {r["player_name"]: r["contribution"] for r in before_participants}
-
-            all_players, existing, missing = await _get_challenge_missing_players(conn, ch)
-            if request.restrict_players and ch["id"] in request.restrict_players:
-                allowed = set(request.restrict_players[ch["id"]])
-                missing = [p for p in missing if p in allowed]
-
-            added = []
-            for name in missing:
-                await conn.execute(
-                    "INSERT INTO challenge_participants (challenge_id, player_name, contribution) VALUES ($1, $2, 0) ON CONFLICT (challenge_id, player_name) DO NOTHING",
-                    ch["id"], name,
-                )
-                added.append(name)
-
-            after_progress = before_progress
-            player_diffs: dict[str, dict] = {}
-            if request.recalc:
-                await recalc_challenge_progress(conn, ch["id"])
-                after_participants = await conn.fetch("SELECT player_name, contribution FROM challenge_participants WHERE challenge_id = $1", ch["id"])
-                after_map = {r["player_name"]: r["contribution"] for r in after_participants}
-                for player in sorted(set(list(before_map.keys()) + list(after_map.keys()))):
-                    before_val = before_map.get(player, 0)
-                    after_val = after_map.get(player, 0)
-                    if before_val != after_val:
-                        player_diffs[player] = {"before": before_val, "after": after_val}
-                refreshed = await conn.fetchrow("SELECT current_progress FROM challenges WHERE id = $1", ch["id"])
-                after_progress = refreshed["current_progress"] if refreshed else after_progress
+            added = added_by_id[challenge_id]
+            diff = recalculated.get(challenge_id)
+            after_progress = diff["after_progress"] if diff else before_progress
+            player_diffs = dict(sorted(diff["player_diffs"].items())) if diff else {}
 
             applied.append(BackfillApplyResultItem(
                 challenge_id=ch["id"],
@@ -2063,7 +2201,6 @@ async def apply_backfill_per_person(request: BackfillApplyRequest, user: Authori
                 before_progress=before_progress,
                 after_progress=after_progress,
                 player_diffs=player_diffs,
-                warnings=warnings,
             ))
 
             audit_payload["changes"].append({
@@ -2074,16 +2211,17 @@ async def apply_backfill_per_person(request: BackfillApplyRequest, user: Authori
                 "after_progress": after_progress,
             })
 
-        from app.apis.activities import invalidate_challenges_cache
-        invalidate_challenges_cache()
+        if not request.dry_run:
+            from app.apis.activities import invalidate_challenges_cache
+            invalidate_challenges_cache()
 
         audit_id = await conn.fetchval(
             "INSERT INTO admin_audit_log (action, details, user_id) VALUES ($1, $2, $3) RETURNING id",
-            "backfill_per_person_apply",
+            "backfill_per_person_dry_run" if request.dry_run else "backfill_per_person_apply",
             json.dumps(audit_payload),
             user.sub,
         )
 
-        return BackfillApplyResponse(success=True, applied=applied, audit_id=audit_id)
+        return BackfillApplyResponse(success=True, applied=applied, audit_id=audit_id, dry_run=request.dry_run)
     finally:
         await conn.close()
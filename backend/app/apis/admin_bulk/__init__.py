@@ -5,6 +5,7 @@ from pydantic import BaseModel
 from typing import List
 from app.auth import AuthorizedUser
 from app.apis.booking_competition import get_conn, check_admin
+from app.libs.leaderboard_service import note_competition_write
 
 router = APIRouter()
 
@@ -55,6 +56,7 @@ async def bulk_enroll_players(body: BulkEnrollRequest, user: AuthorizedUser):
                 print(f"❌ Failed to enroll {player_name}: {e}")
                 failed_players.append(player_name)
         
+        note_competition_write(body.competition_id)
         print(f"🎉 Bulk enrollment complete: {len(success_players)} success, {len(failed_players)} failed")
         
         return BulkEnrollResponse(
@@ -13,6 +13,8 @@ from uuid import UUID
 import databutton as db
 
 from app.auth import AuthorizedUser
+from app.libs.roster import provision_profiles
+from app.libs.team_stats import note_team_stats_write
 from app.libs.models_competition import (
     CompetitionCreate,
     CompetitionUpdate,
@@ -68,6 +70,9 @@ from app.libs.models_competition_v2 import (
 
 # Import scoring engine
 from app.libs.scoring_engine import ScoringEngine
+from app.libs.leaderboard_service import leaderboard_service, note_competition_write, team_totals
+from app.libs.competition_totals import record_entries, refresh_player_totals, fetch_player_totals
+from app.libs.outbox import enqueue, outbox_handler
 
 router = APIRouter(prefix="/booking-competition")
 
@@ -97,29 +102,6 @@ async def get_active_quarter_id(conn) -> Optional[int]:
     )
     return row["id"] if row else None
 
-# Helper: ensure profiles exist for a set of player_names in the active quarter
-async def ensure_profiles(conn, quarter_id: int, player_names: List[str]):
-    # Create profile with zero goals if missing
-    for player_name in player_names:
-        exists = await conn.fetchval(
-            "SELECT 1 FROM profiles WHERE name = $1 AND quarter_id = $2",
-            player_name,
-            quarter_id,
-        )
-        if not exists:
-            # deterministic user_id for player profiles
-            import uuid
-            player_uuid = str(uuid.uuid5(uuid.NAMESPACE_DNS, f"player.{player_name.lower()}"))
-            await conn.execute(
-                """
-                INSERT INTO profiles (user_id, quarter_id, name, points, goal_books, goal_opps, goal_deals)
-                VALUES ($1, $2, $3, 0, 0, 0, 0)
-                """,
-                player_uuid,
-                quarter_id,
-                player_name,
-            )
-
 # Helper: compute winners list based on tiebreaker
 async def compute_winners(conn, competition_id: int) -> List[str]:
     comp = await conn.fetchrow(
@@ -129,36 +111,41 @@ async def compute_winners(conn, competition_id: int) -> List[str]:
     if not comp:
         raise HTTPException(status_code=404, detail="Competition not found")
 
-    rows = await conn.fetch(
-        """
-        SELECT player_name,
-               COALESCE(SUM(points),0) as total_points,
-               COUNT(*) as entries,
-               MAX(created_at) as last_entry_at,
-               MIN(created_at) as first_entry_at
-          FROM booking_competition_entries
-         WHERE competition_id = $1
-         GROUP BY player_name
-        """,
-        competition_id,
-    )
+    rows = await fetch_player_totals(conn, competition_id)
     if not rows:
         return []
 
     # Determine winners by strategy
     tiebreaker = comp["tiebreaker"]
     if tiebreaker == "first_to":
-        # First to reach highest total_points (earliest time when reaching that total)
-        # Compute totals and earliest timestamp achieving max
-        totals = {r["player_name"]: int(r["total_points"] or 0) for r in rows}
-        max_total = max(totals.values()) if totals else 0
-        # Consider only players that have max_total
-        candidates = [r for r in rows if int(r["total_points"] or 0) == max_total]
-        if not candidates:
+        # First to reach the highest final total: replay each top scorer's entries in order
+        # and take the moment their running total first hit that total
+        reached = await conn.fetch(
+            """
+            WITH running AS (
+                SELECT player_name,
+                       created_at,
+                       SUM(points) OVER (PARTITION BY player_name ORDER BY created_at, id) AS running_total,
+                       SUM(points) OVER (PARTITION BY player_name) AS final_total
+                  FROM booking_competition_entries
+                 WHERE competition_id = $1
+            ),
+            top AS (
+                SELECT MAX(final_total) AS max_total FROM running
+            )
+            SELECT r.player_name, MIN(r.created_at) AS reached_at
+              FROM running r, top
+             WHERE r.final_total = top.max_total
+               AND r.running_total >= top.max_total
+             GROUP BY r.player_name
+             ORDER BY reached_at ASC
+            """,
+            competition_id,
+        )
+        if not reached:
             return []
-        # Earliest time among their last_entry_at is a proxy; if more precision needed, we could reconstruct
-        winner = min(candidates, key=lambda r: r["last_entry_at"] or comp["start_time"])  # earliest last entry
-        return [winner["player_name"]]
+        first_at = reached[0]["reached_at"]
+        return [r["player_name"] for r in reached if r["reached_at"] == first_at]
     elif tiebreaker == "fastest_pace":
         # Most points per hour from start to last_entry_at
         winners: List[str] = []
@@ -292,14 +279,17 @@ async def quick_log_activity(body: QuickLogRequest, user: AuthorizedUser):
         if not comp:
             raise HTTPException(status_code=404, detail="Competition not found")
             
-        row = await conn.fetchrow(
-            """
-            INSERT INTO booking_competition_entries (competition_id, player_name, activity_type, points, submitted_by)
-            VALUES ($1, $2, $3, $4, $5)
-            RETURNING id, competition_id, player_name, activity_id, activity_type, points, created_at
-            """,
-            body.competition_id, body.player_name, body.activity_type.value, points, user.sub
-        )
+        async with conn.transaction():
+            row = await conn.fetchrow(
+                """
+                INSERT INTO booking_competition_entries (competition_id, player_name, activity_type, points, submitted_by)
+                VALUES ($1, $2, $3, $4, $5)
+                RETURNING id, competition_id, player_name, activity_id, activity_type, points, created_at
+                """,
+                body.competition_id, body.player_name, body.activity_type.value, points, user.sub
+            )
+            await record_entries(conn, body.competition_id, body.player_name, body.activity_type.value, points, row["created_at"])
+        note_competition_write(body.competition_id, player_name=body.player_name, points_delta=points)
         return EntryResponse(**dict(row))
     finally:
         await conn.close()
@@ -329,19 +319,25 @@ async def bulk_log_activities(body: BulkEntryRequest, user: AuthorizedUser):
         if not participant:
             raise HTTPException(status_code=400, detail="Player is not enrolled in this competition")
             
-        # Bulk insert entries
-        entries = []
-        for i in range(body.count):
-            row = await conn.fetchrow(
+        # Bulk insert entries in one statement and fold them into the totals
+        async with conn.transaction():
+            rows = await conn.fetch(
                 """
                 INSERT INTO booking_competition_entries (competition_id, player_name, activity_type, points, submitted_by)
-                VALUES ($1, $2, $3, $4, $5)
+                SELECT $1, $2, $3, $4, $5 FROM generate_series(1, $6)
                 RETURNING id, competition_id, player_name, activity_id, activity_type, points, created_at
                 """,
-                body.competition_id, body.player_name, body.activity_type.value, points, user.sub
+                body.competition_id, body.player_name, body.activity_type.value, points, user.sub, body.count
             )
-            entries.append(EntryResponse(**dict(row)))
+            if rows:
+                await record_entries(
+                    conn, body.competition_id, body.player_name, body.activity_type.value,
+                    points * len(rows), min(r["created_at"] for r in rows),
+                    count=len(rows), last_at=max(r["created_at"] for r in rows),
+                )
+        entries = [EntryResponse(**dict(row)) for row in rows]
             
+        note_competition_write(body.competition_id, player_name=body.player_name, points_delta=points * len(rows))
         return {"entries": entries, "total_logged": len(entries)}
     finally:
         await conn.close()
@@ -374,17 +370,20 @@ async def update_entry(body: UpdateEntryRequest, user: AuthorizedUser):
             
         values.append(body.entry_id)
         
-        row = await conn.fetchrow(
-            f"""
-            UPDATE booking_competition_entries
-               SET {', '.join(fields)}
-             WHERE id = ${idx}
-         RETURNING id, competition_id, player_name, activity_id, activity_type, points, created_at
-            """,
-            *values,
-        )
-        if not row:
-            raise HTTPException(status_code=404, detail="Entry not found")
+        async with conn.transaction():
+            row = await conn.fetchrow(
+                f"""
+                UPDATE booking_competition_entries
+                   SET {', '.join(fields)}
+                 WHERE id = ${idx}
+             RETURNING id, competition_id, player_name, activity_id, activity_type, points, created_at
+                """,
+                *values,
+            )
+            if not row:
+                raise HTTPException(status_code=404, detail="Entry not found")
+            await refresh_player_totals(conn, row["competition_id"], row["player_name"])
+        note_competition_write(row["competition_id"])
         return EntryResponse(**dict(row))
     finally:
         await conn.close()
@@ -406,10 +405,13 @@ async def delete_entry(body: DeleteEntryRequest, user: AuthorizedUser):
             raise HTTPException(status_code=404, detail="Entry not found")
             
         # Delete the entry
-        await conn.execute(
-            "DELETE FROM booking_competition_entries WHERE id = $1",
-            body.entry_id
-        )
+        async with conn.transaction():
+            await conn.execute(
+                "DELETE FROM booking_competition_entries WHERE id = $1",
+                body.entry_id
+            )
+            await refresh_player_totals(conn, entry["competition_id"], entry["player_name"])
+        note_competition_write(entry["competition_id"])
         
         # Log admin action
         await conn.execute(
@@ -518,6 +520,7 @@ async def enroll_participant(body: EnrollParticipantRequest, user: AuthorizedUse
             body.competition_id,
             body.player_name,
         )
+        note_competition_write(body.competition_id)
         return ParticipantResponse(**dict(row))
     finally:
         await conn.close()
@@ -553,25 +556,32 @@ async def submit_entry(body: SubmitEntryRequest, user: AuthorizedUser) -> EntryR
         if not comp["is_active"] or now < comp["start_time"].astimezone(timezone.utc) or now > comp["end_time"].astimezone(timezone.utc):
             raise HTTPException(status_code=400, detail="Competition is not active right now")
 
-        row = await conn.fetchrow(
-            """
-            INSERT INTO booking_competition_entries (competition_id, player_name, activity_id, activity_type, points, submitted_by)
-            VALUES ($1, $2, $3, $4, $5, $6)
-            RETURNING id, competition_id, player_name, activity_id, activity_type, points, created_at
-            """,
-            body.competition_id,
-            body.player_name,
-            body.activity_id,
-            body.activity_type.value,
-            body.points,
-            None,  # submitted_by can be added via mapping if needed
-        )
-        
-        # TWO-WAY LOGGING: If this is a Books activity and not triggered by activity center,
-        # automatically log in Activity Center with 1 point
-        if (body.activity_type == BookingActivityType.BOOK and 
-            body.triggered_by != "activity_center"):
-            await trigger_activity_center_logging(body.player_name, user.sub, conn)
+        async with conn.transaction():
+            row = await conn.fetchrow(
+                """
+                INSERT INTO booking_competition_entries (competition_id, player_name, activity_id, activity_type, points, submitted_by)
+                VALUES ($1, $2, $3, $4, $5, $6)
+                RETURNING id, competition_id, player_name, activity_id, activity_type, points, created_at
+                """,
+                body.competition_id,
+                body.player_name,
+                body.activity_id,
+                body.activity_type.value,
+                body.points,
+                None,  # submitted_by can be added via mapping if needed
+            )
+            await record_entries(conn, body.competition_id, body.player_name, body.activity_type.value, body.points, row["created_at"])
+            # TWO-WAY LOGGING: If this is a Books activity and not triggered by activity center,
+            # the outbox dispatcher logs it in Activity Center with 1 point
+            if (body.activity_type == BookingActivityType.BOOK and 
+                body.triggered_by != "activity_center"):
+                await enqueue(conn, "competition.entry_logged", {
+                    "entry_id": row["id"],
+                    "competition_id": body.competition_id,
+                    "player_name": body.player_name,
+                    "user_sub": user.sub,
+                })
+        note_competition_write(body.competition_id, player_name=body.player_name, points_delta=body.points)
         
         return EntryResponse(**dict(row))
     finally:
@@ -583,57 +593,18 @@ async def submit_entry(body: SubmitEntryRequest, user: AuthorizedUser) -> EntryR
 async def leaderboard(competition_id: int):
     conn = await get_conn()
     try:
-        # First check if this competition has V2 events (newer system)
-        v2_events = await conn.fetchval(
-            "SELECT COUNT(*) FROM booking_competition_events WHERE competition_id = $1",
-            competition_id
-        )
-        
-        if v2_events > 0:
-            # Use V2 events table for scoring (same as MCP)
-            rows = await conn.fetch(
-                """
-                SELECT 
-                    e.player_name,
-                    COALESCE(SUM(e.points),0) as total_points,
-                    COUNT(*) as entries,
-                    MAX(e.created_at) as last_entry_at,
-                    p.team_name
-                FROM booking_competition_events e
-                LEFT JOIN booking_competition_participants p ON e.competition_id = p.competition_id AND e.player_name = p.player_name
-                WHERE e.competition_id = $1
-                GROUP BY e.player_name, p.team_name
-                ORDER BY total_points DESC, last_entry_at ASC
-                """,
-                competition_id,
-            )
-        else:
-            # Fallback to V1 entries table
-            rows = await conn.fetch(
-                """
-                SELECT 
-                    e.player_name,
-                    COALESCE(SUM(e.points),0) as total_points,
-                    COUNT(*) as entries,
-                    MAX(e.created_at) as last_entry_at,
-                    p.team_name
-                FROM booking_competition_entries e
-                LEFT JOIN booking_competition_participants p ON e.competition_id = p.competition_id AND e.player_name = p.player_name
-                WHERE e.competition_id = $1
-                GROUP BY e.player_name, p.team_name
-                ORDER BY total_points DESC, last_entry_at ASC
-                """,
-                competition_id,
-            )
+        standings = await leaderboard_service.get_standings(conn, competition_id)
         out: List[LeaderboardRow] = []
-        for r in rows:
+        for s in standings:
+            if s["entries"] == 0:
+                continue
             out.append(
                 LeaderboardRow(
-                    player_name=r["player_name"],
-                    total_points=int(r["total_points"] or 0),
-                    entries=int(r["entries"] or 0),
-                    last_entry_at=r["last_entry_at"],
-                    team_name=r["team_name"]
+                    player_name=s["player_name"],
+                    total_points=s["total_points"],
+                    entries=s["entries"],
+                    last_entry_at=s["last_entry_at"],
+                    team_name=s["team_name"]
                 )
             )
         return LeaderboardResponse(competition_id=competition_id, rows=out)
@@ -647,64 +618,27 @@ async def leaderboard_detailed(competition_id: int, user: AuthorizedUser):
     check_admin(user)
     conn = await get_conn()
     try:
-        # Get overall player stats
-        rows = await conn.fetch(
-            """
-            SELECT 
-                player_name,
-                COALESCE(SUM(points),0) as total_points,
-                COUNT(*) as entries,
-                MAX(created_at) as last_entry_at
-            FROM booking_competition_entries
-            WHERE competition_id = $1
-            GROUP BY player_name
-            ORDER BY total_points DESC, last_entry_at ASC
-            """,
-            competition_id,
-        )
-        
-        # Get activity type breakdown for each player
-        breakdown_rows = await conn.fetch(
-            """
-            SELECT 
-                player_name,
-                activity_type,
-                COUNT(*) as count,
-                COALESCE(SUM(points),0) as total_points
-            FROM booking_competition_entries
-            WHERE competition_id = $1
-            GROUP BY player_name, activity_type
-            ORDER BY player_name, activity_type
-            """,
-            competition_id,
-        )
-        
-        # Build breakdown dict
-        breakdown_by_player = {}
-        for br in breakdown_rows:
-            player = br["player_name"]
-            if player not in breakdown_by_player:
-                breakdown_by_player[player] = []
-            breakdown_by_player[player].append(
+        standings = await leaderboard_service.get_standings(conn, competition_id)
+        out: List[LeaderboardRowWithBreakdown] = []
+        for s in standings:
+            if s["entries"] == 0:
+                continue
+            breakdown = [
                 ActivityTypeBreakdown(
-                    activity_type=BookingActivityType(br["activity_type"]),
-                    count=int(br["count"]),
-                    total_points=int(br["total_points"])
+                    activity_type=BookingActivityType(activity_type),
+                    count=b["count"],
+                    total_points=b["total_points"]
                 )
-            )
-        
-        # Combine data
-        out: List[LeaderboardRowWithBreakdown] = []
-        for r in rows:
-            player_name = r["player_name"]
-            breakdown = breakdown_by_player.get(player_name, [])
+                for activity_type, b in sorted(s["breakdown"].items())
+            ]
             out.append(
                 LeaderboardRowWithBreakdown(
-                    player_name=player_name,
-                    total_points=int(r["total_points"] or 0),
-                    entries=int(r["entries"] or 0),
-                    last_entry_at=r["last_entry_at"],
-                    breakdown=breakdown
+                    player_name=s["player_name"],
+                    total_points=s["total_points"],
+                    entries=s["entries"],
+                    last_entry_at=s["last_entry_at"],
+                    breakdown=breakdown,
+                    team_name=s["team_name"]
                 )
             )
         return EnhancedLeaderboardResponse(competition_id=competition_id, rows=out)
@@ -725,70 +659,71 @@ async def finalize_competition(body: FinalizeCompetitionRequest, user: Authorize
         if not quarter_id:
             raise HTTPException(status_code=400, detail="No active quarter found to award bonuses")
         # Ensure profiles exist for winners
-        await ensure_profiles(conn, quarter_id, winners)
+        await provision_profiles(conn, [quarter_id], winners)
 
-        # Award a one-time Bonus Challenge per winner if not already awarded
-        # Idempotency via generation_trigger including competition id and player name
-        for player in winners:
-            existing = await conn.fetchrow(
+        # Award a one-time Bonus Challenge per winner if not already awarded.
+        # Idempotency via generation_trigger including competition id and player name.
+        # Fixed 10 pts bonus per winner; all winners are written in one transaction.
+        reward_points = 10
+        triggers = {player: f"booking_competition:{body.competition_id}:{player}" for player in winners}
+        async with conn.transaction():
+            already_awarded = await conn.fetch(
                 """
-                SELECT id FROM challenges
+                SELECT completed_by FROM challenges
                  WHERE quarter_id = $1
                    AND status = 'completed'
                    AND type = 'bonus'
-                   AND generation_trigger = $2
-                   AND completed_by = $3
-                """,
-                quarter_id,
-                f"booking_competition:{body.competition_id}:{player}",
-                player,
-            )
-            if existing:
-                continue
-            # Determine reward points policy: fixed 10 pts bonus per winner
-            reward_points = 10
-            # Insert completed challenge (visible false by default via admin toggle later if needed)
-            challenge_row = await conn.fetchrow(
-                """
-                INSERT INTO challenges (
-                    quarter_id, title, description, type, icon, target_value, target_type,
-                    current_progress, start_time, end_time, reward_points, reward_description,
-                    status, completed_by, completed_at, auto_generated, generation_trigger, is_visible
-                ) VALUES (
-                    $1, $2, $3, 'bonus', '🏆', 1, 'count', 1, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP,
-                    $4, $5, 'completed', $6, CURRENT_TIMESTAMP, TRUE, $7, FALSE
-                ) RETURNING id
-                """,
-                quarter_id,
-                "Competition Winner Bonus",
-                f"Awarded for winning Booking Competition #{body.competition_id}",
-                reward_points,
-                f"Winner bonus: +{reward_points} pts",
-                player,
-                f"booking_competition:{body.competition_id}:{player}",
-            )
-            # Add points to profile and audit activity
-            profile = await conn.fetchrow(
-                "SELECT id, points FROM profiles WHERE name = $1 AND quarter_id = $2",
-                player,
-                quarter_id,
-            )
-            if not profile:
-                continue
-            await conn.execute(
-                "UPDATE profiles SET points = points + $1, updated_at = CURRENT_TIMESTAMP WHERE id = $2",
-                reward_points,
-                profile["id"],
-            )
-            await conn.execute(
-                """
-                INSERT INTO activities (profile_id, quarter_id, type, points, created_at)
-                VALUES ($1, $2, 'book', $3, CURRENT_TIMESTAMP)
+                   AND generation_trigger = ANY($2::text[])
                 """,
-                profile["id"],
                 quarter_id,
-                reward_points,
+                list(triggers.values()),
             )
+            awarded = {r["completed_by"] for r in already_awarded}
+            new_winners = [p for p in winners if p not in awarded]
+
+            if new_winners:
+                # Completed challenges (visible false by default via admin toggle later if needed)
+                await conn.execute(
+                    """
+                    INSERT INTO challenges (
+                        quarter_id, title, description, type, icon, target_value, target_type,
+                        current_progress, start_time, end_time, reward_points, reward_description,
+                        status, completed_by, completed_at, auto_generated, generation_trigger, is_visible
+                    )
+                    SELECT $1, $2, $3, 'bonus', '🏆', 1, 'count', 1, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP,
+                           $4, $5, 'completed', w.player, CURRENT_TIMESTAMP, TRUE, w.trigger, FALSE
+                      FROM unnest($6::text[], $7::text[]) AS w(player, trigger)
+                    """,
+                    quarter_id,
+                    "Competition Winner Bonus",
+                    f"Awarded for winning Booking Competition #{body.competition_id}",
+                    reward_points,
+                    f"Winner bonus: +{reward_points} pts",
+                    new_winners,
+                    [triggers[p] for p in new_winners],
+                )
+                # Add points to profiles and write the audit activities
+                await conn.execute(
+                    """
+                    UPDATE profiles
+                       SET points = points + $1, updated_at = CURRENT_TIMESTAMP
+                     WHERE quarter_id = $2 AND name = ANY($3::text[])
+                    """,
+                    reward_points,
+                    quarter_id,
+                    new_winners,
+                )
+                await conn.execute(
+                    """
+                    INSERT INTO activities (profile_id, quarter_id, type, points, created_at)
+                    SELECT id, quarter_id, 'book', $3, CURRENT_TIMESTAMP
+                      FROM profiles
+                     WHERE quarter_id = $1 AND name = ANY($2::text[])
+                    """,
+                    quarter_id,
+                    new_winners,
+                    reward_points,
+                )
 
         # Optionally set inactive
         row = await conn.fetchrow(
@@ -803,6 +738,9 @@ async def finalize_competition(body: FinalizeCompetitionRequest, user: Authorize
         )
         if not row:
             raise HTTPException(status_code=404, detail="Competition not found")
+        if new_winners:
+            # Winner bonuses are logged as activities
+            note_team_stats_write(quarter_id)
         return CompetitionResponse(**dict(row))
     finally:
         await conn.close()
@@ -965,6 +903,7 @@ async def get_team_assignments(competition_id: int, user: AuthorizedUser) -> Tea
                     competition_id, user_player, chosen,
                 )
                 user_team = chosen
+                note_competition_write(competition_id)
                 # Refresh participants list to include the new user
                 participants = await conn.fetch(
                     "SELECT player_name, team_name FROM booking_competition_participants WHERE competition_id = $1 ORDER BY player_name",
@@ -987,6 +926,7 @@ async def get_team_assignments(competition_id: int, user: AuthorizedUser) -> Tea
                     competition_id, user_player, chosen,
                 )
                 user_team = chosen
+                note_competition_write(competition_id)
                 # Refresh participants after update
                 participants = await conn.fetch(
                     "SELECT player_name, team_name FROM booking_competition_participants WHERE competition_id = $1 ORDER BY player_name",
@@ -1009,6 +949,7 @@ async def get_team_assignments(competition_id: int, user: AuthorizedUser) -> Tea
                             """,
                             competition_id, p['player_name'], chosen,
                         )
+                note_competition_write(competition_id)
                 # Reload after possible backfill
                 participants = await conn.fetch(
                     "SELECT player_name, team_name FROM booking_competition_participants WHERE competition_id = $1 ORDER BY player_name",
@@ -1054,6 +995,25 @@ async def get_team_assignments(competition_id: int, user: AuthorizedUser) -> Tea
     finally:
         await conn.close()
 
+# Helper: team vs team view from cached standings
+def build_team_leaderboard(competition_id: int, comp, standings: List[Dict[str, Any]]) -> TeamLeaderboardResponse:
+    return TeamLeaderboardResponse(
+        competition_id=competition_id,
+        team_a=TeamStats(**team_totals(standings, comp['team_a_name'])),
+        team_b=TeamStats(**team_totals(standings, comp['team_b_name'])),
+        individual_leaderboard=[
+            LeaderboardRow(
+                player_name=s['player_name'],
+                total_points=s['total_points'],
+                entries=s['entries'],
+                last_entry_at=s['last_entry_at'],
+                team_name=s['team_name']
+            )
+            for s in standings
+            if s['is_participant']
+        ]
+    )
+
 @router.get("/team-leaderboard/{competition_id}")
 async def get_team_leaderboard(competition_id: int, user: AuthorizedUser) -> TeamLeaderboardResponse:
     """Get team vs team leaderboard with individual breakdown"""
@@ -1067,99 +1027,8 @@ async def get_team_leaderboard(competition_id: int, user: AuthorizedUser) -> Tea
         if not comp:
             raise HTTPException(status_code=404, detail="Competition not found")
             
-        # If no team stats, create default ones
-        team_a_stats = {'team_name': comp['team_a_name'], 'total_points': 0, 'member_count': 0, 'entries': 0, 'last_activity_at': None}
-        team_b_stats = {'team_name': comp['team_b_name'], 'total_points': 0, 'member_count': 0, 'entries': 0, 'last_activity_at': None}
-        
-        # Count members and aggregate by team
-        team_a_members = await conn.fetchval(
-            "SELECT COUNT(*) FROM booking_competition_participants WHERE competition_id = $1 AND team_name = $2",
-            competition_id, comp['team_a_name']
-        )
-        team_b_members = await conn.fetchval(
-            "SELECT COUNT(*) FROM booking_competition_participants WHERE competition_id = $1 AND team_name = $2",
-            competition_id, comp['team_b_name']
-        )
-        
-        # Get points and activity for each team
-        team_a_data = await conn.fetchrow(
-            """
-            SELECT 
-                COALESCE(SUM(e.points), 0) as total_points,
-                COUNT(e.id) as entries,
-                MAX(e.created_at) as last_activity_at
-            FROM booking_competition_participants p
-            LEFT JOIN booking_competition_entries e ON e.competition_id = p.competition_id AND e.player_name = p.player_name
-            WHERE p.competition_id = $1 AND p.team_name = $2
-            """,
-            competition_id, comp['team_a_name']
-        )
-        
-        team_b_data = await conn.fetchrow(
-            """
-            SELECT 
-                COALESCE(SUM(e.points), 0) as total_points,
-                COUNT(e.id) as entries,
-                MAX(e.created_at) as last_activity_at
-            FROM booking_competition_participants p
-            LEFT JOIN booking_competition_entries e ON e.competition_id = p.competition_id AND e.player_name = p.player_name
-            WHERE p.competition_id = $1 AND p.team_name = $2
-            """,
-            competition_id, comp['team_b_name']
-        )
-        
-        # Get individual leaderboard with team info
-        individual_rows = await conn.fetch(
-            """
-            SELECT 
-                p.player_name,
-                p.team_name,
-                COALESCE(SUM(e.points), 0) as total_points,
-                COUNT(e.id) as entries,
-                MAX(e.created_at) as last_entry_at
-            FROM booking_competition_participants p
-            LEFT JOIN booking_competition_entries e ON e.competition_id = p.competition_id AND e.player_name = p.player_name
-            WHERE p.competition_id = $1
-            GROUP BY p.player_name, p.team_name
-            ORDER BY total_points DESC, last_entry_at ASC
-            """,
-            competition_id
-        )
-        
-        # Convert to response format
-        team_a = TeamStats(
-            team_name=comp['team_a_name'],
-            total_points=int(team_a_data['total_points']) if team_a_data else 0,
-            member_count=int(team_a_members) if team_a_members else 0,
-            entries=int(team_a_data['entries']) if team_a_data else 0,
-            last_activity_at=team_a_data['last_activity_at'] if team_a_data else None
-        )
-        
-        team_b = TeamStats(
-            team_name=comp['team_b_name'],
-            total_points=int(team_b_data['total_points']) if team_b_data else 0,
-            member_count=int(team_b_members) if team_b_members else 0,
-            entries=int(team_b_data['entries']) if team_b_data else 0,
-            last_activity_at=team_b_data['last_activity_at'] if team_b_data else None
-        )
-        
-        individual_leaderboard = [
-            LeaderboardRow(
-                player_name=row['player_name'],
-                total_points=int(row['total_points']),
-                entries=int(row['entries']),
-                last_entry_at=row['last_entry_at'],
-                team_name=row['team_name']
-            )
-            for row in individual_rows
-        ]
-        
-        return TeamLeaderboardResponse(
-            competition_id=competition_id,
-            team_a=team_a,
-            team_b=team_b,
-            individual_leaderboard=individual_leaderboard
-        )
+        standings = await leaderboard_service.get_standings(conn, competition_id)
+        return build_team_leaderboard(competition_id, comp, standings)
         
     finally:
         await conn.close()
@@ -1206,34 +1075,20 @@ async def get_competition_stats(competition_id: int, user: AuthorizedUser) -> Co
     """Get comprehensive competition statistics for enhanced display"""
     conn = await get_conn()
     try:
-        # Get overall competition stats
-        overall_stats = await conn.fetchrow(
-            """
-            SELECT 
-                COUNT(DISTINCT p.player_name) as total_participants,
-                COUNT(e.id) as total_entries
-            FROM booking_competition_participants p
-            LEFT JOIN booking_competition_entries e ON e.competition_id = p.competition_id
-            WHERE p.competition_id = $1
-            """,
+        comp = await conn.fetchrow(
+            "SELECT team_a_name, team_b_name FROM booking_competitions WHERE id = $1",
             competition_id
         )
+        if not comp:
+            raise HTTPException(status_code=404, detail="Competition not found")
         
-        # Get most active player
-        most_active = await conn.fetchrow(
-            """
-            SELECT player_name, COUNT(*) as entry_count
-            FROM booking_competition_entries 
-            WHERE competition_id = $1
-            GROUP BY player_name
-            ORDER BY entry_count DESC
-            LIMIT 1
-            """,
-            competition_id
-        )
+        # Everything below is folded from the per-player standings (O(participants))
+        standings = await leaderboard_service.get_standings(conn, competition_id)
+        total_participants = sum(1 for s in standings if s['is_participant'])
+        total_entries = sum(s['entries'] for s in standings)
+        most_active = max((s for s in standings if s['entries'] > 0), key=lambda s: s['entries'], default=None)
         
-        # Get team leaderboard
-        team_leaderboard = await get_team_leaderboard(competition_id, user)
+        team_leaderboard = build_team_leaderboard(competition_id, comp, standings)
         
         # Get recent activity
         recent_activity = await get_team_activity_feed(competition_id, user, 10)
@@ -1247,8 +1102,8 @@ async def get_competition_stats(competition_id: int, user: AuthorizedUser) -> Co
             
         return CompetitionStatsResponse(
             competition_id=competition_id,
-            total_participants=int(overall_stats['total_participants']),
-            total_entries=int(overall_stats['total_entries']),
+            total_participants=total_participants,
+            total_entries=total_entries,
             most_active_player=most_active['player_name'] if most_active else None,
             leading_team=leading_team,
             team_leaderboard=team_leaderboard,
@@ -1259,59 +1114,61 @@ async def get_competition_stats(competition_id: int, user: AuthorizedUser) -> Co
         await conn.close()
 
 
+@outbox_handler("competition.entry_logged")
+async def on_competition_entry_logged(conn, payload):
+    """Outbox delivery for competition Books entries"""
+    await trigger_activity_center_logging(payload["player_name"], payload["user_sub"], conn)
+
+
 async def trigger_activity_center_logging(player_name: str, user_sub: str, conn):
     """
     Trigger activity center logging when a Books activity is logged in Competition.
     Create corresponding "Booked Meeting" activity in Activity Center with 1 point.
+    Runs from the outbox, so errors propagate and the delivery is retried.
     """
-    try:
-        # Get current quarter
-        quarter_row = await conn.fetchrow("""
-            SELECT id, name, is_active 
-            FROM quarters 
-            WHERE is_active = true 
-            ORDER BY created_at DESC 
-            LIMIT 1
-        """)
-        
-        if not quarter_row:
-            print(f"No active quarter found for player {player_name}")
-            return
-            
-        quarter_id = quarter_row['id']
+    # Get current quarter
+    quarter_row = await conn.fetchrow("""
+        SELECT id, name, is_active 
+        FROM quarters 
+        WHERE is_active = true 
+        ORDER BY created_at DESC 
+        LIMIT 1
+    """)
+    
+    if not quarter_row:
+        print(f"No active quarter found for player {player_name}")
+        return
         
-        # Get or create user profile
+    quarter_id = quarter_row['id']
+    
+    # Get or create user profile
+    profile = await conn.fetchrow("""
+        SELECT id, points, name, goal_books, goal_opps, goal_deals
+        FROM profiles 
+        WHERE name = $1 AND quarter_id = $2
+    """, player_name, quarter_id)
+    
+    if not profile:
+        # Create new profile if doesn't exist
         profile = await conn.fetchrow("""
-            SELECT id, points, name, goal_books, goal_opps, goal_deals
-            FROM profiles 
-            WHERE name = $1 AND quarter_id = $2
-        """, player_name, quarter_id)
-        
-        if not profile:
-            # Create new profile if doesn't exist
-            profile = await conn.fetchrow("""
-                INSERT INTO profiles (user_id, quarter_id, name, points) 
-                VALUES ($1, $2, $3, 0) 
-                RETURNING id, points, name
-            """, user_sub, quarter_id, player_name)
-            print(f"Created new profile for player {player_name}")
-        
-        # Log the Books activity in Activity Center (1 point for quarterly progression)
-        activity = await conn.fetchrow("""
-            INSERT INTO activities (profile_id, quarter_id, type, points)
-            VALUES ($1, $2, $3, $4)
-            RETURNING id
-        """, profile['id'], quarter_id, 'book', 1)
-        
-        # Update player's total points
-        await conn.execute("""
-            UPDATE profiles 
-            SET points = points + 1
-            WHERE id = $1
-        """, profile['id'])
-        
-        print(f"Successfully logged Books activity for {player_name} in Activity Center (+1 point)")
-        
-    except Exception as e:
-        print(f"Error triggering activity center logging: {e}")
-        # Don't raise - this is optional functionality that shouldn't break main flow
+            INSERT INTO profiles (user_id, quarter_id, name, points) 
+            VALUES ($1, $2, $3, 0) 
+            RETURNING id, points, name
+        """, user_sub, quarter_id, player_name)
+        print(f"Created new profile for player {player_name}")
+    
+    # Log the Books activity in Activity Center (1 point for quarterly progression)
+    await conn.execute("""
+        INSERT INTO activities (profile_id, quarter_id, type, points)
+        VALUES ($1, $2, $3, $4)
+    """, profile['id'], quarter_id, 'book', 1)
+    note_team_stats_write(quarter_id)
+    
+    # Update player's total points
+    await conn.execute("""
+        UPDATE profiles 
+        SET points = points + 1
+        WHERE id = $1
+    """, profile['id'])
+    
+    print(f"Successfully logged Books activity for {player_name} in Activity Center (+1 point)")
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, HTTPException, Query, Header, Request
+from fastapi import APIRouter, HTTPException, Query, Request
 from pydantic import BaseModel, Field, validator
 from typing import List, Optional, Dict, Any, Literal
 from datetime import datetime, timedelta, timezone
@@ -39,6 +39,10 @@ from app.libs.models_competition_v2 import (
 )
 
 from app.libs.scoring_engine import ScoringEngine
+from app.libs.scoring_simulator import simulate
+from app.libs.competition_rescoring import rescore_manager, get_rescore_job, REPLAYABLE_EVENTS_SQL
+from app.libs.leaderboard_service import note_competition_write, STORAGE_V2
+from app.libs.scoreboard_snapshots import scoreboard_at, invalidate_snapshots
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/competitions-v2")
@@ -59,15 +63,17 @@ async def get_connection() -> asyncpg.Connection:
 async def create_competition_v2(
     body: CompetitionCreateV2,
     user: AuthorizedUser,
-    x_idempotency_key: Optional[str] = Header(default=None, alias="X-Idempotency-Key"),
 ):
-    """Create a new competition with advanced Competitions 2.0 features."""
+    """Create a new competition with advanced Competitions 2.0 features.
+
+    X-Idempotency-Key is handled by IdempotencyMiddleware; without one, identical
+    creates within the same second are still rejected.
+    """
     check_admin_access(user)
     conn = await get_connection()
     try:
         await conn.execute("BEGIN")
-        # Optional idempotency to avoid duplicate creations
-        idem_key = x_idempotency_key or f"create:{user.sub}:{body.name}:{int(utcnow().timestamp())}"
+        idem_key = f"create:{user.sub}:{body.name}:{int(utcnow().timestamp())}"
         await conn.execute("""
             DO $$
             BEGIN
@@ -199,57 +205,81 @@ async def validate_competition_config(body: ValidationRequest, user: AuthorizedU
 
 @router.post("/preview", response_model=ScoringPreviewResponse)
 async def preview_scoring(body: ScoringPreviewRequest, user: AuthorizedUser):
-    """Preview how scoring rules would work with sample events."""
+    """Preview how scoring rules would work with sample events or a competition's recorded events.
+
+    Events are replayed through the in-memory ScoringSimulator; nothing is written.
+    """
     check_admin_access(user)
     try:
-        player_scores: Dict[str, Dict[str, Any]] = {}
         warnings: List[str] = []
         errors: List[str] = []
+        events: List[Dict[str, Any]] = []
 
-        for event_data in body.sample_events:
+        if body.competition_id is not None:
+            conn = await get_connection()
             try:
-                activity_type = BookingActivityType(event_data.get("type", "book"))
-                player_name = event_data.get("player_name", "Sample Player")
-                if activity_type == BookingActivityType.LIFT:
-                    base_points = body.rules.points.lift
-                elif activity_type == BookingActivityType.CALL:
-                    base_points = body.rules.points.call
-                elif activity_type == BookingActivityType.BOOK:
-                    base_points = body.rules.points.book
-                else:
-                    base_points = 0
-
-                if player_name not in player_scores:
-                    player_scores[player_name] = {
-                        "total_points": 0,
-                        "event_count": 0,
-                        "breakdown": {},
-                        "multipliers_applied": [],
-                        "combos_achieved": [],
-                    }
-
-                s = player_scores[player_name]
-                s["total_points"] += base_points
-                s["event_count"] += 1
-                s["breakdown"][activity_type.value] = s["breakdown"].get(activity_type.value, 0) + 1
-
-            except Exception as e:
-                errors.append(f"Error processing sample event: {str(e)}")
+                # Undone events and their compensations are left out, as in rescoring
+                rows = await conn.fetch(
+                    f"""
+                    SELECT e.player_name, e.type, COALESCE(e.ts, e.created_at) AS ts, e.points
+                    FROM booking_competition_events e
+                    WHERE {REPLAYABLE_EVENTS_SQL}
+                    ORDER BY COALESCE(e.ts, e.created_at), e.created_at
+                    """,
+                    body.competition_id,
+                )
+            finally:
+                await conn.close()
+            events = [dict(r) for r in rows]
+            if not events:
+                warnings.append("Competition has no recorded events to replay")
+        else:
+            base_ts = utcnow()
+            for i, event_data in enumerate(body.sample_events):
+                try:
+                    activity_type = BookingActivityType(event_data.get("type", "book"))
+                    ts = event_data.get("ts")
+                    if isinstance(ts, str):
+                        ts = datetime.fromisoformat(ts.replace("Z", "+00:00"))
+                    events.append({
+                        "player_name": event_data.get("player_name", "Sample Player"),
+                        "type": activity_type.value,
+                        "ts": ts or base_ts + timedelta(minutes=i),
+                        "custom_points": event_data.get("custom_points"),
+                    })
+                except Exception as e:
+                    errors.append(f"Error processing sample event: {str(e)}")
+            if not body.sample_events:
+                warnings.append("No sample events provided - consider adding test data")
+
+        result = simulate(body.rules, events)
 
         calculated_scores = [
             {
-                "player_name": name,
-                "total_points": data["total_points"],
-                "event_count": data["event_count"],
-                "breakdown": data["breakdown"],
-                "multipliers_applied": data["multipliers_applied"],
-                "combos_achieved": data["combos_achieved"],
-                "last_activity": None,
+                "player_name": p["player_name"],
+                "total_points": p["total_points"],
+                "event_count": p["event_count"],
+                "breakdown": dict(p["breakdown"]),
+                "multipliers_applied": sorted(p["multipliers_applied"]),
+                "combos_achieved": sorted(p["combos_achieved"]),
+                "last_activity": p["last_activity"],
                 "current_streak": 0,
             }
-            for name, data in player_scores.items()
+            for p in result["players"]
         ]
 
+        player_deltas = []
+        if body.competition_id is not None:
+            player_deltas = [
+                {
+                    "player_name": p["player_name"],
+                    "current_points": p["current_points"],
+                    "simulated_points": p["total_points"],
+                    "delta": p["total_points"] - p["current_points"],
+                }
+                for p in result["players"]
+            ]
+
         rules_validation = {
             "total_multipliers": len(body.rules.multipliers),
             "total_combos": len(body.rules.combos),
@@ -260,14 +290,14 @@ async def preview_scoring(body: ScoringPreviewRequest, user: AuthorizedUser):
             ),
         }
 
-        if not body.sample_events:
-            warnings.append("No sample events provided - consider adding test data")
-
         return ScoringPreviewResponse(
             calculated_scores=calculated_scores,
             rules_validation=rules_validation,
             warnings=warnings,
             errors=errors,
+            player_deltas=player_deltas,
+            rule_trigger_counts=result["trigger_counts"],
+            events_simulated=result["events_simulated"],
         )
     except Exception as e:
         logger.exception("preview_scoring failed")
@@ -283,7 +313,6 @@ async def preview_scoring(body: ScoringPreviewRequest, user: AuthorizedUser):
 async def log_competition_event(
     body: CompetitionEventCreate,
     user: AuthorizedUser,
-    x_idempotency_key: Optional[str] = Header(default=None, alias="X-Idempotency-Key"),
 ):
     """Log an event using the advanced scoring engine (idempotent + enrollment checks)."""
 
@@ -343,16 +372,7 @@ async def log_competition_event(
                     my_player,
                 )
 
-        # Optional idempotency key to prevent accidental double taps
-        if x_idempotency_key:
-            try:
-                await conn.execute(
-                    "INSERT INTO idempotency_keys(key, created_at) VALUES ($1, NOW() AT TIME ZONE 'UTC')",
-                    x_idempotency_key,
-                )
-            except asyncpg.UniqueViolationError:
-                raise HTTPException(status_code=409, detail="Duplicate event (idempotency)")
-
+        # Double taps with the same X-Idempotency-Key are replayed by IdempotencyMiddleware
         # Delegate scoring + persistence
         return await engine.log_event(body, rules)
 
@@ -361,8 +381,12 @@ async def log_competition_event(
 
 
 @router.get("/{competition_id}/scoreboard", response_model=ScoreboardResponse)
-async def get_competition_scoreboard_v2(competition_id: int, user: AuthorizedUser):
-    """Get advanced scoreboard with full scoring breakdown."""
+async def get_competition_scoreboard_v2(
+    competition_id: int,
+    user: AuthorizedUser,
+    at: Optional[datetime] = Query(default=None, description="Historical standings as of this timestamp"),
+):
+    """Get advanced scoreboard with full scoring breakdown (optionally as of a past timestamp)."""
     engine = ScoringEngine()
     conn = await get_connection()
     try:
@@ -372,12 +396,72 @@ async def get_competition_scoreboard_v2(competition_id: int, user: AuthorizedUse
         )
         if not comp_row:
             raise HTTPException(status_code=404, detail="Competition not found")
+        if at is not None:
+            # Nearest periodic snapshot + replay of the events logged after it
+            return await scoreboard_at(conn, competition_id, at)
         rules = CompetitionRules(**json.loads(comp_row["rules"]))
         return await engine.calculate_scoreboard(competition_id, rules)
     finally:
         await conn.close()
 
 
+@router.put("/{competition_id}/rules")
+async def update_competition_rules(
+    competition_id: int,
+    rules: CompetitionRules,
+    user: AuthorizedUser,
+    rescore: bool = Query(default=True, description="Rescore already logged events with the new rules"),
+):
+    """Replace a competition's scoring rules and optionally rescore its history in the background."""
+    check_admin_access(user)
+    conn = await get_connection()
+    try:
+        result = await conn.execute(
+            "UPDATE booking_competitions SET rules = $2, updated_at = NOW() WHERE id = $1 AND rules IS NOT NULL",
+            competition_id,
+            json.dumps(rules.dict()),
+        )
+        if result == "UPDATE 0":
+            raise HTTPException(status_code=404, detail="Competition not found")
+        note_competition_write(competition_id)
+        job = await rescore_manager.start_job(conn, competition_id) if rescore else None
+        return {"competition_id": competition_id, "rules": rules.dict(), "rescore_job": job}
+    finally:
+        await conn.close()
+
+
+@router.post("/{competition_id}/rescore")
+async def start_rescore(competition_id: int, user: AuthorizedUser):
+    """Rescore every logged event with the competition's current rules (background job)."""
+    check_admin_access(user)
+    conn = await get_connection()
+    try:
+        exists = await conn.fetchval(
+            "SELECT 1 FROM booking_competitions WHERE id = $1 AND rules IS NOT NULL",
+            competition_id,
+        )
+        if not exists:
+            raise HTTPException(status_code=404, detail="Competition not found")
+        return await rescore_manager.start_job(conn, competition_id)
+    finally:
+        await conn.close()
+
+
+@router.get("/{competition_id}/rescore")
+async def get_rescore_status(competition_id: int, user: AuthorizedUser):
+    """Progress of the latest rescoring job for a competition."""
+    check_admin_access(user)
+    conn = await get_connection()
+    try:
+        job = await get_rescore_job(conn, competition_id)
+        if not job:
+            raise HTTPException(status_code=404, detail="No rescoring job for this competition")
+        job["is_running"] = rescore_manager.is_running(competition_id)
+        return job
+    finally:
+        await conn.close()
+
+
 @router.get("/list", response_model=List[CompetitionResponseV2])
 async def list_competitions_v2(user: AuthorizedUser):
     """List all Competitions 2.0 with advanced features."""
@@ -492,6 +576,7 @@ async def undo_competition_event(request: UndoEventRequest, user: AuthorizedUser
             json.dumps({"undone_by": str(undo_record["id"])}),
             request.event_id,
         )
+        note_competition_write(event_record["competition_id"], STORAGE_V2)
 
         return UndoEventResponse(success=True, undo_event_id=str(undo_record["id"]), message=f"Event {request.event_id} successfully undone")
 
@@ -592,6 +677,8 @@ async def simple_undo_event(event_id: str, user: AuthorizedUser):
         )
         if not deleted_row:
             raise HTTPException(status_code=404, detail="Event not found")
+        note_competition_write(deleted_row["competition_id"])
+        await invalidate_snapshots(conn, deleted_row["competition_id"], deleted_row["created_at"])
 
         return {
             "success": True,
@@ -26,6 +26,10 @@ from app.libs.models_competition_v2 import (
     PointsConfig
 )
 from app.libs.scoring_engine import ScoringEngine
+from app.libs.leaderboard_service import leaderboard_service, note_competition_write
+from app.libs.scoreboard_snapshots import invalidate_snapshots
+from app.libs.streaks import player_streaks, live_streak
+from app.libs.local_time import local_today
 import databutton as db
 
 router = APIRouter(prefix="/mcp")
@@ -392,47 +396,10 @@ async def mcp_get_leaderboard(
                     await conn.close()
             competition_id = active_id
         
-        # For V1 competitions, query booking_competition_entries directly
         conn = await get_connection()
         try:
-            # First check if this competition has V2 events (newer system)
-            v2_events = await conn.fetchval(
-                "SELECT COUNT(*) FROM booking_competition_events WHERE competition_id = $1",
-                competition_id
-            )
-            
-            if v2_events > 0:
-                # Use V2 events table for scoring
-                players = await conn.fetch("""
-                    SELECT 
-                        e.player_name,
-                        SUM(e.points) as total_points,
-                        COUNT(*) as activity_count,
-                        MAX(e.created_at) as last_activity,
-                        p.team_name
-                    FROM booking_competition_events e
-                    LEFT JOIN booking_competition_participants p ON e.competition_id = p.competition_id AND e.player_name = p.player_name
-                    WHERE e.competition_id = $1
-                    GROUP BY e.player_name, p.team_name
-                    ORDER BY total_points DESC, last_activity ASC
-                    LIMIT $2
-                """, competition_id, request.limit)
-            else:
-                # Fallback to V1 entries table
-                players = await conn.fetch("""
-                    SELECT 
-                        e.player_name,
-                        SUM(e.points) as total_points,
-                        COUNT(*) as activity_count,
-                        MAX(e.created_at) as last_activity,
-                        p.team_name
-                    FROM booking_competition_entries e
-                    LEFT JOIN booking_competition_participants p ON e.competition_id = p.competition_id AND e.player_name = p.player_name
-                    WHERE e.competition_id = $1
-                    GROUP BY e.player_name, p.team_name
-                    ORDER BY total_points DESC, last_activity ASC
-                    LIMIT $2
-                """, competition_id, request.limit)
+            standings_rows = await leaderboard_service.get_standings(conn, competition_id)
+            players = [s for s in standings_rows if s['entries'] > 0][:request.limit]
             
             standings = []
             for i, player in enumerate(players):
@@ -440,9 +407,9 @@ async def mcp_get_leaderboard(
                     "rank": i + 1,
                     "player_name": player['player_name'],
                     "team_name": player['team_name'],
-                    "score": int(player['total_points']),
-                    "activities_today": int(player['activity_count']),
-                    "last_activity": player['last_activity'].isoformat() if player['last_activity'] else None
+                    "score": player['total_points'],
+                    "activities_today": player['entries'],
+                    "last_activity": player['last_entry_at'].isoformat() if player['last_entry_at'] else None
                 })
             
             print(f"📊 MCP Leaderboard for competition {competition_id}: {len(standings)} players")
@@ -514,27 +481,15 @@ async def mcp_get_player_progress(
                 
                 progress["total_points_this_month"] += points
             
-            # Get streak information
-            streak_query = """
-            WITH daily_activities AS (
-                SELECT DATE(created_at) as activity_date
-                FROM booking_competition_events
-                WHERE player_name = $1
-                AND created_at >= NOW() - INTERVAL '90 days'
-                GROUP BY DATE(created_at)
-                ORDER BY DATE(created_at) DESC
-            )
-            SELECT COUNT(*) as current_streak
-            FROM daily_activities
-            WHERE activity_date >= CURRENT_DATE - INTERVAL '30 days'
-            """
-            streak_result = await conn.fetchrow(streak_query, player_name)
-            current_streak = streak_result['current_streak'] if streak_result else 0
+            # Get streak information from the player's latest profile
+            stored = (await player_streaks(conn, [player_name])).get(player_name)
+            today = local_today()
+            current_streak = live_streak(stored['current_streak'], stored['last_local_date'], today) if stored else 0
             
             streaks = {
                 "current_activity_streak": current_streak,
-                "longest_streak_this_quarter": current_streak,  # Simplified
-                "days_since_last_activity": 0  # Simplified
+                "longest_streak_this_quarter": stored['longest_streak'] if stored else 0,
+                "days_since_last_activity": (today - stored['last_local_date']).days if stored else None
             }
             
             # Mock achievements for now
@@ -1021,6 +976,8 @@ async def mcp_undo_last_event(
                 "DELETE FROM booking_competition_events WHERE id = $1",
                 event_row['id']
             )
+            note_competition_write(request.competition_id)
+            await invalidate_snapshots(conn, request.competition_id, event_row['created_at'])
             
             # Recalculate player's updated score (optional - could be done lazily)
             updated_score_row = await conn.fetchrow(
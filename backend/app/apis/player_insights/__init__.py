@@ -7,6 +7,14 @@ import asyncpg
 from app.auth import AuthorizedUser
 import databutton as db
 from app.apis.activities import get_current_quarter
+from app.libs.activity_rollup import ensure_activity_rollup
+from app.libs.activity_heatmap import hour_of_week_counts
+from app.libs.local_time import local_today
+from app.libs.workdays import quarter_workdays
+from app.libs.streaks import profile_streaks, live_streak
+from app.libs.timeseries import (
+    dense_daily, day_count, day_labels, weekly_buckets, downsample, trailing_average, period_average
+)
 
 router = APIRouter()
 
@@ -217,10 +225,10 @@ async def get_player_insights_summary(
         end_date = quarter['end_date']
         current_date = datetime.now().date()
         
-        days_total = (end_date - start_date).days
         days_elapsed = (current_date - start_date).days
         days_remaining = max(0, (end_date - current_date).days)
-        quarter_progress = (days_elapsed / days_total) * 100 if days_total > 0 else 0
+        workdays = quarter_workdays(start_date, end_date, current_date)
+        quarter_progress = workdays.progress * 100
         
         # Get player goals for current quarter
         player_goals = await conn.fetchrow(
@@ -282,16 +290,17 @@ async def get_player_insights_summary(
             remaining=max(0, goal_points - current_points)
         )
         
-        # Calculate pace analysis (based on most critical metric - points)
-        target_points_per_day = goal_points / days_total if days_total > 0 else 0
-        current_points_per_day = current_points / days_elapsed if days_elapsed > 0 else 0
+        # Calculate pace analysis (based on most critical metric - points), per workday
+        workdays_worked = workdays.passed + int(workdays.today_is_workday)
+        target_points_per_day = goal_points / workdays.total if workdays.total > 0 else 0
+        current_points_per_day = current_points / workdays_worked if workdays_worked > 0 else 0
         delta_per_day = current_points_per_day - target_points_per_day
         
         pace = PaceIndicator(
             current_per_day=current_points_per_day,
             target_per_day=target_points_per_day,
             delta_per_day=delta_per_day,
-            days_left=days_remaining,
+            days_left=workdays.left,
             status=calculate_pace_status(current_points_per_day, target_points_per_day)
         )
         
@@ -366,32 +375,40 @@ async def get_player_insights_timeseries(
         
         activity_type = activity_type_map[metric]
         
-        # Get timeseries data (daily granularity, Europe/Oslo timezone)
+        # Get timeseries data (daily rollup, Europe/Oslo days), including the
+        # equally long period before start for the comparison
+        period_days = day_count(start, end)
+        previous_start = start - timedelta(days=period_days)
+        await ensure_activity_rollup(conn)
         timeseries_data = await conn.fetch("""
             SELECT 
-                date_trunc('day', (created_at AT TIME ZONE 'Europe/Oslo'))::date AS d,
-                COUNT(*) AS value
-            FROM activities 
+                local_date AS d,
+                activity_count AS value
+            FROM activity_daily_rollup 
             WHERE profile_id = $1 
-              AND type = $2
-              AND (created_at AT TIME ZONE 'Europe/Oslo')::date >= $3
-              AND (created_at AT TIME ZONE 'Europe/Oslo')::date <= $4
-            GROUP BY d 
-            ORDER BY d
-        """, player_profile['id'], activity_type, start, end)
-        
-        # Convert to data points
+              AND activity_type = $2
+              AND local_date >= $3
+              AND local_date <= $4
+              AND activity_count > 0
+        """, player_profile['id'], activity_type, previous_start, end)
+        
+        values = dense_daily(timeseries_data, previous_start, end)
+        previous, values = values[:period_days], values[period_days:]
+        
+        # Averages are per calendar day: the last 7 days and the previous period
+        seven_day_avg = trailing_average(values, 7)
+        previous_period_avg = period_average(previous)
+        
+        # Convert to data points (weekly sums, or daily downsampled for long ranges)
+        if granularity == "weekly":
+            labels, values = weekly_buckets(values, start)
+        else:
+            labels = day_labels(start, len(values))
         data_points = [
-            TimeseriesDataPoint(date=row['d'], value=row['value'])
-            for row in timeseries_data
+            TimeseriesDataPoint(date=labels[i], value=int(values[i]))
+            for i in downsample(values)
         ]
         
-        # Calculate 7-day moving average for last 7 points
-        seven_day_avg = None
-        if len(data_points) >= 7:
-            last_seven = data_points[-7:]
-            seven_day_avg = sum(point.value for point in last_seven) / 7
-        
         return PlayerInsightsTimeseriesResponse(
             player_name=player_name,
             metric=metric,
@@ -400,7 +417,7 @@ async def get_player_insights_timeseries(
             end_date=end,
             data=data_points,
             seven_day_average=seven_day_avg,
-            previous_period_average=None  # TODO: Calculate previous period comparison
+            previous_period_average=previous_period_avg
         )
         
     except Exception as e:
@@ -433,16 +450,17 @@ async def get_player_insights_funnel(
         # Get player profile
         player_profile = await get_player_by_name(conn, player_name)
         
-        # Get funnel counts (Europe/Oslo timezone)
+        # Get funnel counts (daily rollup, Europe/Oslo days)
+        await ensure_activity_rollup(conn)
         funnel_stats = await conn.fetchrow("""
             SELECT 
-                COUNT(*) FILTER (WHERE type = 'book') as books,
-                COUNT(*) FILTER (WHERE type = 'opp') as opps,
-                COUNT(*) FILTER (WHERE type = 'deal') as deals
-            FROM activities 
+                SUM(activity_count) FILTER (WHERE activity_type = 'book') as books,
+                SUM(activity_count) FILTER (WHERE activity_type = 'opp') as opps,
+                SUM(activity_count) FILTER (WHERE activity_type = 'deal') as deals
+            FROM activity_daily_rollup 
             WHERE profile_id = $1
-              AND (created_at AT TIME ZONE 'Europe/Oslo')::date >= $2
-              AND (created_at AT TIME ZONE 'Europe/Oslo')::date <= $3
+              AND local_date >= $2
+              AND local_date <= $3
         """, player_profile['id'], start, end)
         
         books = funnel_stats['books'] or 0
@@ -514,38 +532,19 @@ async def get_player_insights_heatmap(
         # Get player profile
         player_profile = await get_player_by_name(conn, player_name)
         
-        # Get activity by hour (Europe/Oslo timezone)
-        hourly_data = await conn.fetch("""
-            SELECT 
-                EXTRACT(HOUR FROM created_at AT TIME ZONE 'Europe/Oslo') as hour,
-                COUNT(*) as activity_count
-            FROM activities 
-            WHERE profile_id = $1
-              AND (created_at AT TIME ZONE 'Europe/Oslo')::date >= $2
-              AND (created_at AT TIME ZONE 'Europe/Oslo')::date <= $3
-              AND type IN ('book', 'opp', 'deal')
-            GROUP BY hour
-            ORDER BY hour
-        """, player_profile['id'], start, end)
-        
-        # Get activity by weekday (Europe/Oslo timezone)
-        weekday_data = await conn.fetch("""
-            SELECT 
-                EXTRACT(DOW FROM created_at AT TIME ZONE 'Europe/Oslo') as weekday,
-                COUNT(*) as activity_count
-            FROM activities 
-            WHERE profile_id = $1
-              AND (created_at AT TIME ZONE 'Europe/Oslo')::date >= $2
-              AND (created_at AT TIME ZONE 'Europe/Oslo')::date <= $3
-              AND type IN ('book', 'opp', 'deal')
-            GROUP BY weekday
-            ORDER BY weekday
-        """, player_profile['id'], start, end)
+        # Hour-of-week counts (Europe/Oslo timezone), folded into hours and weekdays
+        counts = await hour_of_week_counts(
+            conn, [player_profile['id']], ['book', 'opp', 'deal'], start, end
+        )
+        hourly_dict: dict = {}
+        weekday_dict: dict = {}
+        for (dow, hour), count in counts.items():
+            hourly_dict[hour] = hourly_dict.get(hour, 0) + count
+            weekday_dict[dow] = weekday_dict.get(dow, 0) + count
         
         # Convert hourly data to heatmap points
         hour_labels = [f"{h:02d}:00" for h in range(24)]
         by_hour = []
-        hourly_dict = {int(row['hour']): row['activity_count'] for row in hourly_data}
         
         for hour in range(24):
             by_hour.append(HeatmapDataPoint(
@@ -557,7 +556,6 @@ async def get_player_insights_heatmap(
         # Convert weekday data to heatmap points
         weekday_labels = ["Sunday", "Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday"]
         by_weekday = []
-        weekday_dict = {int(row['weekday']): row['activity_count'] for row in weekday_data}
         
         for weekday in range(7):
             by_weekday.append(HeatmapDataPoint(
@@ -624,57 +622,15 @@ async def get_player_insights_streaks(
         if not quarter:
             raise HTTPException(status_code=404, detail="No active quarter found")
         
-        # Calculate current activity streak
-        # Get last 30 days of activity (Europe/Oslo timezone)
-        recent_activity = await conn.fetch("""
-            SELECT DISTINCT (created_at AT TIME ZONE 'Europe/Oslo')::date as activity_date
-            FROM activities 
-            WHERE profile_id = $1
-              AND (created_at AT TIME ZONE 'Europe/Oslo')::date >= CURRENT_DATE - INTERVAL '30 days'
-              AND type IN ('book', 'opp', 'deal')
-            ORDER BY activity_date DESC
-        """, player_profile['id'])
-        
-        # Calculate streak
-        current_streak = 0
-        current_date = datetime.now().date()
-        
-        activity_dates = [row['activity_date'] for row in recent_activity]
-        
-        # Check consecutive days from today backwards
-        check_date = current_date
-        while check_date in activity_dates:
-            current_streak += 1
-            check_date = check_date - timedelta(days=1)
-        
-        # Find longest streak in current quarter
-        quarter_activities = await conn.fetch("""
-            SELECT (created_at AT TIME ZONE 'Europe/Oslo')::date as activity_date
-            FROM activities 
-            WHERE profile_id = $1 AND quarter_id = $2
-              AND type IN ('book', 'opp', 'deal')
-            ORDER BY activity_date
-        """, player_profile['id'], quarter['id'])
-        
-        # Calculate longest streak in quarter
-        longest_streak = 0
-        if quarter_activities:
-            all_dates = [row['activity_date'] for row in quarter_activities]
-            unique_dates = sorted(list(set(all_dates)))
-            
-            current_longest = 1
-            for i in range(1, len(unique_dates)):
-                if (unique_dates[i] - unique_dates[i-1]).days == 1:
-                    current_longest += 1
-                    longest_streak = max(longest_streak, current_longest)
-                else:
-                    current_longest = 1
-            longest_streak = max(longest_streak, current_longest)
+        # Current and longest streak from the streaks table (workday-aware)
+        stored = (await profile_streaks(conn, [player_profile['id']])).get(player_profile['id'])
+        current_streak = live_streak(stored['current_streak'], stored['last_local_date'], local_today()) if stored else 0
+        longest_streak = stored['longest_streak'] if stored else 0
         
         # Find best week (most books)
         best_week_data = await conn.fetchrow("""
             SELECT 
-                date_trunc('week', created_at AT TIME ZONE 'Europe/Oslo') as week_start,
+                date_trunc('week', local_date)::date as week_start,
                 COUNT(*) FILTER (WHERE type = 'book') as books_count
             FROM activities 
             WHERE profile_id = $1 AND quarter_id = $2
@@ -8,14 +8,12 @@ import asyncpg
 import databutton as db
 import uuid
 from typing import Optional, List
+from app.libs.roster import NAMED_PLAYERS
 
 router = APIRouter()
 
 # Fixed list of 12 players
-FIXED_PLAYERS = [
-    "RIKKE", "SIGGEN", "GARD", "THEA", "ITHY", "EMILIE", 
-    "SCHOLZ", "HEFF", "KAREN", "TOBIAS", "ANDREAS", "SONDRE"
-]
+FIXED_PLAYERS = NAMED_PLAYERS
 
 # Response models
 class PlayerSelectionResponse(BaseModel):
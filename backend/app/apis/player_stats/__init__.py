@@ -1,13 +1,18 @@
 
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Dict, List, Optional
 from datetime import datetime, timedelta
 import asyncpg
 import databutton as db
 from app.auth import AuthorizedUser
 from app.apis.player_selection import convert_user_id_to_uuid
 from app.apis.activities import ActivityType, get_current_quarter
+from app.libs.rank_index import rank_indexes
+from app.libs.profile_counters import ensure_profile_counters, profile_pace
+from app.libs.pace import predict
+from app.libs.workdays import quarter_workdays
+from app.libs.local_time import local_today
 
 router = APIRouter()
 
@@ -73,13 +78,20 @@ class ActiveChallenge(BaseModel):
     reward_points: int
     is_completed: bool
 
+class GoalPredictionBand(BaseModel):
+    """80% band around a days-to-goal prediction"""
+    low_days: Optional[int]   # at the fast end of recent pace
+    high_days: Optional[int]  # at the slow end; None if that pace never gets there
+    daily_rate: float
+
 class TimeToGoalPrediction(BaseModel):
-    """Predictions for achieving goals"""
+    """Predictions for achieving goals (EWMA pace, see app.libs.pace)"""
     books_days_to_goal: Optional[int]  # None if already achieved or impossible
     opps_days_to_goal: Optional[int]
     deals_days_to_goal: Optional[int]
     points_days_to_goal: Optional[int]
     likelihood_to_achieve_all: str  # "high", "medium", "low", "unlikely"
+    confidence_bands: Dict[str, GoalPredictionBand] = {}
 
 class PlayerDetailedStatsResponse(BaseModel):
     """Comprehensive player statistics for drawer UI"""
@@ -123,22 +135,6 @@ def calculate_pace_vs_target(current: int, goal: int, quarter_progress: float) -
     expected_at_this_point = goal * (quarter_progress / 100)
     return current - expected_at_this_point
 
-def predict_days_to_goal(current: int, goal: int, days_elapsed: int) -> Optional[int]:
-    """Predict days to reach goal based on current pace"""
-    if current >= goal:
-        return 0  # Already achieved
-    
-    if days_elapsed == 0 or current == 0:
-        return None  # Not enough data
-    
-    daily_rate = current / days_elapsed
-    if daily_rate <= 0:
-        return None  # No progress
-    
-    remaining = goal - current
-    days_needed = remaining / daily_rate
-    return int(days_needed) if days_needed > 0 else None
-
 def assess_likelihood(books_days: Optional[int], opps_days: Optional[int], 
                     deals_days: Optional[int], points_days: Optional[int], 
                     days_remaining: int) -> str:
@@ -194,46 +190,25 @@ async def get_player_detailed_stats(
         # Calculate quarter progress
         quarter_start = quarter['start_date']
         quarter_end = quarter['end_date']
-        today = datetime.now().date()
+        today = local_today()
         
-        total_days = (quarter_end - quarter_start).days
         days_elapsed = max(0, (today - quarter_start).days)
         days_remaining = max(0, (quarter_end - today).days)
-        quarter_progress = min(100.0, (days_elapsed / total_days) * 100) if total_days > 0 else 0.0
+        # Pace targets follow workdays, so weekends and holidays do not count against anyone
+        quarter_progress = quarter_workdays(quarter_start, quarter_end, today).progress * 100
         
-        # Get player profile and goals
+        # Get player profile, goals and current counts (counters are keyed by profile)
+        await ensure_profile_counters(conn)
         player_profile = await conn.fetchrow(
             """
-            SELECT p.*, 
-                   COALESCE(books.count, 0) as current_books,
-                   COALESCE(opps.count, 0) as current_opps, 
-                   COALESCE(deals.count, 0) as current_deals,
-                   COALESCE(total.points, 0) as current_points
+            SELECT p.*,
+                   COALESCE(c.books, 0) as current_books,
+                   COALESCE(c.opps, 0) as current_opps,
+                   COALESCE(c.deals, 0) as current_deals,
+                   COALESCE(c.points, 0) as current_points,
+                   COALESCE(c.activity_count, 0) as activity_count
             FROM profiles p
-            LEFT JOIN (
-                SELECT profile_id, COUNT(*) as count
-                FROM activities 
-                WHERE type = 'book' AND quarter_id = $1
-                GROUP BY profile_id
-            ) books ON p.id = books.profile_id
-            LEFT JOIN (
-                SELECT profile_id, COUNT(*) as count
-                FROM activities 
-                WHERE type = 'opp' AND quarter_id = $1
-                GROUP BY profile_id
-            ) opps ON p.id = opps.profile_id
-            LEFT JOIN (
-                SELECT profile_id, COUNT(*) as count
-                FROM activities 
-                WHERE type = 'deal' AND quarter_id = $1
-                GROUP BY profile_id
-            ) deals ON p.id = deals.profile_id
-            LEFT JOIN (
-                SELECT profile_id, SUM(points) as points
-                FROM activities 
-                WHERE quarter_id = $1
-                GROUP BY profile_id
-            ) total ON p.id = total.profile_id
+            LEFT JOIN profile_counters c ON c.profile_id = p.id
             WHERE p.name = $2 AND p.quarter_id = $1
             """,
             quarter['id'], player_name
@@ -249,35 +224,12 @@ async def get_player_detailed_stats(
                 SUM(goal_books) as team_goal_books,
                 SUM(goal_opps) as team_goal_opps,
                 SUM(goal_deals) as team_goal_deals,
-                SUM(books.count) as team_current_books,
-                SUM(opps.count) as team_current_opps,
-                SUM(deals.count) as team_current_deals,
-                SUM(total.points) as team_current_points
+                SUM(c.books) as team_current_books,
+                SUM(c.opps) as team_current_opps,
+                SUM(c.deals) as team_current_deals,
+                SUM(c.points) as team_current_points
             FROM profiles p
-            LEFT JOIN (
-                SELECT profile_id, COUNT(*) as count
-                FROM activities 
-                WHERE type = 'book' AND quarter_id = $1
-                GROUP BY profile_id
-            ) books ON p.id = books.profile_id
-            LEFT JOIN (
-                SELECT profile_id, COUNT(*) as count
-                FROM activities 
-                WHERE type = 'opp' AND quarter_id = $1
-                GROUP BY profile_id
-            ) opps ON p.id = opps.profile_id
-            LEFT JOIN (
-                SELECT profile_id, COUNT(*) as count
-                FROM activities 
-                WHERE type = 'deal' AND quarter_id = $1
-                GROUP BY profile_id
-            ) deals ON p.id = deals.profile_id
-            LEFT JOIN (
-                SELECT profile_id, SUM(points) as points
-                FROM activities 
-                WHERE quarter_id = $1
-                GROUP BY profile_id
-            ) total ON p.id = total.profile_id
+            LEFT JOIN profile_counters c ON c.profile_id = p.id
             WHERE p.quarter_id = $1
             """,
             quarter['id']
@@ -310,24 +262,10 @@ async def get_player_detailed_stats(
             quarter['id'], player_name
         )
         
-        # Get player position
-        position_result = await conn.fetchrow(
-            """
-            WITH player_rankings AS (
-                SELECT p.name, 
-                       COALESCE(SUM(a.points), 0) as total_points,
-                       ROW_NUMBER() OVER (ORDER BY COALESCE(SUM(a.points), 0) DESC) as position
-                FROM profiles p
-                LEFT JOIN activities a ON p.id = a.profile_id AND a.quarter_id = $1
-                WHERE p.quarter_id = $1
-                GROUP BY p.id, p.name
-            )
-            SELECT position, COUNT(*) OVER() as total_players
-            FROM player_rankings
-            WHERE name = $2
-            """,
-            quarter['id'], player_name
-        )
+        # Get player position from the in-memory quarter rank index
+        rank_index = await rank_indexes.quarter(conn, quarter['id'])
+        current_position = rank_index.rank(player_name) or 1
+        total_players = max(1, len(rank_index))
         
         # Build response objects
         goal_points = calculate_goal_points(
@@ -432,34 +370,29 @@ async def get_player_detailed_stats(
                 is_completed=challenge['is_completed']
             ))
         
-        # Predictions
-        books_prediction = predict_days_to_goal(
-            player_profile['current_books'], player_profile['goal_books'], days_elapsed
-        )
-        opps_prediction = predict_days_to_goal(
-            player_profile['current_opps'], player_profile['goal_opps'], days_elapsed
-        )
-        deals_prediction = predict_days_to_goal(
-            player_profile['current_deals'], player_profile['goal_deals'], days_elapsed
-        )
-        points_prediction = predict_days_to_goal(
-            player_profile['current_points'], goal_points, days_elapsed
-        )
+        # Predictions from the online pace estimator (O(1) per metric)
+        pace = await profile_pace(conn, player_profile['id'])
+        goal_predictions = {
+            "books": predict(player_profile['current_books'], player_profile['goal_books'], pace.get("book"), today),
+            "opps": predict(player_profile['current_opps'], player_profile['goal_opps'], pace.get("opp"), today),
+            "deals": predict(player_profile['current_deals'], player_profile['goal_deals'], pace.get("deal"), today),
+            "points": predict(player_profile['current_points'], goal_points, pace.get("points"), today),
+        }
+        days_to_goal = {metric: p.days_to_goal for metric, p in goal_predictions.items()}
         
         predictions = TimeToGoalPrediction(
-            books_days_to_goal=books_prediction,
-            opps_days_to_goal=opps_prediction,
-            deals_days_to_goal=deals_prediction,
-            points_days_to_goal=points_prediction,
+            books_days_to_goal=days_to_goal["books"],
+            opps_days_to_goal=days_to_goal["opps"],
+            deals_days_to_goal=days_to_goal["deals"],
+            points_days_to_goal=days_to_goal["points"],
             likelihood_to_achieve_all=assess_likelihood(
-                books_prediction, opps_prediction, deals_prediction, points_prediction, days_remaining
-            )
-        )
-        
-        # Get total activities count
-        total_activities = await conn.fetchval(
-            "SELECT COUNT(*) FROM activities WHERE profile_id = $1 AND quarter_id = $2",
-            player_profile['id'], quarter['id']
+                days_to_goal["books"], days_to_goal["opps"], days_to_goal["deals"], days_to_goal["points"],
+                days_remaining
+            ),
+            confidence_bands={
+                metric: GoalPredictionBand(low_days=p.low_days, high_days=p.high_days, daily_rate=p.daily_rate)
+                for metric, p in goal_predictions.items()
+            }
         )
         
         return PlayerDetailedStatsResponse(
@@ -472,9 +405,9 @@ async def get_player_detailed_stats(
             recent_activities=recent_activities,
             active_challenges=active_challenges,
             predictions=predictions,
-            total_activities_count=total_activities or 0,
-            current_position=position_result['position'] if position_result else 1,
-            total_players=position_result['total_players'] if position_result else 1
+            total_activities_count=player_profile['activity_count'],
+            current_position=current_position,
+            total_players=total_players
         )
         
     except Exception as e:
@@ -7,16 +7,13 @@ from pydantic import BaseModel
 from typing import List
 import asyncpg
 import databutton as db
-from datetime import datetime, date, timedelta
+from app.libs.activity_rollup import ensure_activity_rollup
+from app.libs.profile_counters import ensure_profile_counters
+from app.libs.local_time import local_today
+from app.libs.workdays import quarter_workdays
 
 router = APIRouter(prefix="/players")
 
-# The 12 fixed named players for ES Oslo team
-NAMED_PLAYERS = [
-    "RIKKE", "SIGGEN", "GARD", "THEA", "ITHY", "EMILIE", 
-    "SCHOLZ", "HEFF", "KAREN", "TOBIAS", "ANDREAS", "SONDRE"
-]
-
 class PlayerProgress(BaseModel):
     id: int
     name: str
@@ -71,33 +68,6 @@ async def get_current_quarter():
     finally:
         await conn.close()
 
-async def ensure_named_players(quarter_id: int):
-    """Ensure all 12 named players exist in the current quarter"""
-    conn = await get_db_connection()
-    try:
-        for i, player_name in enumerate(NAMED_PLAYERS):
-            # Check if player exists by name for this quarter (avoid UUID issues)
-            existing = await conn.fetchval("""
-                SELECT id FROM profiles 
-                WHERE name = $1 AND quarter_id = $2
-            """, player_name, quarter_id)
-            
-            if not existing:
-                # Use deterministic UUID based on player name
-                import uuid
-                namespace = uuid.NAMESPACE_DNS
-                player_uuid = uuid.uuid5(namespace, f"es-oslo-{player_name.lower()}")
-                
-                # Create player with default goals
-                await conn.execute("""
-                    INSERT INTO profiles (user_id, quarter_id, name, points, goal_books, goal_opps, goal_deals)
-                    VALUES ($1, $2, $3, 0, 10, 5, 2)
-                """, player_uuid, quarter_id, player_name)
-                print(f"Created player {player_name} for quarter {quarter_id}")
-                
-    finally:
-        await conn.close()
-
 def calculate_avatar_state(progress_percentage: float) -> str:
     """Calculate avatar state based on goal completion percentage"""
     if progress_percentage >= 100:
@@ -109,30 +79,6 @@ def calculate_avatar_state(progress_percentage: float) -> str:
     else:
         return "damaged"
 
-def calculate_workdays_in_quarter(start_date: date, end_date: date) -> int:
-    """Calculate number of workdays (Monday-Friday) in a quarter"""
-    workdays = 0
-    current = start_date
-    while current <= end_date:
-        # Monday = 0, Sunday = 6
-        if current.weekday() < 5:  # Monday to Friday
-            workdays += 1
-        current = current + timedelta(days=1)
-    return workdays
-
-def calculate_workdays_passed(start_date: date, current_date: date) -> int:
-    """Calculate number of workdays passed from start of quarter to current date"""
-    if current_date < start_date:
-        return 0
-    
-    workdays = 0
-    current = start_date
-    while current < current_date:  # Not including today
-        if current.weekday() < 5:  # Monday to Friday
-            workdays += 1
-        current = current + timedelta(days=1)
-    return workdays
-
 @router.get("/daily-progress", response_model=DailyPlayersResponse)
 async def get_players_daily_progress():
     """
@@ -144,9 +90,6 @@ async def get_players_daily_progress():
         if not quarter:
             raise HTTPException(status_code=400, detail="No active quarter found")
             
-        # Ensure all named players exist
-        await ensure_named_players(quarter['id'])
-        
         conn = await get_db_connection()
         try:
             # Get quarter details for workday calculations
@@ -159,15 +102,17 @@ async def get_players_daily_progress():
             if not quarter_details:
                 raise HTTPException(status_code=400, detail="Quarter details not found")
             
-            # Calculate workdays
+            # Calculate workdays (weekdays minus Norwegian holidays)
             start_date = quarter_details['start_date']
             end_date = quarter_details['end_date']
-            today = date.today()
+            today = local_today()
             
-            workdays_in_quarter = calculate_workdays_in_quarter(start_date, end_date)
-            workdays_passed = calculate_workdays_passed(start_date, today)
+            workdays = quarter_workdays(start_date, end_date, today)
+            workdays_in_quarter = workdays.total
+            workdays_passed = workdays.passed
             
-            # Get today's activities and quarter goals for all players
+            # Get today's rollup buckets and quarter goals for all players
+            await ensure_activity_rollup(conn)
             players_data = await conn.fetch("""
                 SELECT 
                     p.id,
@@ -175,10 +120,10 @@ async def get_players_daily_progress():
                     p.goal_books,
                     p.goal_opps,
                     p.goal_deals,
-                    COALESCE(SUM(CASE WHEN DATE(a.created_at) = $2 THEN a.points ELSE 0 END), 0) as daily_points,
-                    COALESCE(COUNT(CASE WHEN DATE(a.created_at) = $2 THEN a.id ELSE NULL END), 0) as daily_activities_count
+                    COALESCE(SUM(r.points), 0) as daily_points,
+                    COALESCE(SUM(r.activity_count), 0) as daily_activities_count
                 FROM profiles p
-                LEFT JOIN activities a ON p.id = a.profile_id
+                LEFT JOIN activity_daily_rollup r ON r.profile_id = p.id AND r.local_date = $2
                 WHERE p.quarter_id = $1
                 GROUP BY p.id, p.name, p.goal_books, p.goal_opps, p.goal_deals
                 ORDER BY daily_points DESC, p.name
@@ -248,12 +193,10 @@ async def get_players_progress():
         if not quarter:
             raise HTTPException(status_code=400, detail="No active quarter found")
             
-        # Ensure all named players exist
-        await ensure_named_players(quarter['id'])
-        
         conn = await get_db_connection()
         try:
-            # Get all players with their stats
+            # Get all players with their stats (activity count from the per-profile counters)
+            await ensure_profile_counters(conn)
             players_data = await conn.fetch("""
                 SELECT 
                     p.id,
@@ -262,11 +205,10 @@ async def get_players_progress():
                     p.goal_books,
                     p.goal_opps,
                     p.goal_deals,
-                    COALESCE(COUNT(a.id), 0) as activities_count
+                    COALESCE(c.activity_count, 0) as activities_count
                 FROM profiles p
-                LEFT JOIN activities a ON p.id = a.profile_id
+                LEFT JOIN profile_counters c ON c.profile_id = p.id
                 WHERE p.quarter_id = $1
-                GROUP BY p.id, p.name, p.points, p.goal_books, p.goal_opps, p.goal_deals
                 ORDER BY p.points DESC, p.name
             """, quarter['id'])
             
@@ -339,24 +281,21 @@ async def get_leaderboard(period: str = "daily", response: Response = None) -> d
                 "error": "No active quarter found"
             }
             
-        # Ensure all named players exist
-        await ensure_named_players(quarter['id'])
-        
         conn = await get_db_connection()
         try:
             if period == "daily":
-                # Get today's points only
-                from datetime import date
-                today = date.today()
+                # Get today's points only (Oslo day)
+                today = local_today()
                 
+                await ensure_activity_rollup(conn)
                 top_players = await conn.fetch("""
-                    SELECT p.name, COALESCE(SUM(a.points), 0) as points
+                    SELECT p.name, COALESCE(SUM(r.points), 0) as points
                     FROM profiles p
-                    LEFT JOIN activities a ON p.id = a.profile_id 
-                        AND DATE(a.created_at) = $2
+                    LEFT JOIN activity_daily_rollup r ON r.profile_id = p.id
+                        AND r.local_date = $2
                     WHERE p.quarter_id = $1 
                     GROUP BY p.name
-                    ORDER BY COALESCE(SUM(a.points), 0) DESC, p.name
+                    ORDER BY COALESCE(SUM(r.points), 0) DESC, p.name
                     LIMIT 12
                 """, quarter['id'], today)
                 
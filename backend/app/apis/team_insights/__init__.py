@@ -6,6 +6,13 @@ from datetime import datetime, timedelta
 import asyncpg
 import databutton as db
 from app.env import mode, Mode
+from app.libs.activity_rollup import ensure_activity_rollup
+from app.libs.activity_heatmap import hour_of_week_counts
+from app.libs.timeseries import dense_daily, day_labels, weekly_buckets, cumulative, downsample
+from app.libs.streaks import profile_streaks, team_streak, live_streak
+from app.libs.local_time import local_today
+from app.libs.forecast import quarter_forecast
+from app.libs.workdays import quarter_workdays
 from openai import OpenAI
 import json
 
@@ -84,6 +91,8 @@ class StreaksResponse(BaseModel):
     streaks: List[StreakData]
     team_best_streak: int
     team_best_player: str
+    team_current_streak: int = 0  # workday-aware run of days with any team activity
+    team_longest_streak: int = 0
 
 class Highlight(BaseModel):
     type: str  # "new_high", "milestone", "gap_analysis"
@@ -127,6 +136,19 @@ class ForecastBreakdown(BaseModel):
     total_quarter_days: int
     quarter_name: str
     quarter_progress_percent: float
+    # Monte Carlo spread of the quarter-end total (projected_total is p50)
+    p10: Optional[int] = None
+    p90: Optional[int] = None
+    goal: Optional[int] = None
+    goal_probability: Optional[float] = None
+
+class PlayerGoalProbability(BaseModel):
+    """Chance that a player reaches each of their goals by quarter end"""
+    name: str
+    books: float
+    opps: float
+    deals: float
+    points: float
 
 class DetailedForecastResponse(BaseModel):
     """Detailed forecast calculations for popup display"""
@@ -136,6 +158,14 @@ class DetailedForecastResponse(BaseModel):
     quarter_info: Dict[str, Any]
     breakdown: List[ForecastBreakdown]
     calculation_method: str
+    points_forecast: Optional[ForecastBreakdown] = None
+    player_goal_probabilities: List[PlayerGoalProbability] = []
+    simulations: int = 0
+    remaining_workdays: Optional[int] = None
+
+def calculate_goal_points(books: int, opps: int, deals: int) -> int:
+    """Calculate total goal points based on activity targets"""
+    return books * 1 + opps * 2 + deals * 5
 
 # Simple in-memory cache for AI insights
 _insights_cache = {}
@@ -296,14 +326,14 @@ async def _collect_team_data(team_id: Optional[int], range_days: int) -> Dict[st
         # Get trend data for quarter period
         trend_query = """
             SELECT 
-                DATE(a.created_at) as date,
+                a.local_date as date,
                 COUNT(*) as daily_activities
             FROM activities a
             JOIN profiles p ON a.profile_id = p.id
             JOIN quarters q ON a.quarter_id = q.id
             WHERE q.is_active = true
             AND a.created_at >= $1
-            GROUP BY DATE(a.created_at)
+            GROUP BY a.local_date
             ORDER BY date
         """
         trend_data = await conn.fetch(trend_query, start_date - timedelta(days=7))
@@ -500,26 +530,22 @@ async def get_team_insights_summary(
             start_date_obj = datetime.strptime(start_date, '%Y-%m-%d').date()
             end_date_obj = datetime.strptime(end_date, '%Y-%m-%d').date()
         
-        # Calculate date ranges for datetime queries
-        start_datetime = datetime.combine(start_date_obj, datetime.min.time())
-        end_datetime = datetime.combine(end_date_obj, datetime.max.time())
-        
-        # Get current period data
+        # Get current period data from the daily rollup
+        await ensure_activity_rollup(conn)
         current_query = """
             SELECT 
-                a.type,
-                COUNT(*) as count,
-                SUM(a.points) as total_points
-            FROM activities a
-            JOIN profiles p ON a.profile_id = p.id
-            JOIN quarters q ON a.quarter_id = q.id
+                r.activity_type as type,
+                SUM(r.activity_count) as count,
+                SUM(r.points) as total_points
+            FROM activity_daily_rollup r
+            JOIN quarters q ON r.quarter_id = q.id
             WHERE q.is_active = true
-            AND a.created_at >= $1
-            AND a.created_at <= $2
-            GROUP BY a.type
+            AND r.local_date >= $1
+            AND r.local_date <= $2
+            GROUP BY r.activity_type
         """
         
-        current_data = await conn.fetch(current_query, start_datetime, end_datetime)
+        current_data = await conn.fetch(current_query, start_date_obj, end_date_obj)
         
         # Process current data
         kpis = {"books": 0, "opps": 0, "deals": 0, "forecast": 0}
@@ -549,10 +575,7 @@ async def get_team_insights_summary(
             prev_start = start_date_obj - timedelta(days=prev_period_days)
             prev_end = start_date_obj - timedelta(days=1)
             
-            prev_start_datetime = datetime.combine(prev_start, datetime.min.time())
-            prev_end_datetime = datetime.combine(prev_end, datetime.max.time())
-            
-            prev_data = await conn.fetch(current_query, prev_start_datetime, prev_end_datetime)
+            prev_data = await conn.fetch(current_query, prev_start, prev_end)
             
             prev_kpis = {"books": 0, "opps": 0, "deals": 0}
             for row in prev_data:
@@ -644,74 +667,38 @@ async def get_team_insights_timeseries(
             start_date_obj = datetime.strptime(start_date, '%Y-%m-%d').date()
             end_date_obj = datetime.strptime(end_date, '%Y-%m-%d').date()
         
-        # Calculate date ranges for datetime queries
-        start_datetime = datetime.combine(start_date_obj, datetime.min.time())
-        end_datetime = datetime.combine(end_date_obj, datetime.max.time())
-        
-        if interval == "daily":
-            query = """
-                SELECT 
-                    DATE(a.created_at) as activity_date,
-                    COUNT(*) as count
-                FROM activities a
-                JOIN profiles p ON a.profile_id = p.id
-                JOIN quarters q ON a.quarter_id = q.id
-                WHERE q.is_active = true
-                AND a.type = $1
-                AND a.created_at >= $2
-                AND a.created_at <= $3
-                GROUP BY DATE(a.created_at)
-                ORDER BY activity_date
-            """
-        else:
-            # Weekly aggregation
-            query = """
-                SELECT 
-                    DATE_TRUNC('week', a.created_at)::date as activity_date,
-                    COUNT(*) as count
-                FROM activities a
-                JOIN profiles p ON a.profile_id = p.id
-                JOIN quarters q ON a.quarter_id = q.id
-                WHERE q.is_active = true
-                AND a.type = $1
-                AND a.created_at >= $2
-                AND a.created_at <= $3
-                GROUP BY DATE_TRUNC('week', a.created_at)
-                ORDER BY activity_date
-            """
-        
-        data = await conn.fetch(query, db_metric, start_datetime, end_datetime)
-        
-        # Process data and calculate cumulative
-        timeseries = []
-        cumulative = 0
-        
-        # Fill in missing dates with zero values if interval is daily
+        # Read per-day buckets from the daily rollup; weeks are summed in Python
+        await ensure_activity_rollup(conn)
+        data = await conn.fetch("""
+            SELECT 
+                r.local_date as activity_date,
+                SUM(r.activity_count) as count
+            FROM activity_daily_rollup r
+            JOIN quarters q ON r.quarter_id = q.id
+            WHERE q.is_active = true
+            AND r.activity_type = $1
+            AND r.local_date >= $2
+            AND r.local_date <= $3
+            GROUP BY r.local_date
+        """, db_metric, start_date_obj, end_date_obj)
+        
+        # Dense daily series (missing days are zero) and its running total
+        values = dense_daily(data, start_date_obj, end_date_obj, "activity_date", "count")
         if interval == "daily":
-            current_date = start_date_obj
-            while current_date <= end_date_obj:
-                day_count = 0
-                for row in data:
-                    if row['activity_date'] == current_date:
-                        day_count = row['count']
-                        break
-                
-                cumulative += day_count
-                timeseries.append({
-                    "date": current_date.strftime('%Y-%m-%d'),
-                    "value": day_count,
-                    "cumulative": cumulative
-                })
-                current_date += timedelta(days=1)
+            labels = day_labels(start_date_obj, len(values))
         else:
-            # Weekly aggregation
-            for row in data:
-                cumulative += row['count']
-                timeseries.append({
-                    "date": row['activity_date'].strftime('%Y-%m-%d'),
-                    "value": row['count'],
-                    "cumulative": cumulative
-                })
+            labels, values = weekly_buckets(values, start_date_obj)
+        totals = cumulative(values)
+        
+        # Long ranges are downsampled for the chart; totals stay exact
+        timeseries = [
+            {
+                "date": labels[i].strftime('%Y-%m-%d'),
+                "value": int(values[i]),
+                "cumulative": int(totals[i])
+            }
+            for i in downsample(values)
+        ]
         
         return TimeseriesResponse(
             metric=metric,
@@ -825,34 +812,19 @@ async def get_team_insights_heatmap(
     start_date: Optional[str] = Query(None, description="Start date (YYYY-MM-DD)"),
     end_date: Optional[str] = Query(None, description="End date (YYYY-MM-DD)")
 ):
-    """Get activity heatmap by day of week and hour."""
+    """Get activity heatmap by day of week and hour (Europe/Oslo).
+
+    Without dates the whole active quarter is shown, read from the
+    hour-of-week counters.
+    """
     conn = await get_db_connection()
     
     try:
-        # Default to last 30 days if no dates provided
-        if not start_date or not end_date:
-            end_dt = datetime.now()
-            start_dt = end_dt - timedelta(days=30)
-        else:
-            start_dt = datetime.fromisoformat(start_date)
-            end_dt = datetime.fromisoformat(end_date)
-        
-        query = """
-            SELECT 
-                EXTRACT(DOW FROM a.created_at) as dow,
-                EXTRACT(HOUR FROM a.created_at) as hour,
-                COUNT(*) as activity_count
-            FROM activities a
-            JOIN profiles p ON a.profile_id = p.id
-            JOIN quarters q ON a.quarter_id = q.id
-            WHERE q.is_active = true
-            AND a.created_at >= $1
-            AND a.created_at <= $2
-            GROUP BY EXTRACT(DOW FROM a.created_at), EXTRACT(HOUR FROM a.created_at)
-            ORDER BY dow, hour
-        """
+        start_d = datetime.fromisoformat(start_date).date() if start_date and end_date else None
+        end_d = datetime.fromisoformat(end_date).date() if start_date and end_date else None
         
-        data = await conn.fetch(query, start_dt, end_dt)
+        members = await get_team_members(conn, team_id)
+        counts = await hour_of_week_counts(conn, [m['id'] for m in members], start=start_d, end=end_d)
         
         # Convert to heatmap format
         days = ['Sunday', 'Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday']
@@ -861,11 +833,7 @@ async def get_team_insights_heatmap(
         best_slot = None
         best_count = 0
         
-        for row in data:
-            dow = int(row['dow'])
-            hour = int(row['hour'])
-            count = row['activity_count']
-            
+        for (dow, hour), count in sorted(counts.items()):
             if count > best_count:
                 best_count = count
                 best_slot = (days[dow], hour)
@@ -905,88 +873,42 @@ async def get_team_insights_streaks(
     conn = await get_db_connection()
     
     try:
-        # If no start/end dates provided, use active quarter
-        if not start_date or not end_date:
-            quarter_query = """
-                SELECT start_date, end_date 
-                FROM quarters 
-                WHERE is_active = true
-                LIMIT 1
-            """
-            quarter_data = await conn.fetchrow(quarter_query)
-            
-            if quarter_data:
-                # Use active quarter dates
-                start_date_obj = quarter_data['start_date']
-                end_date_obj = quarter_data['end_date']
-            else:
-                # Fallback to range_days if no active quarter
-                end_date_obj = datetime.now().date()
-                start_date_obj = end_date_obj - timedelta(days=range_days)
-        else:
-            # Use provided dates
-            start_date_obj = datetime.strptime(start_date, '%Y-%m-%d').date()
-            end_date_obj = datetime.strptime(end_date, '%Y-%m-%d').date()
-        
-        # Calculate date ranges for datetime queries
-        start_datetime = datetime.combine(start_date_obj, datetime.min.time())
-        end_datetime = datetime.combine(end_date_obj, datetime.max.time())
-        
-        # For simplicity, we'll calculate streaks based on consecutive days with activities
-        # This is a simplified version - a full implementation would track different streak types
-        
-        query = """
-            SELECT 
-                p.name as player_name,
-                DATE(a.created_at) as activity_date,
-                COUNT(*) as daily_activities
-            FROM activities a
-            JOIN profiles p ON a.profile_id = p.id
-            JOIN quarters q ON a.quarter_id = q.id
-            WHERE q.is_active = true
-            AND a.created_at >= $1
-            AND a.created_at <= $2
-            GROUP BY p.name, DATE(a.created_at)
-            ORDER BY p.name, activity_date
-        """
-        
-        data = await conn.fetch(query, start_datetime, end_datetime)
-        
-        # Calculate streaks (simplified)
-        player_streaks = {}
-        current_streaks = {}
-        
-        for row in data:
-            player = row['player_name']
-            if player not in player_streaks:
-                player_streaks[player] = {'current': 1, 'longest': 1}
-                current_streaks[player] = 1
-            else:
-                current_streaks[player] += 1
-                player_streaks[player]['current'] = current_streaks[player]
-                player_streaks[player]['longest'] = max(player_streaks[player]['longest'], current_streaks[player])
+        # Streaks are tracked per profile (the active quarter) and for the team;
+        # the date range does not narrow them
+        members = await get_team_members(conn, team_id)
+        stored = await profile_streaks(conn, [m['id'] for m in members])
+        today = local_today()
         
-        # Convert to response format
         streaks = []
         team_best_streak = 0
         team_best_player = ""
         
-        for player, streak_data in player_streaks.items():
-            if streak_data['longest'] > team_best_streak:
-                team_best_streak = streak_data['longest']
-                team_best_player = player
+        for member in sorted(members, key=lambda m: m['name']):
+            row = stored.get(member['id'])
+            if not row:
+                continue
+            if row['longest_streak'] > team_best_streak:
+                team_best_streak = row['longest_streak']
+                team_best_player = member['name']
             
             streaks.append(StreakData(
-                player_name=player,
-                current_streak=streak_data['current'],
-                longest_streak=streak_data['longest'],
+                player_name=member['name'],
+                current_streak=live_streak(row['current_streak'], row['last_local_date'], today),
+                longest_streak=row['longest_streak'],
                 streak_type="activities"
             ))
         
+        team_row = None
+        quarter_id = await conn.fetchval("SELECT id FROM quarters WHERE is_active = true LIMIT 1")
+        if quarter_id:
+            team_row = await team_streak(conn, quarter_id)
+        
         return StreaksResponse(
             streaks=streaks,
             team_best_streak=team_best_streak,
-            team_best_player=team_best_player
+            team_best_player=team_best_player,
+            team_current_streak=live_streak(team_row['current_streak'], team_row['last_local_date'], today) if team_row else 0,
+            team_longest_streak=team_row['longest_streak'] if team_row else 0
         )
         
     finally:
@@ -1132,51 +1054,43 @@ async def get_forecast_breakdown(
         # Calculate quarter metrics
         days_elapsed = max(1, (today - quarter_start).days + 1)
         total_quarter_days = (quarter_end - quarter_start).days + 1
-        quarter_progress = (days_elapsed / total_quarter_days) * 100
-        
-        # Get current activity data
-        activity_query = """
-            SELECT 
-                type,
-                COUNT(*) as count
-            FROM activities a
-            JOIN profiles p ON a.profile_id = p.id
-            WHERE a.quarter_id = $1
-            GROUP BY type
-            ORDER BY type
-        """
+        workdays = quarter_workdays(quarter_start, quarter_end, today)
+        quarter_progress = workdays.progress * 100
         
-        activity_data = await conn.fetch(activity_query, quarter_info['id'])
+        # Monte Carlo quarter-end outcomes (cached per quarter and data version)
+        forecast = await quarter_forecast(conn, quarter_info, calculate_goal_points)
         
         # Process data and calculate forecasts
         breakdown = []
         total_current = 0
         total_forecast = 0
         
-        activity_types = ['book', 'opp', 'deal']
-        activity_labels = {'book': 'Books', 'opp': 'Opportunities', 'deal': 'Deals'}
-        
-        # Create lookup for current data
-        current_counts = {row['type']: row['count'] for row in activity_data}
+        activity_labels = {'books': 'Books', 'opps': 'Opportunities', 'deals': 'Deals', 'points': 'Points'}
         
-        for activity_type in activity_types:
-            current_count = current_counts.get(activity_type, 0)
+        def forecast_breakdown(metric: str) -> ForecastBreakdown:
+            outcome = forecast['team'][metric]
+            current_count = outcome['current']
             daily_rate = current_count / days_elapsed if days_elapsed > 0 else 0
-            projected_total = int(daily_rate * total_quarter_days) if daily_rate > 0 else current_count
-            
-            breakdown.append(ForecastBreakdown(
-                activity_type=activity_labels[activity_type],
+            return ForecastBreakdown(
+                activity_type=activity_labels[metric],
                 current_count=current_count,
                 daily_rate=round(daily_rate, 2),
-                projected_total=projected_total,
+                projected_total=int(outcome['p50']),
                 days_elapsed=days_elapsed,
                 total_quarter_days=total_quarter_days,
                 quarter_name=quarter_info['name'],
-                quarter_progress_percent=round(quarter_progress, 1)
-            ))
-            
-            total_current += current_count
-            total_forecast += projected_total
+                quarter_progress_percent=round(quarter_progress, 1),
+                p10=int(outcome['p10']),
+                p90=int(outcome['p90']),
+                goal=outcome['goal'],
+                goal_probability=round(outcome['goal_probability'], 3)
+            )
+        
+        for metric in ('books', 'opps', 'deals'):
+            item = forecast_breakdown(metric)
+            breakdown.append(item)
+            total_current += item.current_count
+            total_forecast += item.projected_total
         
         total_daily_rate = total_current / days_elapsed if days_elapsed > 0 else 0
         
@@ -1190,10 +1104,22 @@ async def get_forecast_breakdown(
                 'end_date': quarter_end.isoformat(),
                 'days_elapsed': days_elapsed,
                 'total_days': total_quarter_days,
+                'workdays_passed': workdays.passed,
+                'total_workdays': workdays.total,
                 'progress_percent': round(quarter_progress, 1)
             },
             breakdown=breakdown,
-            calculation_method="quarter_based"
+            calculation_method="monte_carlo",
+            points_forecast=forecast_breakdown('points'),
+            player_goal_probabilities=[
+                PlayerGoalProbability(
+                    name=player['name'],
+                    **{metric: round(p, 3) for metric, p in player['goal_probability'].items()}
+                )
+                for player in forecast['players']
+            ],
+            simulations=forecast['simulations'],
+            remaining_workdays=forecast['remaining_workdays']
         )
         
     finally:
@@ -0,0 +1,183 @@
+# Hour-of-Week Activity Heatmap
+# activity_hour_of_week counts activities per (profile, activity_type, dow,
+# hour_local) in Oslo local time (activities.local_date / local_hour),
+# maintained by a trigger on activities like the daily rollup. Heatmaps
+# covering whole quarters read at most 168 x types rows per profile; narrower
+# date ranges fall back to an indexed local_date scan of the range, so team and
+# player heatmaps always agree.
+
+from typing import Dict, List, Optional, Tuple
+from datetime import date
+
+import asyncpg
+
+from app.libs.local_time import ensure_local_time_columns
+
+HEATMAP_LOCK_KEY = 0x0A11E
+
+HEATMAP_DDL = """
+    CREATE TABLE IF NOT EXISTS activity_hour_of_week (
+        profile_id INTEGER NOT NULL,
+        activity_type TEXT NOT NULL,
+        dow SMALLINT NOT NULL,
+        hour_local SMALLINT NOT NULL,
+        activity_count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (profile_id, activity_type, dow, hour_local)
+    );
+
+    CREATE OR REPLACE FUNCTION activity_hour_of_week_apply() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP IN ('DELETE', 'UPDATE') THEN
+            UPDATE activity_hour_of_week
+               SET activity_count = activity_count - 1
+             WHERE profile_id = OLD.profile_id
+               AND activity_type = OLD.type::text
+               AND dow = EXTRACT(DOW FROM OLD.local_date)
+               AND hour_local = OLD.local_hour;
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            INSERT INTO activity_hour_of_week (profile_id, activity_type, dow, hour_local, activity_count)
+            VALUES (NEW.profile_id, NEW.type::text, EXTRACT(DOW FROM NEW.local_date), NEW.local_hour, 1)
+            ON CONFLICT (profile_id, activity_type, dow, hour_local) DO UPDATE
+               SET activity_count = activity_hour_of_week.activity_count + 1;
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql;
+
+    DO $$
+    BEGIN
+        IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'activities_hour_of_week') THEN
+            CREATE TRIGGER activities_hour_of_week
+            AFTER INSERT OR DELETE OR UPDATE OF created_at, profile_id, type ON activities
+            FOR EACH ROW EXECUTE FUNCTION activity_hour_of_week_apply();
+        END IF;
+    END
+    $$;
+"""
+
+# Counters as they should be, from raw activities
+ACTUAL_HEATMAP_SQL = """
+    SELECT profile_id,
+           type::text AS activity_type,
+           EXTRACT(DOW FROM local_date)::smallint AS dow,
+           local_hour AS hour_local,
+           COUNT(*)::int AS activity_count
+    FROM activities
+    GROUP BY 1, 2, 3, 4
+"""
+
+# Add actual minus stored to every drifted counter, both read in one snapshot
+# (see REPAIR_ROLLUP_SQL); returns the number of counters corrected
+REPAIR_HEATMAP_SQL = f"""
+    WITH actual AS ({ACTUAL_HEATMAP_SQL}),
+    drift AS (
+        SELECT profile_id, activity_type, dow, hour_local,
+               COALESCE(a.activity_count, 0) - COALESCE(s.activity_count, 0) AS activity_count
+        FROM actual a
+        FULL JOIN activity_hour_of_week s USING (profile_id, activity_type, dow, hour_local)
+        WHERE COALESCE(a.activity_count, 0) <> COALESCE(s.activity_count, 0)
+    ), fixed AS (
+        INSERT INTO activity_hour_of_week AS h (profile_id, activity_type, dow, hour_local, activity_count)
+        SELECT profile_id, activity_type, dow, hour_local, activity_count
+        FROM drift
+        ON CONFLICT (profile_id, activity_type, dow, hour_local) DO UPDATE
+           SET activity_count = h.activity_count + EXCLUDED.activity_count
+        RETURNING 1
+    )
+    SELECT COUNT(*) FROM fixed
+"""
+
+_schema_ready = False
+
+
+async def ensure_heatmap_table(conn: asyncpg.Connection):
+    """Create the counter table and trigger once per process, backfilling on first creation"""
+    global _schema_ready
+    if _schema_ready:
+        return
+    await ensure_local_time_columns(conn)
+    async with conn.transaction():
+        await conn.execute("SELECT pg_advisory_xact_lock($1)", HEATMAP_LOCK_KEY)
+        created = await conn.fetchval("SELECT to_regclass('activity_hour_of_week') IS NULL")
+        await conn.execute(HEATMAP_DDL)
+        if created:
+            await _rebuild(conn)
+    _schema_ready = True
+
+
+async def _rebuild(conn: asyncpg.Connection):
+    # First creation only; SHARE mode keeps writers out until the backfill commits
+    await conn.execute("LOCK TABLE activities IN SHARE MODE")
+    await conn.execute("DELETE FROM activity_hour_of_week")
+    await conn.execute(
+        f"""
+        INSERT INTO activity_hour_of_week (profile_id, activity_type, dow, hour_local, activity_count)
+        {ACTUAL_HEATMAP_SQL}
+        """
+    )
+
+
+async def repair_heatmap(conn: asyncpg.Connection) -> int:
+    """Correct counters that drifted from raw activities; returns drifted rows"""
+    await ensure_heatmap_table(conn)
+    async with conn.transaction():
+        drift = await conn.fetchval(REPAIR_HEATMAP_SQL)
+        await conn.execute("DELETE FROM activity_hour_of_week WHERE activity_count = 0")
+    return drift
+
+
+async def hour_of_week_counts(
+    conn: asyncpg.Connection,
+    profile_ids: List[int],
+    activity_types: Optional[List[str]] = None,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+) -> Dict[Tuple[int, int], int]:
+    """Activity counts keyed by (dow, hour) in Oslo local time; dow 0 = Sunday.
+
+    Uses the counters when there is no date range or the range covers the
+    quarters the profiles belong to; otherwise scans the range.
+    """
+    if not profile_ids:
+        return {}
+    use_counters = start is None or end is None
+    if not use_counters:
+        bounds = await conn.fetchrow(
+            """
+            SELECT MIN(q.start_date) AS start_date, MAX(q.end_date) AS end_date
+            FROM profiles p JOIN quarters q ON p.quarter_id = q.id
+            WHERE p.id = ANY($1::int[])
+            """,
+            profile_ids,
+        )
+        use_counters = bool(bounds and bounds["start_date"] and start <= bounds["start_date"] and end >= bounds["end_date"])
+
+    if use_counters:
+        await ensure_heatmap_table(conn)
+        rows = await conn.fetch(
+            """
+            SELECT dow, hour_local AS hour, SUM(activity_count)::int AS activity_count
+            FROM activity_hour_of_week
+            WHERE profile_id = ANY($1::int[])
+              AND ($2::text[] IS NULL OR activity_type = ANY($2::text[]))
+            GROUP BY dow, hour_local
+            """,
+            profile_ids, activity_types,
+        )
+    else:
+        rows = await conn.fetch(
+            """
+            SELECT EXTRACT(DOW FROM local_date)::int AS dow,
+                   local_hour::int AS hour,
+                   COUNT(*)::int AS activity_count
+            FROM activities
+            WHERE profile_id = ANY($1::int[])
+              AND ($2::text[] IS NULL OR type::text = ANY($2::text[]))
+              AND local_date >= $3
+              AND local_date <= $4
+            GROUP BY 1, 2
+            """,
+            profile_ids, activity_types, start, end,
+        )
+    return {(int(r["dow"]), int(r["hour"])): r["activity_count"] for r in rows if r["activity_count"]}
@@ -0,0 +1,164 @@
+# Daily Activity Rollup
+# activity_daily_rollup holds one row per (local_date, profile, activity_type)
+# with the activity count and points, so dashboards and insights read
+# O(days x players) rows instead of rescanning a quarter of raw activities.
+# A trigger on activities keeps it current on insert, update and delete, and
+# the nightly repair job corrects buckets that drift from the raw table.
+# Days are Oslo-local, taken from the stored activities.local_date column.
+
+from typing import Optional
+
+import asyncpg
+
+from app.libs.local_time import ensure_local_time_columns
+
+# Serialises first-time creation across workers
+ROLLUP_LOCK_KEY = 0x0A11D
+
+ROLLUP_DDL = """
+    CREATE TABLE IF NOT EXISTS activity_daily_rollup (
+        local_date DATE NOT NULL,
+        profile_id INTEGER NOT NULL,
+        activity_type TEXT NOT NULL,
+        quarter_id INTEGER NOT NULL,
+        activity_count INTEGER NOT NULL DEFAULT 0,
+        points INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (local_date, profile_id, activity_type)
+    );
+    CREATE INDEX IF NOT EXISTS idx_activity_daily_rollup_quarter
+        ON activity_daily_rollup (quarter_id, local_date);
+    CREATE INDEX IF NOT EXISTS idx_activity_daily_rollup_profile
+        ON activity_daily_rollup (profile_id, local_date);
+
+    CREATE OR REPLACE FUNCTION activity_daily_rollup_apply() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP IN ('DELETE', 'UPDATE') THEN
+            UPDATE activity_daily_rollup
+               SET activity_count = activity_count - 1,
+                   points = points - COALESCE(OLD.points, 0)
+             WHERE local_date = OLD.local_date
+               AND profile_id = OLD.profile_id
+               AND activity_type = OLD.type::text;
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            INSERT INTO activity_daily_rollup (local_date, profile_id, activity_type, quarter_id, activity_count, points)
+            VALUES (NEW.local_date, NEW.profile_id, NEW.type::text,
+                    NEW.quarter_id, 1, COALESCE(NEW.points, 0))
+            ON CONFLICT (local_date, profile_id, activity_type) DO UPDATE
+               SET activity_count = activity_daily_rollup.activity_count + 1,
+                   points = activity_daily_rollup.points + EXCLUDED.points;
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql;
+
+    DO $$
+    BEGIN
+        IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'activities_daily_rollup') THEN
+            CREATE TRIGGER activities_daily_rollup
+            AFTER INSERT OR DELETE OR UPDATE OF created_at, profile_id, type, points ON activities
+            FOR EACH ROW EXECUTE FUNCTION activity_daily_rollup_apply();
+        END IF;
+    END
+    $$;
+"""
+
+# The rollup as it should be, computed from raw activities ($1 = quarter or NULL)
+ACTUAL_ROLLUP_SQL = """
+    SELECT local_date,
+           profile_id,
+           type::text AS activity_type,
+           MIN(quarter_id) AS quarter_id,
+           COUNT(*)::int AS activity_count,
+           COALESCE(SUM(points), 0)::int AS points
+    FROM activities
+    WHERE $1::int IS NULL OR quarter_id = $1
+    GROUP BY 1, 2, 3
+"""
+
+# Add the difference between actual and stored to every drifted bucket. Both
+# sides come from one statement snapshot and the trigger applies increments,
+# so the correction composes with writes committed meanwhile and activities
+# need no table lock. Returns the number of buckets corrected.
+REPAIR_ROLLUP_SQL = f"""
+    WITH actual AS ({ACTUAL_ROLLUP_SQL}),
+    stored AS (
+        SELECT local_date, profile_id, activity_type, quarter_id, activity_count, points
+        FROM activity_daily_rollup
+        WHERE $1::int IS NULL OR quarter_id = $1
+    ), drift AS (
+        SELECT local_date, profile_id, activity_type,
+               COALESCE(a.quarter_id, s.quarter_id) AS quarter_id,
+               COALESCE(a.activity_count, 0) - COALESCE(s.activity_count, 0) AS activity_count,
+               COALESCE(a.points, 0) - COALESCE(s.points, 0) AS points
+        FROM actual a
+        FULL JOIN stored s USING (local_date, profile_id, activity_type)
+        WHERE COALESCE(a.activity_count, 0) <> COALESCE(s.activity_count, 0)
+           OR COALESCE(a.points, 0) <> COALESCE(s.points, 0)
+           OR a.quarter_id <> s.quarter_id
+    ), fixed AS (
+        INSERT INTO activity_daily_rollup AS r (local_date, profile_id, activity_type, quarter_id, activity_count, points)
+        SELECT local_date, profile_id, activity_type, quarter_id, activity_count, points
+        FROM drift
+        ON CONFLICT (local_date, profile_id, activity_type) DO UPDATE
+           SET activity_count = r.activity_count + EXCLUDED.activity_count,
+               points = r.points + EXCLUDED.points,
+               quarter_id = EXCLUDED.quarter_id
+        RETURNING 1
+    )
+    SELECT COUNT(*) FROM fixed
+"""
+
+_schema_ready = False
+
+
+async def ensure_activity_rollup(conn: asyncpg.Connection):
+    """Create the rollup table and trigger once per process, backfilling on first creation"""
+    global _schema_ready
+    if _schema_ready:
+        return
+    await ensure_local_time_columns(conn)
+    async with conn.transaction():
+        await conn.execute("SELECT pg_advisory_xact_lock($1)", ROLLUP_LOCK_KEY)
+        created = await conn.fetchval("SELECT to_regclass('activity_daily_rollup') IS NULL")
+        await conn.execute(ROLLUP_DDL)
+        if created:
+            await _rebuild(conn, None)
+    _schema_ready = True
+
+
+async def _rebuild(conn: asyncpg.Connection, quarter_id: Optional[int]):
+    # First creation only: the caller's transaction just created the trigger,
+    # and SHARE mode keeps writers out until the backfill commits
+    await conn.execute("LOCK TABLE activities IN SHARE MODE")
+    await conn.execute(
+        "DELETE FROM activity_daily_rollup WHERE $1::int IS NULL OR quarter_id = $1",
+        quarter_id,
+    )
+    await conn.execute(
+        f"""
+        INSERT INTO activity_daily_rollup (local_date, profile_id, activity_type, quarter_id, activity_count, points)
+        SELECT local_date, profile_id, activity_type, quarter_id, activity_count, points
+        FROM ({ACTUAL_ROLLUP_SQL}) actual
+        ON CONFLICT (local_date, profile_id, activity_type) DO UPDATE
+           SET activity_count = EXCLUDED.activity_count, points = EXCLUDED.points, quarter_id = EXCLUDED.quarter_id
+        """,
+        quarter_id,
+    )
+
+
+async def repair_activity_rollup(conn: asyncpg.Connection, quarter_id: Optional[int] = None) -> int:
+    """Correct rollup buckets that drifted from raw activities; returns drifted rows"""
+    await ensure_activity_rollup(conn)
+    async with conn.transaction():
+        drift = await conn.fetchval(REPAIR_ROLLUP_SQL, quarter_id)
+        # Drop buckets emptied by deletes (rechecked on the locked row, so a
+        # concurrent increment keeps its bucket)
+        await conn.execute(
+            """
+            DELETE FROM activity_daily_rollup
+             WHERE ($1::int IS NULL OR quarter_id = $1) AND activity_count = 0 AND points = 0
+            """,
+            quarter_id,
+        )
+    return drift
@@ -1,4 +1,4 @@
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 import asyncpg
 from datetime import datetime
 
@@ -12,100 +12,146 @@ async def get_current_quarter_id(conn: asyncpg.Connection) -> Optional[int]:
     """)
     return row["id"] if row else None
 
-async def ensure_participants_for_challenge(conn: asyncpg.Connection, challenge_id: int, quarter_id: int):
-    # Ensure all players for the quarter exist as participants for per_person tracking
-    player_rows = await conn.fetch("""
-        SELECT name FROM profiles WHERE quarter_id = $1
-    """, quarter_id)
-    for r in player_rows:
-        try:
-            await conn.execute(
-                """
-                INSERT INTO challenge_participants (challenge_id, player_name, contribution)
-                VALUES ($1, $2, 0)
-                ON CONFLICT (challenge_id, player_name) DO NOTHING
-                """,
-                challenge_id, r["name"]
-            )
-        except Exception as e:
-            print(f"ensure_participants_for_challenge error: {e}")
+# Challenge target_type -> activities.type ('activities' counts every type)
+TARGET_ACTIVITY_TYPES = {
+    "meetings": "book",
+    "opportunities": "opp",
+    "deals": "deal",
+}
 
-async def recalc_challenge_progress(conn: asyncpg.Connection, challenge_id: int):
-    # Load challenge
-    ch = await conn.fetchrow("SELECT * FROM challenges WHERE id = $1", challenge_id)
-    if not ch:
-        raise ValueError("Challenge not found")
+# Recomputes progress for a set of challenges (by id and/or quarter) from
+# activities in one pass: activities are aggregated once per quarter, player
+# and type, then fanned out to every challenge. Only challenges that are
+# derivable from activities (not 'points' or finalize's 'count' bonuses) and
+# still open are touched: completed and expired ones keep their progress,
+# status and participants, so paid rewards are never reopened.
+RECALC_CTE = """
+    WITH targets AS (
+        SELECT c.id, c.quarter_id,
+               COALESCE(NULLIF(c.progress_mode, ''), 'per_person') AS mode,
+               COALESCE(c.target_value, 0) AS target_value,
+               CASE c.target_type WHEN 'meetings' THEN 'book' WHEN 'opportunities' THEN 'opp' WHEN 'deals' THEN 'deal' END AS activity_type,
+               c.target_type = 'activities' AS any_type,
+               c.target_type IN ('meetings', 'opportunities', 'deals', 'activities')
+                   AND COALESCE(c.status, 'active') NOT IN ('completed', 'expired') AS supported
+        FROM challenges c
+        WHERE ($1::int[] IS NULL OR c.id = ANY($1::int[]))
+          AND ($2::int IS NULL OR c.quarter_id = $2)
+    ), counts AS (
+        SELECT a.quarter_id, p.name AS player_name, a.type, COUNT(*) AS cnt
+        FROM activities a
+        JOIN profiles p ON a.profile_id = p.id
+        WHERE a.quarter_id IN (SELECT quarter_id FROM targets)
+        GROUP BY a.quarter_id, p.name, a.type
+    ), player_counts AS (
+        SELECT t.id AS challenge_id, p.name AS player_name,
+               COALESCE(SUM(ct.cnt) FILTER (WHERE t.any_type OR ct.type = t.activity_type), 0)::int AS cnt
+        FROM targets t
+        JOIN profiles p ON p.quarter_id = t.quarter_id
+        LEFT JOIN counts ct ON ct.quarter_id = t.quarter_id AND ct.player_name = p.name
+        WHERE t.supported
+        GROUP BY t.id, p.name
+    ), plan AS (
+        SELECT t.id, t.mode, t.target_value, t.supported,
+               CASE WHEN t.mode = 'team_total' THEN COALESCE(SUM(pc.cnt), 0) ELSE COALESCE(MAX(pc.cnt), 0) END::int AS progress
+        FROM targets t
+        LEFT JOIN player_counts pc ON pc.challenge_id = t.id
+        GROUP BY t.id, t.mode, t.target_value, t.supported
+    )
+"""
+
+async def recalc_challenges(
+    conn: asyncpg.Connection,
+    challenge_ids: Optional[List[int]] = None,
+    quarter_id: Optional[int] = None,
+    dry_run: bool = False,
+) -> Dict[int, Dict[str, Any]]:
+    """Recalculate challenge progress and per-person contributions from activities.
 
-    progress_mode = ch["progress_mode"] or "per_person"
-    target_type = ch["target_type"]
-    target_value = ch["target_value"] or 0
-    quarter_id = ch["quarter_id"]
+    Returns {challenge_id: {before_progress, after_progress, before_status,
+    after_status, player_diffs}}; with dry_run nothing is written.
+    """
+    if challenge_ids is None and quarter_id is None:
+        raise ValueError("Pass challenge_ids or quarter_id")
 
-    # Reset status and aggregates
-    await conn.execute(
-        """
-        UPDATE challenges SET current_progress = 0, completed_by = NULL, completed_at = NULL, status = 'active' 
-        WHERE id = $1
-        """, challenge_id
+    challenge_rows = await conn.fetch(
+        RECALC_CTE + """
+        SELECT c.id, c.current_progress, c.status,
+               CASE WHEN plan.supported THEN plan.progress ELSE COALESCE(c.current_progress, 0) END AS progress,
+               CASE WHEN NOT plan.supported THEN c.status
+                    WHEN plan.mode = 'team_total' AND plan.progress >= plan.target_value THEN 'completed'
+                    ELSE 'active' END AS new_status
+        FROM plan JOIN challenges c ON c.id = plan.id
+        """,
+        challenge_ids, quarter_id,
+    )
+    diff_rows = await conn.fetch(
+        RECALC_CTE + """
+        SELECT pc.challenge_id, pc.player_name, cp.contribution AS before, pc.cnt AS after
+        FROM player_counts pc
+        JOIN plan ON plan.id = pc.challenge_id AND plan.mode = 'per_person'
+        LEFT JOIN challenge_participants cp
+               ON cp.challenge_id = pc.challenge_id AND cp.player_name = pc.player_name
+        WHERE cp.contribution IS DISTINCT FROM pc.cnt
+        """,
+        challenge_ids, quarter_id,
     )
 
-    # Map activity type to activities.type
-    type_map = {
-        "meetings": "book",
-        "opportunities": "opp",
-        "deals": "deal",
-        "points": None,  # Not supported for recalculation here
-        "activities": None,
+    result: Dict[int, Dict[str, Any]] = {
+        r["id"]: {
+            "before_progress": r["current_progress"] or 0,
+            "after_progress": r["progress"],
+            "before_status": r["status"],
+            "after_status": r["new_status"],
+            "player_diffs": {},
+        }
+        for r in challenge_rows
     }
-    activity_type = type_map.get(target_type)
+    for r in diff_rows:
+        before = r["before"] or 0
+        if before != r["after"]:
+            result[r["challenge_id"]]["player_diffs"][r["player_name"]] = {"before": before, "after": r["after"]}
+
+    if dry_run or not result:
+        return result
 
-    if progress_mode == "team_total":
-        if activity_type:
-            total = await conn.fetchval(
-                """
-                SELECT COUNT(*) FROM activities a
-                JOIN profiles p ON a.profile_id = p.id
-                WHERE a.quarter_id = $1 AND a.type = $2
-                """, quarter_id, activity_type
-            )
-        else:
-            total = 0
+    async with conn.transaction():
+        # Participants: create missing rows and set contributions in one statement
         await conn.execute(
-            "UPDATE challenges SET current_progress = $1, status = CASE WHEN $1 >= $2 THEN 'completed' ELSE 'active' END, completed_by = CASE WHEN $1 >= $2 THEN 'TEAM' ELSE NULL END, completed_at = CASE WHEN $1 >= $2 THEN CURRENT_TIMESTAMP ELSE NULL END WHERE id = $3",
-            total, target_value, challenge_id
+            RECALC_CTE + """
+            INSERT INTO challenge_participants (challenge_id, player_name, contribution)
+            SELECT pc.challenge_id, pc.player_name, pc.cnt
+            FROM player_counts pc
+            JOIN plan ON plan.id = pc.challenge_id AND plan.mode = 'per_person'
+            ON CONFLICT (challenge_id, player_name) DO UPDATE
+               SET contribution = EXCLUDED.contribution
+             WHERE challenge_participants.contribution IS DISTINCT FROM EXCLUDED.contribution
+            """,
+            challenge_ids, quarter_id,
         )
-    else:  # per_person
-        # Ensure participants exist
-        await ensure_participants_for_challenge(conn, challenge_id, quarter_id)
-        # Compute per-player counts and update participants
-        if activity_type:
-            rows = await conn.fetch(
-                """
-                SELECT p.name as player_name, COUNT(*) as cnt
-                FROM activities a
-                JOIN profiles p ON a.profile_id = p.id
-                WHERE a.quarter_id = $1 AND a.type = $2
-                GROUP BY p.name
-                """, quarter_id, activity_type
-            )
-        else:
-            rows = []
-        completed_players = []
-        for r in rows:
-            await conn.execute(
-                "UPDATE challenge_participants SET contribution = $1 WHERE challenge_id = $2 AND player_name = $3",
-                r["cnt"], challenge_id, r["player_name"]
-            )
-            if r["cnt"] >= target_value:
-                completed_players.append(r["player_name"])
-        # Aggregate current_progress as max or average; choose max to reflect leader for UI
-        total_progress = 0 if not rows else max([r["cnt"] for r in rows])
+        # Challenges: per-person ones stay active (completion is tracked per
+        # participant); team totals complete as TEAM once the target is reached
         await conn.execute(
-            "UPDATE challenges SET current_progress = $1 WHERE id = $2",
-            total_progress, challenge_id
+            RECALC_CTE + """
+            UPDATE challenges c
+               SET current_progress = plan.progress,
+                   status = CASE WHEN plan.mode = 'team_total' AND plan.progress >= plan.target_value
+                                 THEN 'completed' ELSE 'active' END,
+                   completed_by = CASE WHEN plan.mode = 'team_total' AND plan.progress >= plan.target_value
+                                       THEN 'TEAM' ELSE NULL END,
+                   completed_at = CASE WHEN plan.mode = 'team_total' AND plan.progress >= plan.target_value
+                                       THEN CURRENT_TIMESTAMP ELSE NULL END
+              FROM plan
+             WHERE c.id = plan.id AND plan.supported
+               AND COALESCE(c.status, 'active') NOT IN ('completed', 'expired')
+            """,
+            challenge_ids, quarter_id,
         )
-        # If at least one player completed, do not set global completed for everyone; keep status active,
-        # completion is tracked via participants. We can optionally mark TEAM completed only if all complete.
-        # Here we keep the challenge active until end_time or admin manually completes.
+    return result
 
+async def recalc_challenge_progress(conn: asyncpg.Connection, challenge_id: int):
+    """Recalculate a single challenge (see recalc_challenges)"""
+    result = await recalc_challenges(conn, challenge_ids=[challenge_id])
+    if challenge_id not in result:
+        raise ValueError("Challenge not found")
     return True
@@ -0,0 +1,282 @@
+# Retroactive Rescoring for Competitions 2.0
+# When a live competition's rules change, already logged events keep the points
+# they were scored with. A rescoring job streams the competition's events in
+# order through a server-side cursor, re-scores them with ScoringSimulator and
+# writes changed points back in small batches, checkpointing after each batch
+# so an interrupted job resumes where it stopped.
+#
+# Undone events are left out: undo_competition_event writes a compensation of
+# -points (no type) and keeps the original, so rescoring the original alone
+# would break the pair. A job runs only on the worker holding its advisory lock.
+
+from typing import Dict, List, Any, Optional
+import asyncio
+import json
+import logging
+
+import asyncpg
+import databutton as db
+
+from app.libs.models_competition_v2 import CompetitionRules, BookingActivityType
+from app.libs.scoring_simulator import ScoringSimulator
+from app.libs.leaderboard_service import note_competition_write, STORAGE_V2
+from app.libs.scoreboard_snapshots import invalidate_snapshots
+
+logger = logging.getLogger(__name__)
+
+RESCORE_BATCH_SIZE = 500
+# Pause between batches so live logging keeps getting connections and row locks
+RESCORE_BATCH_PAUSE_SECONDS = 0.2
+
+# Namespace for per-job advisory locks (the key is the job id)
+RESCORE_LOCK_NAMESPACE = 0x5C4EE
+
+# Scored events of competition $1 that no undo compensates (alias e)
+REPLAYABLE_EVENTS_SQL = """
+    e.competition_id = $1 AND e.type IS NOT NULL
+    AND NOT EXISTS (
+        SELECT 1 FROM booking_competition_events u
+        WHERE u.competition_id = e.competition_id AND u.metadata->>'undo_of' = e.id::text
+    )
+"""
+
+RESCORE_JOBS_DDL = """
+    CREATE TABLE IF NOT EXISTS competition_rescore_jobs (
+        id SERIAL PRIMARY KEY,
+        competition_id INTEGER NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending',
+        total_events INTEGER NOT NULL DEFAULT 0,
+        processed_events INTEGER NOT NULL DEFAULT 0,
+        updated_events INTEGER NOT NULL DEFAULT 0,
+        error TEXT,
+        created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+        updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+        finished_at TIMESTAMPTZ
+    )
+"""
+
+_schema_ready = False
+
+async def ensure_rescore_jobs_table(conn: asyncpg.Connection):
+    """Create the job table once per process"""
+    global _schema_ready
+    if _schema_ready:
+        return
+    await conn.execute(RESCORE_JOBS_DDL)
+    _schema_ready = True
+
+
+async def _get_connection() -> asyncpg.Connection:
+    return await asyncpg.connect(db.secrets.get("DATABASE_URL_DEV"))
+
+def _job_dict(row) -> Dict[str, Any]:
+    job = dict(row)
+    total = job["total_events"] or 0
+    job["progress"] = round(job["processed_events"] / total, 4) if total else (1.0 if job["status"] == "completed" else 0.0)
+    return job
+
+async def get_rescore_job(conn: asyncpg.Connection, competition_id: int) -> Optional[Dict[str, Any]]:
+    """Latest rescoring job for a competition"""
+    await ensure_rescore_jobs_table(conn)
+    row = await conn.fetchrow(
+        "SELECT * FROM competition_rescore_jobs WHERE competition_id = $1 ORDER BY id DESC LIMIT 1",
+        competition_id,
+    )
+    return _job_dict(row) if row else None
+
+
+async def _write_batch(conn: asyncpg.Connection, job_id: int, processed: int, changes: List[tuple]) -> int:
+    """Apply one batch of corrected points and advance the checkpoint atomically"""
+    async with conn.transaction():
+        updated = 0
+        if changes:
+            ids, points, rules_info = zip(*changes)
+            result = await conn.execute(
+                """
+                UPDATE booking_competition_events e
+                   SET points = c.points,
+                       rule_triggered = c.rule_triggered::jsonb
+                  FROM unnest($1::uuid[], $2::int[], $3::text[]) AS c(id, points, rule_triggered)
+                 WHERE e.id = c.id
+                   -- Undone while the job ran: the compensation holds the old points
+                   AND NOT EXISTS (
+                       SELECT 1 FROM booking_competition_events u
+                       WHERE u.competition_id = e.competition_id AND u.metadata->>'undo_of' = e.id::text
+                   )
+                """,
+                list(ids), list(points), list(rules_info),
+            )
+            updated = int(result.split()[-1])
+        await conn.execute(
+            """
+            UPDATE competition_rescore_jobs
+               SET processed_events = $2, updated_events = updated_events + $3, updated_at = NOW()
+             WHERE id = $1
+            """,
+            job_id, processed, updated,
+        )
+    return updated
+
+
+async def run_rescore_job(job_id: int):
+    """Stream, rescore and write back one competition's events"""
+    read_conn = await _get_connection()
+    write_conn = await _get_connection()
+    try:
+        await ensure_rescore_jobs_table(write_conn)
+        # Claim the job; the session lock is held until write_conn closes, so a
+        # crashed worker's job can be resumed elsewhere
+        claimed = await write_conn.fetchval("SELECT pg_try_advisory_lock($1, $2)", RESCORE_LOCK_NAMESPACE, job_id)
+        if not claimed:
+            return
+        job = await write_conn.fetchrow(
+            """
+            UPDATE competition_rescore_jobs SET status = 'running', error = NULL, updated_at = NOW()
+             WHERE id = $1 AND status IN ('pending', 'running')
+            RETURNING competition_id, processed_events
+            """,
+            job_id,
+        )
+        if job is None:
+            # Superseded or finished before we got to it
+            return
+        competition_id, checkpoint = job["competition_id"], job["processed_events"]
+        comp = await write_conn.fetchrow("SELECT rules FROM booking_competitions WHERE id = $1", competition_id)
+        rules = CompetitionRules(**json.loads(comp["rules"]))
+        simulator = ScoringSimulator(rules)
+
+        total = await write_conn.fetchval(
+            f"SELECT COUNT(*) FROM booking_competition_events e WHERE {REPLAYABLE_EVENTS_SQL}",
+            competition_id,
+        )
+        await write_conn.execute(
+            "UPDATE competition_rescore_jobs SET total_events = $2 WHERE id = $1", job_id, total,
+        )
+
+        processed = 0
+        changes: List[tuple] = []
+        # Events before the checkpoint are replayed in memory only, to rebuild
+        # the simulator's history; writes resume after them
+        async with read_conn.transaction(isolation="repeatable_read", readonly=True):
+            cursor = read_conn.cursor(
+                f"""
+                SELECT e.id, e.player_name, e.type, COALESCE(e.ts, e.created_at) AS ts, e.points, e.rule_triggered
+                FROM booking_competition_events e
+                WHERE {REPLAYABLE_EVENTS_SQL}
+                ORDER BY COALESCE(e.ts, e.created_at), e.created_at, e.id
+                """,
+                competition_id,
+                prefetch=RESCORE_BATCH_SIZE,
+            )
+            async for e in cursor:
+                old_info = e["rule_triggered"] or {}
+                if isinstance(old_info, str):
+                    old_info = json.loads(old_info)
+                custom_points = old_info.get("custom_points")
+                points, rule_triggered = simulator.score(
+                    e["player_name"], BookingActivityType(e["type"]), e["ts"], custom_points
+                )
+                if custom_points:
+                    rule_triggered["custom_points"] = custom_points
+                processed += 1
+                if processed <= checkpoint:
+                    continue
+                if points != (e["points"] or 0):
+                    changes.append((e["id"], points, json.dumps(rule_triggered)))
+                if processed % RESCORE_BATCH_SIZE == 0:
+                    await _write_batch(write_conn, job_id, processed, changes)
+                    changes = []
+                    await asyncio.sleep(RESCORE_BATCH_PAUSE_SECONDS)
+
+        await _write_batch(write_conn, job_id, processed, changes)
+        await invalidate_snapshots(write_conn, competition_id)
+        note_competition_write(competition_id, STORAGE_V2)
+        await write_conn.execute(
+            """
+            UPDATE competition_rescore_jobs
+               SET status = 'completed', finished_at = NOW(), updated_at = NOW()
+             WHERE id = $1
+            """,
+            job_id,
+        )
+    except asyncio.CancelledError:
+        # Shutdown: leave the job 'running' with its checkpoint so it is resumed
+        raise
+    except Exception as e:
+        logger.exception("rescore job %s failed", job_id)
+        await write_conn.execute(
+            "UPDATE competition_rescore_jobs SET status = 'failed', error = $2, updated_at = NOW() WHERE id = $1",
+            job_id, str(e),
+        )
+    finally:
+        await read_conn.close()
+        await write_conn.close()
+
+
+class RescoreManager:
+    """Runs rescoring jobs as background tasks, one per competition"""
+
+    def __init__(self):
+        self.tasks: Dict[int, asyncio.Task] = {}  # competition_id -> task
+
+    def is_running(self, competition_id: int) -> bool:
+        task = self.tasks.get(competition_id)
+        return task is not None and not task.done()
+
+    def _spawn(self, competition_id: int, job_id: int):
+        task = asyncio.create_task(run_rescore_job(job_id))
+        self.tasks[competition_id] = task
+        task.add_done_callback(lambda t: self.tasks.pop(competition_id, None) if self.tasks.get(competition_id) is t else None)
+
+    async def start_job(self, conn: asyncpg.Connection, competition_id: int) -> Dict[str, Any]:
+        """Queue a fresh rescoring run (a running job for the competition is restarted)"""
+        await ensure_rescore_jobs_table(conn)
+        await self.cancel(competition_id)
+        await conn.execute(
+            """
+            UPDATE competition_rescore_jobs SET status = 'superseded', updated_at = NOW()
+             WHERE competition_id = $1 AND status IN ('pending', 'running')
+            """,
+            competition_id,
+        )
+        row = await conn.fetchrow(
+            "INSERT INTO competition_rescore_jobs (competition_id) VALUES ($1) RETURNING *",
+            competition_id,
+        )
+        self._spawn(competition_id, row["id"])
+        return _job_dict(row)
+
+    async def resume_pending(self):
+        """Restart jobs interrupted by a shutdown, from their last checkpoint.
+
+        Every worker calls this at startup; run_rescore_job's advisory lock
+        lets only one of them run each job.
+        """
+        conn = await _get_connection()
+        try:
+            await ensure_rescore_jobs_table(conn)
+            rows = await conn.fetch(
+                "SELECT id, competition_id FROM competition_rescore_jobs WHERE status IN ('pending', 'running')"
+            )
+        finally:
+            await conn.close()
+        for r in rows:
+            if not self.is_running(r["competition_id"]):
+                self._spawn(r["competition_id"], r["id"])
+
+    async def cancel(self, competition_id: int):
+        task = self.tasks.pop(competition_id, None)
+        if task and not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    async def stop(self):
+        for competition_id in list(self.tasks):
+            await self.cancel(competition_id)
+
+
+# Global rescore manager instance
+rescore_manager = RescoreManager()
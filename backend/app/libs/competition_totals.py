@@ -0,0 +1,121 @@
+from typing import Optional, List
+import asyncpg
+from datetime import datetime
+
+# Running totals for V1 booking competition entries.
+# competition_entry_totals holds one row per (competition, player, activity_type)
+# and is kept in step with booking_competition_entries by every writer, so that
+# leaderboards, stats and winner selection read O(participants) rows instead of
+# re-aggregating every entry.
+
+ENTRY_TOTALS_DDL = """
+    CREATE TABLE IF NOT EXISTS competition_entry_totals (
+        competition_id INTEGER NOT NULL,
+        player_name TEXT NOT NULL,
+        activity_type TEXT NOT NULL,
+        count INTEGER NOT NULL DEFAULT 0,
+        points INTEGER NOT NULL DEFAULT 0,
+        first_at TIMESTAMPTZ,
+        last_at TIMESTAMPTZ,
+        PRIMARY KEY (competition_id, player_name, activity_type)
+    )
+"""
+
+_schema_ready = False
+
+async def ensure_entry_totals_table(conn: asyncpg.Connection):
+    """Create the totals table once per process, seeding it from existing entries"""
+    global _schema_ready
+    if _schema_ready:
+        return
+    async with conn.transaction():
+        exists = await conn.fetchval("SELECT to_regclass('competition_entry_totals') IS NOT NULL")
+        if not exists:
+            await conn.execute(ENTRY_TOTALS_DDL)
+            await conn.execute(
+                """
+                INSERT INTO competition_entry_totals
+                    (competition_id, player_name, activity_type, count, points, first_at, last_at)
+                SELECT competition_id, player_name, activity_type,
+                       COUNT(*), COALESCE(SUM(points), 0), MIN(created_at), MAX(created_at)
+                FROM booking_competition_entries
+                GROUP BY competition_id, player_name, activity_type
+                ON CONFLICT DO NOTHING
+                """
+            )
+    _schema_ready = True
+
+async def record_entries(
+    conn: asyncpg.Connection,
+    competition_id: int,
+    player_name: str,
+    activity_type: str,
+    points: int,
+    created_at: datetime,
+    count: int = 1,
+    last_at: Optional[datetime] = None,
+):
+    """Add newly inserted entries to the totals (points is the sum over all of them)"""
+    await ensure_entry_totals_table(conn)
+    await conn.execute(
+        """
+        INSERT INTO competition_entry_totals
+            (competition_id, player_name, activity_type, count, points, first_at, last_at)
+        VALUES ($1, $2, $3, $4, $5, $6, $7)
+        ON CONFLICT (competition_id, player_name, activity_type) DO UPDATE
+           SET count = competition_entry_totals.count + EXCLUDED.count,
+               points = competition_entry_totals.points + EXCLUDED.points,
+               first_at = LEAST(competition_entry_totals.first_at, EXCLUDED.first_at),
+               last_at = GREATEST(competition_entry_totals.last_at, EXCLUDED.last_at)
+        """,
+        competition_id, player_name, activity_type, count, points, created_at, last_at or created_at,
+    )
+
+async def refresh_player_totals(conn: asyncpg.Connection, competition_id: int, player_name: str):
+    """Recompute one player's totals from entries (used after edits and deletes)"""
+    await ensure_entry_totals_table(conn)
+    await conn.execute(
+        "DELETE FROM competition_entry_totals WHERE competition_id = $1 AND player_name = $2",
+        competition_id, player_name,
+    )
+    await conn.execute(
+        """
+        INSERT INTO competition_entry_totals
+            (competition_id, player_name, activity_type, count, points, first_at, last_at)
+        SELECT competition_id, player_name, activity_type,
+               COUNT(*), COALESCE(SUM(points), 0), MIN(created_at), MAX(created_at)
+        FROM booking_competition_entries
+        WHERE competition_id = $1 AND player_name = $2
+        GROUP BY competition_id, player_name, activity_type
+        """,
+        competition_id, player_name,
+    )
+
+async def fetch_type_totals(conn: asyncpg.Connection, competition_id: int) -> List[asyncpg.Record]:
+    """Per player and activity type totals for a competition"""
+    await ensure_entry_totals_table(conn)
+    return await conn.fetch(
+        """
+        SELECT player_name, activity_type, count, points, first_at, last_at
+        FROM competition_entry_totals
+        WHERE competition_id = $1
+        """,
+        competition_id,
+    )
+
+async def fetch_player_totals(conn: asyncpg.Connection, competition_id: int) -> List[asyncpg.Record]:
+    """Per player totals for a competition"""
+    await ensure_entry_totals_table(conn)
+    return await conn.fetch(
+        """
+        SELECT player_name,
+               SUM(points) AS total_points,
+               SUM(count) AS entries,
+               MAX(last_at) AS last_entry_at,
+               MIN(first_at) AS first_entry_at
+        FROM competition_entry_totals
+        WHERE competition_id = $1
+        GROUP BY player_name
+        """,
+        competition_id,
+    )
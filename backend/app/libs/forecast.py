@@ -0,0 +1,230 @@
+# Quarter-End Forecast
+# Monte Carlo projection of where the quarter lands. Each player's workdays
+# left, today included (weekdays minus Norwegian holidays, see workdays.py;
+# today's partial activity is replaced by a full draw), are drawn with
+# replacement from that player's own workdays so far this quarter (books,
+# opps, deals and points of a day stay together), and the whole quarter is
+# simulated N_SIMULATIONS times to get p10/p50/p90 outcomes and the
+# probability of reaching each goal.
+#
+# Speed: rather than drawing every remaining day, days are drawn in blocks of
+# `block` days from a table of every block's sums (uniform over the D**block
+# day tuples is the same as block independent draws), and the four metrics are
+# packed into one int64 so a single gather sums them all. Results are cached
+# per quarter and data version (a fingerprint of the quarter's rollup rows and
+# goals plus the day), and the seed comes from that version, so every worker
+# returns the same numbers for the same data.
+
+from typing import Any, Callable, Dict, Tuple
+from datetime import datetime, timedelta
+import time
+
+import asyncpg
+import numpy as np
+
+from app.libs.activity_rollup import ensure_activity_rollup
+from app.libs.local_time import local_today
+from app.libs.workdays import workday_calendar
+
+N_SIMULATIONS = 10_000
+PERCENTILES = (10, 50, 90)
+FORECAST_METRICS = ("books", "opps", "deals", "points")
+ROLLUP_METRIC_INDEX = {"book": 0, "opp": 1, "deal": 2}
+POINTS_INDEX = 3
+# Largest per-player table of block sums (keeps the gather in cache)
+BLOCK_TABLE_SIZE = 4096
+# Bits per metric when packing; packed sums must stay below 2**FIELD_BITS
+FIELD_BITS = 16
+
+# Quarter id -> (data version, forecast)
+_cache: Dict[int, Tuple[Tuple, Dict[str, Any]]] = {}
+
+
+def _block_sums(days: np.ndarray, size: int) -> np.ndarray:
+    """(players, D**size, metrics) sums of every ordered size-tuple of observed days"""
+    players, _, metrics = days.shape
+    sums = days
+    for _ in range(size - 1):
+        sums = (sums[:, :, None, :] + days[:, None, :, :]).reshape(players, -1, metrics)
+    return sums
+
+
+def _pack(values: np.ndarray) -> np.ndarray:
+    packed = np.zeros(values.shape[:-1], dtype=np.int64)
+    for k in range(values.shape[-1]):
+        packed |= values[..., k].astype(np.int64) << (FIELD_BITS * k)
+    return packed
+
+
+def _unpack(packed: np.ndarray, metrics: int) -> np.ndarray:
+    mask = (1 << FIELD_BITS) - 1
+    return np.stack([(packed >> (FIELD_BITS * k)) & mask for k in range(metrics)], axis=-1)
+
+
+def bootstrap_sums(days: np.ndarray, remaining: int, n_sims: int,
+                   rng: np.random.Generator) -> np.ndarray:
+    """(n_sims, players, metrics) totals of `remaining` days drawn per player from days.
+
+    days is (players, observed days, metrics); every player draws from their
+    own row, so observed days must be the same calendar days for everyone
+    (days without activity are zero rows).
+    """
+    players, observed, metrics = days.shape
+    out = np.zeros((n_sims, players, metrics), dtype=np.int64)
+    if remaining <= 0 or observed == 0 or players == 0:
+        return out
+
+    block = 1
+    while block < remaining and observed ** (block + 1) <= BLOCK_TABLE_SIZE:
+        block += 1
+    n_blocks, rest = divmod(remaining, block)
+    # The same draws serve every metric group, so a day's metrics stay together
+    draws = []
+    for size, count in ((block, n_blocks), (rest, 1 if rest else 0)):
+        if count:
+            # Block-major, so each block's gather adds onto out as one contiguous pass
+            idx = rng.integers(0, observed ** size, size=(count, n_sims, players), dtype=np.int32)
+            idx += np.arange(players, dtype=np.int32) * observed ** size
+            draws.append((size, idx))
+
+    packable = days.min() >= 0 and int(days.max()) * remaining < 1 << FIELD_BITS
+    groups = [list(range(metrics))] if packable else [[k] for k in range(metrics)]
+    for group in groups:
+        totals = np.zeros((n_sims, players), dtype=np.int64)
+        for size, idx in draws:
+            table = _block_sums(days[..., group], size)
+            flat = (_pack(table) if packable else table[..., 0]).ravel()
+            for block_idx in idx:
+                totals += flat[block_idx]
+        out[..., group] = _unpack(totals, len(group)) if packable else totals[..., None]
+    return out
+
+
+def simulate_quarter_end(days: np.ndarray, current: np.ndarray, goals: np.ndarray,
+                         remaining: int, n_sims: int = N_SIMULATIONS, seed=None) -> Dict[str, Any]:
+    """Percentiles and goal probabilities of the team and each player at quarter end.
+
+    days: (players, observed workdays, metrics) history; current and goals:
+    (players, metrics). Player results are in the input order.
+    """
+    started = time.perf_counter()
+    rng = np.random.default_rng(seed)
+    final = bootstrap_sums(days, remaining, n_sims, rng) + current[None, :, :]
+    team = final.sum(axis=1)
+    team_goals = goals.sum(axis=0)
+    team_percentiles = np.percentile(team, PERCENTILES, axis=0)
+    return {
+        "team": {
+            "current": current.sum(axis=0).tolist(),
+            "goal": team_goals.tolist(),
+            "percentiles": {p: team_percentiles[i].tolist() for i, p in enumerate(PERCENTILES)},
+            "goal_probability": (team >= team_goals).mean(axis=0).tolist(),
+        },
+        "player_goal_probability": (final >= goals[None, :, :]).mean(axis=0).tolist(),
+        "simulation_ms": round((time.perf_counter() - started) * 1000, 1),
+    }
+
+
+async def quarter_forecast(conn: asyncpg.Connection, quarter, goal_points: Callable[[int, int, int], int],
+                           n_sims: int = N_SIMULATIONS) -> Dict[str, Any]:
+    """Monte Carlo quarter-end forecast for a quarter row (id, start_date, end_date), cached per data version"""
+    await ensure_activity_rollup(conn)
+    today = local_today()
+    fingerprint = await conn.fetchrow(
+        """
+        SELECT
+            (SELECT COUNT(*) FROM activity_daily_rollup WHERE quarter_id = $1) AS rollup_rows,
+            (SELECT COALESCE(SUM(hashtext(local_date::text || '|' || profile_id || '|' || activity_type
+                                          || '|' || activity_count || '|' || points)::bigint), 0)
+             FROM activity_daily_rollup WHERE quarter_id = $1) AS rollup_hash,
+            (SELECT COALESCE(SUM(hashtext(id || '|' || goal_books || '|' || goal_opps || '|' || goal_deals)::bigint), 0)
+             FROM profiles WHERE quarter_id = $1) AS goals_hash
+        """,
+        quarter["id"],
+    )
+    version = (today, n_sims, fingerprint["rollup_rows"], fingerprint["rollup_hash"], fingerprint["goals_hash"])
+    cached = _cache.get(quarter["id"])
+    if cached and cached[0] == version:
+        return cached[1]
+
+    profiles = await conn.fetch(
+        """
+        SELECT id, name, COALESCE(goal_books, 0) AS goal_books,
+               COALESCE(goal_opps, 0) AS goal_opps, COALESCE(goal_deals, 0) AS goal_deals
+        FROM profiles WHERE quarter_id = $1
+        ORDER BY name
+        """,
+        quarter["id"],
+    )
+    rows = await conn.fetch(
+        """
+        SELECT profile_id, local_date, activity_type, activity_count, points
+        FROM activity_daily_rollup
+        WHERE quarter_id = $1
+        """,
+        quarter["id"],
+    )
+
+    start = quarter["start_date"]
+    history_end = min(today - timedelta(days=1), quarter["end_date"])
+    n_days = max(0, (history_end - start).days + 1)
+    player_index = {p["id"]: i for i, p in enumerate(profiles)}
+    metrics = len(FORECAST_METRICS)
+    daily = np.zeros((len(profiles), n_days, metrics), dtype=np.int64)
+    current = np.zeros((len(profiles), metrics), dtype=np.int64)
+    # Today's rows so far; today is simulated as a whole day when it is a workday
+    today_partial = np.zeros((len(profiles), metrics), dtype=np.int64)
+    goals = np.array(
+        [[p["goal_books"], p["goal_opps"], p["goal_deals"],
+          goal_points(p["goal_books"], p["goal_opps"], p["goal_deals"])] for p in profiles],
+        dtype=np.int64,
+    ).reshape(len(profiles), metrics)
+    for r in rows:
+        i = player_index.get(r["profile_id"])
+        if i is None:
+            continue
+        values = [(ROLLUP_METRIC_INDEX.get(r["activity_type"]), r["activity_count"]), (POINTS_INDEX, r["points"])]
+        offset = (r["local_date"] - start).days
+        for k, value in values:
+            if k is None:
+                continue
+            current[i, k] += value
+            if r["local_date"] == today:
+                today_partial[i, k] += value
+            if 0 <= offset < n_days:
+                daily[i, offset, k] += value
+
+    workdays = workday_calendar.mask(start, n_days)
+    quarter_days = workday_calendar.quarter(start, quarter["end_date"], today)
+    remaining = quarter_days.left
+    base = current - today_partial if quarter_days.today_is_workday else current
+    seed = [quarter["id"], today.toordinal()] + [abs(int(v)) for v in version[1:]]
+    simulated = simulate_quarter_end(daily[:, workdays, :], base, goals, remaining, n_sims, seed)
+    team = simulated["team"]
+    team_current = current.sum(axis=0).tolist()
+    result = {
+        "simulations": n_sims,
+        "remaining_workdays": remaining,
+        "observed_workdays": int(workdays.sum()),
+        "simulation_ms": simulated["simulation_ms"],
+        "team": {
+            metric: {
+                "current": team_current[k],
+                "goal": team["goal"][k],
+                **{f"p{p}": team["percentiles"][p][k] for p in PERCENTILES},
+                "goal_probability": team["goal_probability"][k],
+            }
+            for k, metric in enumerate(FORECAST_METRICS)
+        },
+        "players": [
+            {
+                "profile_id": profile["id"],
+                "name": profile["name"],
+                "goal_probability": dict(zip(FORECAST_METRICS, simulated["player_goal_probability"][i])),
+            }
+            for i, profile in enumerate(profiles)
+        ],
+        "generated_at": datetime.now(),
+    }
+    _cache[quarter["id"]] = (version, result)
+    return result
@@ -0,0 +1,224 @@
+# Idempotency for write endpoints
+# Requests carrying an X-Idempotency-Key header are executed once; repeats of
+# the same key (per caller, method and path) get the stored response replayed.
+# A bounded in-process LRU answers most duplicates (double taps arrive within
+# seconds on the same worker) and idempotency_keys makes it hold across
+# workers and restarts. Keys expire after IDEMPOTENCY_TTL_SECONDS and are
+# purged from the table by the scheduled purge job. LRU hits never touch the
+# database; misses borrow a connection from a small shared pool only for the
+# claim and for storing the response, not while the handler runs.
+#
+# The frontend brain client sends a key on logging calls (src/brain/idempotency.ts).
+
+from typing import Dict, Optional, Tuple
+from collections import OrderedDict
+import asyncio
+import hashlib
+import os
+import time
+
+import asyncpg
+import databutton as db
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+
+IDEMPOTENCY_HEADER = "X-Idempotency-Key"
+IDEMPOTENCY_TTL_SECONDS = int(os.environ.get("IDEMPOTENCY_TTL_SECONDS", str(24 * 3600)))
+IDEMPOTENCY_CACHE_SIZE = 2048
+WRITE_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+IDEMPOTENCY_POOL_SIZE = 4
+
+IDEMPOTENCY_DDL = """
+    CREATE TABLE IF NOT EXISTS idempotency_keys (
+        key TEXT PRIMARY KEY,
+        created_at TIMESTAMP NOT NULL DEFAULT (NOW() AT TIME ZONE 'UTC')
+    );
+    ALTER TABLE idempotency_keys ADD COLUMN IF NOT EXISTS status_code INTEGER;
+    ALTER TABLE idempotency_keys ADD COLUMN IF NOT EXISTS response_body BYTEA;
+    ALTER TABLE idempotency_keys ADD COLUMN IF NOT EXISTS content_type TEXT;
+    CREATE INDEX IF NOT EXISTS idx_idempotency_keys_created_at ON idempotency_keys (created_at);
+"""
+
+# (status_code, body, content_type)
+StoredResponse = Tuple[int, bytes, Optional[str]]
+
+
+class IdempotencyStore:
+    """LRU of completed responses in front of the idempotency_keys table"""
+
+    def __init__(self, max_entries: int = IDEMPOTENCY_CACHE_SIZE, ttl_seconds: int = IDEMPOTENCY_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.responses: "OrderedDict[str, Tuple[float, StoredResponse]]" = OrderedDict()
+        # Requests currently executing in this process, so concurrent repeats wait for them
+        self.in_flight: Dict[str, asyncio.Future] = {}
+        self.schema_ready = False
+        self._pool: Optional[asyncpg.Pool] = None
+        self._pool_lock = asyncio.Lock()
+
+    async def pool(self) -> asyncpg.Pool:
+        """Shared connection pool, created on first use"""
+        if self._pool is None:
+            async with self._pool_lock:
+                if self._pool is None:
+                    self._pool = await asyncpg.create_pool(
+                        db.secrets.get("DATABASE_URL_DEV"), min_size=1, max_size=IDEMPOTENCY_POOL_SIZE
+                    )
+        return self._pool
+
+    async def close(self):
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None
+
+    def get(self, key: str) -> Optional[StoredResponse]:
+        entry = self.responses.get(key)
+        if entry is None:
+            return None
+        stored_at, response = entry
+        if time.time() - stored_at > self.ttl_seconds:
+            del self.responses[key]
+            return None
+        self.responses.move_to_end(key)
+        return response
+
+    def put(self, key: str, response: StoredResponse):
+        self.responses[key] = (time.time(), response)
+        self.responses.move_to_end(key)
+        while len(self.responses) > self.max_entries:
+            self.responses.popitem(last=False)
+
+    async def ensure_schema(self, conn: asyncpg.Connection):
+        if not self.schema_ready:
+            await conn.execute(IDEMPOTENCY_DDL)
+            self.schema_ready = True
+
+    async def claim(self, conn: asyncpg.Connection, key: str) -> Tuple[bool, Optional[StoredResponse]]:
+        """Reserve a key; returns (claimed, stored response if the key was already completed)"""
+        await self.ensure_schema(conn)
+        claimed = await conn.fetchval(
+            """
+            INSERT INTO idempotency_keys (key, created_at)
+            VALUES ($1, NOW() AT TIME ZONE 'UTC')
+            ON CONFLICT (key) DO UPDATE
+               SET created_at = EXCLUDED.created_at, status_code = NULL,
+                   response_body = NULL, content_type = NULL
+             WHERE idempotency_keys.created_at < (NOW() AT TIME ZONE 'UTC') - make_interval(secs => $2)
+            RETURNING TRUE
+            """,
+            key, self.ttl_seconds,
+        )
+        if claimed:
+            return True, None
+        row = await conn.fetchrow(
+            "SELECT status_code, response_body, content_type FROM idempotency_keys WHERE key = $1",
+            key,
+        )
+        if row and row["status_code"] is not None:
+            return False, (row["status_code"], bytes(row["response_body"] or b""), row["content_type"])
+        return False, None
+
+    async def complete(self, conn: asyncpg.Connection, key: str, response: StoredResponse):
+        self.put(key, response)
+        await conn.execute(
+            """
+            UPDATE idempotency_keys SET status_code = $2, response_body = $3, content_type = $4
+            WHERE key = $1
+            """,
+            key, response[0], response[1], response[2],
+        )
+
+    async def release(self, conn: asyncpg.Connection, key: str):
+        """Forget a key whose request failed so the client can retry it"""
+        await conn.execute("DELETE FROM idempotency_keys WHERE key = $1", key)
+
+    async def purge_expired(self, conn: asyncpg.Connection) -> str:
+        """Drop expired keys (run by the scheduler's purge job)"""
+        await self.ensure_schema(conn)
+        return await conn.execute(
+            "DELETE FROM idempotency_keys WHERE created_at < (NOW() AT TIME ZONE 'UTC') - make_interval(secs => $1)",
+            self.ttl_seconds,
+        )
+
+
+# Global idempotency store instance
+idempotency_store = IdempotencyStore()
+
+
+def scoped_key(request: Request, key: str) -> str:
+    """Keys are scoped to the caller and endpoint so clients cannot collide"""
+    caller = request.headers.get("authorization", "")
+    raw = f"{caller}|{request.method}|{request.url.path}|{key}"
+    return "req:" + hashlib.sha256(raw.encode()).hexdigest()
+
+def replay(response: StoredResponse) -> Response:
+    status_code, body, content_type = response
+    return Response(
+        content=body,
+        status_code=status_code,
+        media_type=content_type,
+        headers={"Idempotent-Replayed": "true"},
+    )
+
+
+class IdempotencyMiddleware(BaseHTTPMiddleware):
+    """Execute keyed write requests once and replay their response for duplicates"""
+
+    async def dispatch(self, request: Request, call_next):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if request.method not in WRITE_METHODS or not key:
+            return await call_next(request)
+
+        store = idempotency_store
+        key = scoped_key(request, key)
+        cached = store.get(key)
+        if cached:
+            return replay(cached)
+        pending = store.in_flight.get(key)
+        if pending is not None:
+            response = await asyncio.shield(pending)
+            return replay(response) if response else JSONResponse(
+                status_code=409, content={"detail": "Duplicate request is still being processed"}
+            )
+
+        # Registered before the first await so concurrent repeats wait on this request
+        future: asyncio.Future = asyncio.get_running_loop().create_future()
+        store.in_flight[key] = future
+        stored: Optional[StoredResponse] = None
+        claimed = False
+        try:
+            pool = await store.pool()
+            async with pool.acquire() as conn:
+                claimed, existing = await store.claim(conn, key)
+            if existing:
+                store.put(key, existing)
+                stored = existing
+                return replay(existing)
+            if not claimed:
+                # Another worker holds the key and has not finished yet
+                return JSONResponse(status_code=409, content={"detail": "Duplicate request is still being processed"})
+
+            response = await call_next(request)
+            body = b"".join([chunk async for chunk in response.body_iterator])
+            async with pool.acquire() as conn:
+                if response.status_code >= 500:
+                    await store.release(conn, key)
+                else:
+                    stored = (response.status_code, body, response.headers.get("content-type"))
+                    await store.complete(conn, key, stored)
+            claimed = False
+            return Response(
+                content=body,
+                status_code=response.status_code,
+                headers={k: v for k, v in response.headers.items() if k.lower() != "content-length"},
+            )
+        except Exception:
+            if claimed:
+                async with (await store.pool()).acquire() as conn:
+                    await store.release(conn, key)
+            raise
+        finally:
+            store.in_flight.pop(key, None)
+            if not future.done():
+                future.set_result(stored)
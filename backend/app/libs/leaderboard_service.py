@@ -0,0 +1,174 @@
+# Leaderboard Service for Booking Competitions
+# Single place that knows whether a competition stores V1 entries or V2 events,
+# aggregates standings once per backend and caches them per write version.
+
+from typing import Dict, List, Any, Optional, Tuple
+from datetime import datetime
+import time
+
+from app.libs.competition_totals import fetch_type_totals
+from app.libs.rank_index import rank_indexes
+
+STORAGE_V1 = "v1"  # booking_competition_entries
+STORAGE_V2 = "v2"  # booking_competition_events
+
+
+class LeaderboardService:
+    """Cached competition standings for V1 entries and V2 events"""
+
+    def __init__(self):
+        # competition_id -> STORAGE_V1 / STORAGE_V2
+        self.storage_versions: Dict[int, str] = {}
+        self.storage_checked_at: Dict[int, float] = {}
+        # competition_id -> monotonically increasing write counter
+        self.write_versions: Dict[int, int] = {}
+        # (competition_id, write_version) -> (cached_at, standings)
+        self.cache: Dict[Tuple[int, int], Tuple[float, List[Dict[str, Any]]]] = {}
+        self.max_cache_entries = 256
+        # Safety net for writes made by other workers; local writes invalidate immediately
+        self.cache_ttl = 30
+        self.v1_recheck_ttl = 60
+
+    def note_write(self, competition_id: int, storage: Optional[str] = None,
+                   player_name: Optional[str] = None, points_delta: Optional[int] = None):
+        """Record a write to a competition so cached standings are not reused"""
+        self.write_versions[competition_id] = self.write_versions.get(competition_id, 0) + 1
+        if storage == STORAGE_V2:
+            # Once a competition has events it stays on the V2 backend
+            self.storage_versions[competition_id] = STORAGE_V2
+        for key in [k for k in self.cache if k[0] == competition_id]:
+            del self.cache[key]
+        # Scored writes move the player in the rank index; anything else forces a reload
+        if player_name is not None and points_delta is not None:
+            return rank_indexes.add_competition_points(competition_id, player_name, points_delta)
+        rank_indexes.drop_competition(competition_id)
+        return None
+
+    async def get_storage_version(self, conn, competition_id: int) -> str:
+        """Resolve which table holds the competition's scores"""
+        version = self.storage_versions.get(competition_id)
+        if version == STORAGE_V2:
+            return version
+        checked_at = self.storage_checked_at.get(competition_id, 0)
+        if version == STORAGE_V1 and time.time() - checked_at < self.v1_recheck_ttl:
+            return version
+
+        has_events = await conn.fetchval(
+            "SELECT EXISTS (SELECT 1 FROM booking_competition_events WHERE competition_id = $1)",
+            competition_id,
+        )
+        version = STORAGE_V2 if has_events else STORAGE_V1
+        self.storage_versions[competition_id] = version
+        self.storage_checked_at[competition_id] = time.time()
+        return version
+
+    async def get_standings(self, conn, competition_id: int) -> List[Dict[str, Any]]:
+        """Standings for every player with entries or enrollment, best first"""
+        write_version = self.write_versions.get(competition_id, 0)
+        key = (competition_id, write_version)
+        cached = self.cache.get(key)
+        if cached and time.time() - cached[0] < self.cache_ttl:
+            return cached[1]
+
+        storage = await self.get_storage_version(conn, competition_id)
+        if storage == STORAGE_V2:
+            rows = await self._aggregate_events(conn, competition_id)
+        else:
+            rows = await self._aggregate_entries(conn, competition_id)
+        participants = await conn.fetch(
+            """
+            SELECT player_name, team_name
+            FROM booking_competition_participants
+            WHERE competition_id = $1
+            """,
+            competition_id,
+        )
+        standings = self._fold(rows, participants)
+        rank_indexes.load_competition(
+            competition_id, {s["player_name"]: s["total_points"] for s in standings}
+        )
+
+        if len(self.cache) >= self.max_cache_entries:
+            oldest = min(self.cache, key=lambda k: self.cache[k][0])
+            del self.cache[oldest]
+        self.cache[key] = (time.time(), standings)
+        return standings
+
+    async def _aggregate_entries(self, conn, competition_id: int):
+        """V1 backend: per player and activity type totals from competition_entry_totals"""
+        return await fetch_type_totals(conn, competition_id)
+
+    async def _aggregate_events(self, conn, competition_id: int):
+        """V2 backend: per player and activity type totals from events"""
+        return await conn.fetch(
+            """
+            SELECT player_name,
+                   type AS activity_type,
+                   COUNT(*) AS count,
+                   COALESCE(SUM(points), 0) AS points,
+                   MAX(created_at) AS last_at
+            FROM booking_competition_events
+            WHERE competition_id = $1
+            GROUP BY player_name, type
+            """,
+            competition_id,
+        )
+
+    def _fold(self, rows, participants) -> List[Dict[str, Any]]:
+        """Combine per-type aggregate rows and enrollment into sorted standings"""
+        teams = {p["player_name"]: p["team_name"] for p in participants}
+        by_player: Dict[str, Dict[str, Any]] = {}
+
+        def standing(player_name: str) -> Dict[str, Any]:
+            if player_name not in by_player:
+                by_player[player_name] = {
+                    "player_name": player_name,
+                    "team_name": teams.get(player_name),
+                    "is_participant": player_name in teams,
+                    "total_points": 0,
+                    "entries": 0,
+                    "last_entry_at": None,
+                    "breakdown": {},
+                }
+            return by_player[player_name]
+
+        for r in rows:
+            s = standing(r["player_name"])
+            count = int(r["count"] or 0)
+            points = int(r["points"] or 0)
+            s["total_points"] += points
+            s["entries"] += count
+            if r["last_at"] and (s["last_entry_at"] is None or r["last_at"] > s["last_entry_at"]):
+                s["last_entry_at"] = r["last_at"]
+            if r["activity_type"]:
+                s["breakdown"][r["activity_type"]] = {"count": count, "total_points": points}
+
+        for player_name in teams:
+            standing(player_name)
+
+        return sorted(
+            by_player.values(),
+            key=lambda s: (-s["total_points"], s["last_entry_at"] is None, s["last_entry_at"] or datetime.max),
+        )
+
+
+def team_totals(standings: List[Dict[str, Any]], team_name: Optional[str]) -> Dict[str, Any]:
+    """Sum enrolled members' standings for one team"""
+    members = [s for s in standings if s["is_participant"] and s["team_name"] == team_name]
+    last_times = [s["last_entry_at"] for s in members if s["last_entry_at"]]
+    return {
+        "team_name": team_name,
+        "total_points": sum(s["total_points"] for s in members),
+        "member_count": len(members),
+        "entries": sum(s["entries"] for s in members),
+        "last_activity_at": max(last_times) if last_times else None,
+    }
+
+
+# Global leaderboard service instance
+leaderboard_service = LeaderboardService()
+
+def note_competition_write(competition_id: int, storage: Optional[str] = None,
+                           player_name: Optional[str] = None, points_delta: Optional[int] = None):
+    """Helper to invalidate cached standings after a write; returns (old_rank, new_rank) when known"""
+    return leaderboard_service.note_write(competition_id, storage, player_name, points_delta)
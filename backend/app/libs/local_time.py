@@ -0,0 +1,102 @@
+# Oslo Local Time Columns
+# The team works in Europe/Oslo, so "today", daily caps, streaks and charts
+# are all bucketed by Oslo-local day. Instead of evaluating
+# (created_at AT TIME ZONE 'Europe/Oslo')::date per row, which no index can
+# serve, activities and the booking competition tables carry stored generated
+# local_date / local_hour columns with composite indexes on them.
+# ensure_local_time_columns is the migration: it runs at startup and adds the
+# columns and indexes where they are missing.
+
+from datetime import date, datetime
+from zoneinfo import ZoneInfo
+
+import asyncpg
+import databutton as db
+
+LOCAL_TZ = "Europe/Oslo"
+
+# Serialises the migration across workers
+LOCAL_TIME_LOCK_KEY = 0x0A110
+
+# table -> (timestamp column the local day is derived from, indexes on local_date)
+LOCAL_TIME_TABLES = {
+    "activities": ("created_at", [
+        ("idx_activities_profile_local_date", "profile_id, local_date"),
+        ("idx_activities_quarter_local_date", "quarter_id, local_date"),
+    ]),
+    "booking_competition_entries": ("created_at", [
+        ("idx_bc_entries_comp_player_local_date", "competition_id, player_name, local_date"),
+    ]),
+    "booking_competition_events": ("ts", [
+        ("idx_bc_events_comp_player_local_date", "competition_id, player_name, local_date"),
+        ("idx_bc_events_comp_local_date_ts", "competition_id, local_date, ts"),
+    ]),
+}
+
+
+def sql_local_date(timestamptz: str) -> str:
+    """SQL for the Oslo date of a timestamptz expression, to compare with local_date"""
+    return f"({timestamptz} AT TIME ZONE '{LOCAL_TZ}')::date"
+
+
+# Today's Oslo date inside SQL (stable, evaluated once per statement)
+SQL_LOCAL_TODAY = sql_local_date("NOW()")
+
+_schema_ready = False
+
+
+def local_today() -> date:
+    """Today's date in Oslo"""
+    return datetime.now(ZoneInfo(LOCAL_TZ)).date()
+
+
+def local_timestamp_expr(column: str, data_type: str) -> str:
+    """Immutable Oslo wall-clock expression for a timestamp column.
+
+    Naive timestamps are stored in UTC (server default), so they are pinned
+    to UTC first; a bare AT TIME ZONE would depend on the session time zone
+    and is not allowed in a generated column.
+    """
+    if data_type == "timestamp with time zone":
+        return f"({column} AT TIME ZONE '{LOCAL_TZ}')"
+    return f"(({column} AT TIME ZONE 'UTC') AT TIME ZONE '{LOCAL_TZ}')"
+
+
+async def ensure_local_time_columns(conn: asyncpg.Connection):
+    """Add local_date/local_hour generated columns and their indexes where missing"""
+    global _schema_ready
+    if _schema_ready:
+        return
+    async with conn.transaction():
+        await conn.execute("SELECT pg_advisory_xact_lock($1)", LOCAL_TIME_LOCK_KEY)
+        for table, (source, indexes) in LOCAL_TIME_TABLES.items():
+            columns = {
+                r["column_name"]: r["data_type"]
+                for r in await conn.fetch(
+                    "SELECT column_name, data_type FROM information_schema.columns WHERE table_name = $1",
+                    table,
+                )
+            }
+            if source not in columns:
+                # Table not created yet (or no timestamp); its owner module creates it
+                continue
+            if "local_date" not in columns:
+                expr = local_timestamp_expr(source, columns[source])
+                await conn.execute(
+                    f"""
+                    ALTER TABLE {table}
+                        ADD COLUMN IF NOT EXISTS local_date DATE GENERATED ALWAYS AS ({expr}::date) STORED,
+                        ADD COLUMN IF NOT EXISTS local_hour SMALLINT GENERATED ALWAYS AS (EXTRACT(HOUR FROM {expr})::smallint) STORED
+                    """
+                )
+            for name, cols in indexes:
+                await conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({cols})")
+    _schema_ready = True
+
+
+async def migrate_at_startup():
+    conn = await asyncpg.connect(db.secrets.get("DATABASE_URL_DEV"))
+    try:
+        await ensure_local_time_columns(conn)
+    finally:
+        await conn.close()
@@ -237,13 +237,17 @@ class AntiCheatReportResponse(BaseModel):
 # Admin Preview Models
 class ScoringPreviewRequest(BaseModel):
     rules: CompetitionRules
-    sample_events: List[Dict[str, Any]] = Field(..., description="Sample events to test scoring against")
+    sample_events: List[Dict[str, Any]] = Field(default_factory=list, description="Sample events to test scoring against")
+    competition_id: Optional[int] = Field(None, description="Replay this competition's recorded events instead of sample_events")
 
 class ScoringPreviewResponse(BaseModel):
     calculated_scores: List[PlayerScore]
     rules_validation: Dict[str, Any]
     warnings: List[str] = Field(default_factory=list)
     errors: List[str] = Field(default_factory=list)
+    player_deltas: List[Dict[str, Any]] = Field(default_factory=list)
+    rule_trigger_counts: Dict[str, int] = Field(default_factory=dict)
+    events_simulated: int = 0
 
 # Results Snapshot Models
 class CompetitionResultCreate(BaseModel):
@@ -0,0 +1,195 @@
+# Transactional Outbox
+# Side effects of a write (mirroring activities into competitions and back,
+# cache/VFX notifications) are recorded as outbox rows in the same transaction
+# as the write itself, then delivered by a background dispatcher. Delivery is
+# at-least-once: rows are claimed with FOR UPDATE SKIP LOCKED, each handler
+# runs in a savepoint of the claiming transaction, failures are retried with
+# exponential backoff and rows that keep failing end up in outbox_dead_letters.
+
+from typing import Awaitable, Callable, Dict, Any, List, Optional
+import asyncio
+import json
+import logging
+
+import asyncpg
+import databutton as db
+
+logger = logging.getLogger(__name__)
+
+OutboxHandler = Callable[[asyncpg.Connection, Dict[str, Any]], Awaitable[None]]
+
+OUTBOX_BATCH_SIZE = 50
+OUTBOX_POLL_SECONDS = 2
+OUTBOX_MAX_ATTEMPTS = 8
+OUTBOX_MAX_BACKOFF_SECONDS = 3600
+
+OUTBOX_DDL = """
+    CREATE TABLE IF NOT EXISTS outbox (
+        id BIGSERIAL PRIMARY KEY,
+        topic TEXT NOT NULL,
+        payload JSONB NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        available_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+        last_error TEXT,
+        created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+        processed_at TIMESTAMPTZ
+    );
+    CREATE INDEX IF NOT EXISTS idx_outbox_pending ON outbox (available_at, id) WHERE status = 'pending';
+    CREATE OR REPLACE VIEW outbox_dead_letters AS
+        SELECT id, topic, payload, attempts, last_error, created_at, processed_at
+        FROM outbox
+        WHERE status = 'dead';
+"""
+
+_schema_ready = False
+
+async def ensure_outbox_table(conn: asyncpg.Connection):
+    """Create the outbox table and dead-letter view once per process"""
+    global _schema_ready
+    if _schema_ready:
+        return
+    await conn.execute(OUTBOX_DDL)
+    _schema_ready = True
+
+
+# topic -> handler
+_handlers: Dict[str, OutboxHandler] = {}
+
+def outbox_handler(topic: str):
+    """Register the handler that delivers messages of a topic"""
+    def register(func: OutboxHandler) -> OutboxHandler:
+        _handlers[topic] = func
+        return func
+    return register
+
+async def enqueue(conn: asyncpg.Connection, topic: str, payload: Dict[str, Any]):
+    """Record a side effect; call inside the transaction of the write it belongs to"""
+    await ensure_outbox_table(conn)
+    await conn.execute(
+        "INSERT INTO outbox (topic, payload) VALUES ($1, $2::jsonb)",
+        topic, json.dumps(payload, default=str),
+    )
+    outbox_dispatcher.wake()
+
+def backoff_seconds(attempts: int) -> int:
+    return min(5 * 2 ** (attempts - 1), OUTBOX_MAX_BACKOFF_SECONDS)
+
+
+async def dispatch_batch(conn: asyncpg.Connection, batch_size: int = OUTBOX_BATCH_SIZE) -> int:
+    """Deliver one batch of due messages; returns how many were claimed"""
+    await ensure_outbox_table(conn)
+    async with conn.transaction():
+        rows = await conn.fetch(
+            """
+            SELECT id, topic, payload, attempts
+            FROM outbox
+            WHERE status = 'pending' AND available_at <= NOW()
+            ORDER BY id
+            LIMIT $1
+            FOR UPDATE SKIP LOCKED
+            """,
+            batch_size,
+        )
+        delivered: List[int] = []
+        for row in rows:
+            payload = row["payload"]
+            if isinstance(payload, str):
+                payload = json.loads(payload)
+            handler = _handlers.get(row["topic"])
+            try:
+                if handler is None:
+                    raise LookupError(f"No outbox handler for topic {row['topic']!r}")
+                async with conn.transaction():
+                    await handler(conn, payload)
+                delivered.append(row["id"])
+            except Exception as e:
+                attempts = row["attempts"] + 1
+                logger.warning("outbox message %s (%s) failed, attempt %s: %s", row["id"], row["topic"], attempts, e)
+                await conn.execute(
+                    """
+                    UPDATE outbox
+                       SET attempts = $2,
+                           last_error = $3,
+                           status = CASE WHEN $2 >= $4 THEN 'dead' ELSE 'pending' END,
+                           processed_at = CASE WHEN $2 >= $4 THEN NOW() ELSE NULL END,
+                           available_at = NOW() + make_interval(secs => $5)
+                     WHERE id = $1
+                    """,
+                    row["id"], attempts, str(e), OUTBOX_MAX_ATTEMPTS, backoff_seconds(attempts),
+                )
+        if delivered:
+            await conn.execute(
+                "UPDATE outbox SET status = 'done', processed_at = NOW() WHERE id = ANY($1::bigint[])",
+                delivered,
+            )
+    return len(rows)
+
+async def retry_dead_letter(conn: asyncpg.Connection, message_id: int) -> bool:
+    """Put a dead message back in the queue with a fresh attempt budget"""
+    await ensure_outbox_table(conn)
+    result = await conn.execute(
+        """
+        UPDATE outbox SET status = 'pending', attempts = 0, available_at = NOW(), processed_at = NULL
+         WHERE id = $1 AND status = 'dead'
+        """,
+        message_id,
+    )
+    outbox_dispatcher.wake()
+    return result != "UPDATE 0"
+
+async def purge_delivered(conn: asyncpg.Connection, older_than_days: int):
+    await ensure_outbox_table(conn)
+    await conn.execute(
+        "DELETE FROM outbox WHERE status = 'done' AND processed_at < NOW() - make_interval(days => $1)",
+        older_than_days,
+    )
+
+
+class OutboxDispatcher:
+    """Background loop draining the outbox, woken by local enqueues or polling"""
+
+    def __init__(self, poll_seconds: float = OUTBOX_POLL_SECONDS):
+        self.poll_seconds = poll_seconds
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def wake(self):
+        self._wake.set()
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                conn = await asyncpg.connect(db.secrets.get("DATABASE_URL_DEV"))
+                try:
+                    # Keep draining while full batches come back
+                    while await dispatch_batch(conn) == OUTBOX_BATCH_SIZE:
+                        pass
+                finally:
+                    await conn.close()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("outbox dispatch failed")
+
+
+# Global outbox dispatcher instance
+outbox_dispatcher = OutboxDispatcher()
@@ -0,0 +1,153 @@
+# Online Pace Estimator
+# Exponentially weighted daily rates per profile and metric (book, opp, deal,
+# points), so goal predictions follow recent momentum instead of the
+# quarter-to-date average. The state is (ewma, ewvar, days_observed) over
+# closed days plus the still-open day's value; profile_counters keeps it in
+# the profile_pace table and advances it on every logged activity with the
+# same fold as fold_days below.
+#
+# backtest replays finished quarters day by day and measures how far the
+# EWMA and the linear quarter-to-date projection land from the real totals.
+
+from typing import Dict, Iterable, List, Optional, Tuple
+from dataclasses import dataclass
+from datetime import date, timedelta
+import math
+
+# Weight of a day halves after this many days
+PACE_HALF_LIFE_DAYS = 14
+PACE_ALPHA = 1 - 0.5 ** (1 / PACE_HALF_LIFE_DAYS)
+# Longest run of days folded at once (gaps beyond this carry no weight anyway)
+MAX_FOLD_DAYS = 366
+# z for the 80% band around the rate
+BAND_Z = 1.2816
+
+PACE_METRICS = ("book", "opp", "deal", "points")
+
+
+@dataclass
+class PaceState:
+    ewma: float = 0.0
+    ewvar: float = 0.0
+    days_observed: int = 0
+    open_day: Optional[date] = None
+    open_value: float = 0.0
+
+    @classmethod
+    def from_row(cls, row) -> "PaceState":
+        return cls(row["ewma"], row["ewvar"], row["days_observed"], row["open_day"], row["open_value"])
+
+    def fold_days(self, until: date) -> "PaceState":
+        """Close the open day and the empty days before until (the trigger's pace_fold)"""
+        if self.open_day is None or until <= self.open_day:
+            return self
+        ewma, ewvar, n = self.ewma, self.ewvar, self.days_observed
+        x = self.open_value
+        for _ in range(min((until - self.open_day).days, MAX_FOLD_DAYS)):
+            diff = x - ewma
+            ewma += PACE_ALPHA * diff
+            ewvar = (1 - PACE_ALPHA) * (ewvar + PACE_ALPHA * diff * diff)
+            n += 1
+            x = 0.0
+        return PaceState(ewma, ewvar, n, until, 0.0)
+
+    def observe(self, day: date, value: float) -> "PaceState":
+        """Add value on day (later days close the open one first)"""
+        if self.open_day is None:
+            return PaceState(open_day=day, open_value=value)
+        if day > self.open_day:
+            state = self.fold_days(day)
+            state.open_value = value
+            return state
+        return PaceState(self.ewma, self.ewvar, self.days_observed, self.open_day, self.open_value + value)
+
+    def rate(self, today: date) -> Tuple[float, float]:
+        """(daily rate, standard error) over the days closed before today"""
+        state = self.fold_days(today)
+        # Bias correction: the average starts at 0, so early on it carries less than full weight
+        weight = 1 - (1 - PACE_ALPHA) ** state.days_observed
+        if weight <= 0:
+            return 0.0, 0.0
+        rate = max(0.0, state.ewma / weight)
+        variance = max(0.0, state.ewvar / weight)
+        # Effective sample size of an EWMA is (2 - alpha) / alpha
+        return rate, math.sqrt(variance * PACE_ALPHA / (2 - PACE_ALPHA))
+
+
+@dataclass
+class PacePrediction:
+    days_to_goal: Optional[int]
+    low_days: Optional[int]   # at the fast end of the band
+    high_days: Optional[int]  # at the slow end; None when the slow rate is 0
+    daily_rate: float
+
+
+def _days_needed(remaining: float, rate: float) -> Optional[int]:
+    if rate <= 0:
+        return None
+    return math.ceil(remaining / rate)
+
+
+def predict(current: int, goal: int, state: Optional[PaceState], today: date) -> PacePrediction:
+    """Days to reach goal at the EWMA rate, with an 80% band"""
+    if current >= goal:
+        return PacePrediction(0, 0, 0, 0.0)
+    if state is None:
+        return PacePrediction(None, None, None, 0.0)
+    rate, se = state.rate(today)
+    remaining = goal - current
+    return PacePrediction(
+        days_to_goal=_days_needed(remaining, rate),
+        low_days=_days_needed(remaining, rate + BAND_Z * se),
+        high_days=_days_needed(remaining, rate - BAND_Z * se),
+        daily_rate=round(rate, 3),
+    )
+
+
+def replay(daily: Iterable[Tuple[date, float]], start: date) -> PaceState:
+    """State after observing sparse (day, value) pairs from start on (days in order)"""
+    state = PaceState(open_day=start)
+    for day, value in daily:
+        state = state.observe(day, value)
+    return state
+
+
+def backtest(series: Dict[int, List[Tuple[date, float]]], start: date, end: date,
+             checkpoint_every: int = 7) -> Dict[str, Dict[str, float]]:
+    """Error of end-of-quarter projections made at every checkpoint of a finished quarter.
+
+    series maps a profile to its sparse (day, value) pairs for one metric. At
+    each checkpoint day both methods project the final total as the total so
+    far plus rate x days left: "linear" with the quarter-to-date average,
+    "ewma" with the estimator. Returns MAE and MAPE (over non-zero finals)
+    per method.
+    """
+    total_days = (end - start).days + 1
+    errors: Dict[str, List[Tuple[float, float]]] = {"linear": [], "ewma": []}
+    for daily in series.values():
+        daily = sorted(daily)
+        final = sum(v for _, v in daily)
+        state, so_far, i = PaceState(open_day=start), 0.0, 0
+        for offset in range(checkpoint_every, total_days, checkpoint_every):
+            today = start + timedelta(days=offset)
+            # Feed the days before the checkpoint, once per quarter overall
+            while i < len(daily) and daily[i][0] < today:
+                state = state.observe(*daily[i])
+                so_far += daily[i][1]
+                i += 1
+            days_left = total_days - offset
+            ewma_rate, _ = state.rate(today)
+            projections = {"linear": so_far + so_far / offset * days_left, "ewma": so_far + ewma_rate * days_left}
+            for method, projected in projections.items():
+                errors[method].append((projected, final))
+
+    result = {}
+    for method, pairs in errors.items():
+        abs_errors = [abs(p - f) for p, f in pairs]
+        pct = [abs(p - f) / f for p, f in pairs if f]
+        result[method] = {
+            "checkpoints": len(pairs),
+            "mae": round(sum(abs_errors) / len(abs_errors), 3) if abs_errors else 0.0,
+            "mape": round(sum(pct) / len(pct) * 100, 2) if pct else 0.0,
+        }
+    return result
@@ -0,0 +1,397 @@
+# Per-Profile Activity Counters
+# profile_counters keeps each profile's (and so each player-quarter's) activity
+# totals: books, opps, deals, activity count, activity points and the last
+# activity time. A trigger on activities updates the row inside the same
+# transaction that logs, edits or deletes an activity, so profile-level reads
+# are primary-key lookups. reconcile_profile_counters is the scheduled check
+# that detects and repairs drift against activities.
+#
+# points here is the sum of activity points; profiles.points additionally
+# includes challenge rewards and stays the race score.
+#
+# profile_pace stores the online pace estimator state (app.libs.pace) per
+# profile and metric next to the counters; the same trigger advances it on
+# insert. Edits and deletes are picked up by rebuild_profile_pace, which
+# replays the quarters that have not ended.
+
+from typing import Dict, List, Optional, Tuple
+from collections import defaultdict
+from datetime import date
+
+import asyncpg
+
+from app.libs.local_time import SQL_LOCAL_TODAY, ensure_local_time_columns
+from app.libs.pace import PACE_ALPHA, MAX_FOLD_DAYS, PaceState, replay
+
+# Serialises first-time creation across workers
+COUNTERS_LOCK_KEY = 0x0A11F
+
+# The EWMA fold of app.libs.pace.PaceState, in SQL for the trigger
+PACE_DDL = f"""
+    CREATE TABLE IF NOT EXISTS profile_pace (
+        profile_id INTEGER NOT NULL,
+        metric TEXT NOT NULL,
+        ewma DOUBLE PRECISION NOT NULL DEFAULT 0,
+        ewvar DOUBLE PRECISION NOT NULL DEFAULT 0,
+        days_observed INTEGER NOT NULL DEFAULT 0,
+        open_day DATE NOT NULL,
+        open_value DOUBLE PRECISION NOT NULL DEFAULT 0,
+        PRIMARY KEY (profile_id, metric)
+    );
+
+    CREATE OR REPLACE FUNCTION pace_fold(
+        ewma DOUBLE PRECISION, ewvar DOUBLE PRECISION, days_observed INTEGER,
+        open_day DATE, open_value DOUBLE PRECISION, until_day DATE,
+        OUT new_ewma DOUBLE PRECISION, OUT new_ewvar DOUBLE PRECISION, OUT new_days INTEGER
+    ) AS $$
+    DECLARE
+        alpha CONSTANT DOUBLE PRECISION := {PACE_ALPHA!r};
+        x DOUBLE PRECISION := open_value;
+        diff DOUBLE PRECISION;
+    BEGIN
+        new_ewma := ewma;
+        new_ewvar := ewvar;
+        new_days := days_observed;
+        FOR i IN 1 .. LEAST(until_day - open_day, {MAX_FOLD_DAYS}) LOOP
+            diff := x - new_ewma;
+            new_ewma := new_ewma + alpha * diff;
+            new_ewvar := (1 - alpha) * (new_ewvar + alpha * diff * diff);
+            new_days := new_days + 1;
+            x := 0;
+        END LOOP;
+    END
+    $$ LANGUAGE plpgsql IMMUTABLE;
+
+    CREATE OR REPLACE FUNCTION profile_pace_observe(
+        p_profile INTEGER, p_quarter INTEGER, p_metric TEXT, p_value DOUBLE PRECISION, p_day DATE
+    ) RETURNS void AS $$
+    DECLARE
+        st profile_pace%ROWTYPE;
+        f RECORD;
+    BEGIN
+        -- New rows start at the quarter start so quiet early days count as zeros
+        INSERT INTO profile_pace (profile_id, metric, open_day)
+        VALUES (p_profile, p_metric,
+                LEAST(p_day, COALESCE((SELECT start_date FROM quarters WHERE id = p_quarter), p_day)))
+        ON CONFLICT (profile_id, metric) DO NOTHING;
+        SELECT * INTO st FROM profile_pace WHERE profile_id = p_profile AND metric = p_metric FOR UPDATE;
+        IF p_day > st.open_day THEN
+            SELECT * INTO f FROM pace_fold(st.ewma, st.ewvar, st.days_observed, st.open_day, st.open_value, p_day);
+            UPDATE profile_pace
+               SET ewma = f.new_ewma, ewvar = f.new_ewvar, days_observed = f.new_days,
+                   open_day = p_day, open_value = p_value
+             WHERE profile_id = p_profile AND metric = p_metric;
+        ELSE
+            -- Same day (or backdated, approximated until the rebuild)
+            UPDATE profile_pace
+               SET open_value = open_value + p_value
+             WHERE profile_id = p_profile AND metric = p_metric;
+        END IF;
+    END
+    $$ LANGUAGE plpgsql;
+"""
+
+COUNTERS_DDL = """
+    CREATE TABLE IF NOT EXISTS profile_counters (
+        profile_id INTEGER PRIMARY KEY,
+        quarter_id INTEGER NOT NULL,
+        books INTEGER NOT NULL DEFAULT 0,
+        opps INTEGER NOT NULL DEFAULT 0,
+        deals INTEGER NOT NULL DEFAULT 0,
+        activity_count INTEGER NOT NULL DEFAULT 0,
+        points INTEGER NOT NULL DEFAULT 0,
+        last_activity_at TIMESTAMPTZ
+    );
+    CREATE INDEX IF NOT EXISTS idx_profile_counters_quarter ON profile_counters (quarter_id);
+
+    CREATE OR REPLACE FUNCTION profile_counters_apply() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP IN ('DELETE', 'UPDATE') THEN
+            UPDATE profile_counters
+               SET books = books - (OLD.type::text = 'book')::int,
+                   opps = opps - (OLD.type::text = 'opp')::int,
+                   deals = deals - (OLD.type::text = 'deal')::int,
+                   activity_count = activity_count - 1,
+                   points = points - COALESCE(OLD.points, 0),
+                   last_activity_at = (SELECT MAX(created_at) FROM activities WHERE profile_id = OLD.profile_id)
+             WHERE profile_id = OLD.profile_id;
+        END IF;
+        IF TG_OP = 'INSERT' THEN
+            IF NEW.type::text IN ('book', 'opp', 'deal') THEN
+                PERFORM profile_pace_observe(NEW.profile_id, NEW.quarter_id, NEW.type::text, 1, NEW.local_date);
+            END IF;
+            PERFORM profile_pace_observe(NEW.profile_id, NEW.quarter_id, 'points', COALESCE(NEW.points, 0), NEW.local_date);
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            INSERT INTO profile_counters AS c (profile_id, quarter_id, books, opps, deals, activity_count, points, last_activity_at)
+            VALUES (NEW.profile_id, NEW.quarter_id,
+                    (NEW.type::text = 'book')::int, (NEW.type::text = 'opp')::int, (NEW.type::text = 'deal')::int,
+                    1, COALESCE(NEW.points, 0), NEW.created_at)
+            ON CONFLICT (profile_id) DO UPDATE
+               SET books = c.books + EXCLUDED.books,
+                   opps = c.opps + EXCLUDED.opps,
+                   deals = c.deals + EXCLUDED.deals,
+                   activity_count = c.activity_count + 1,
+                   points = c.points + EXCLUDED.points,
+                   last_activity_at = GREATEST(c.last_activity_at, EXCLUDED.last_activity_at);
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql;
+
+    DO $$
+    BEGIN
+        IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'activities_profile_counters') THEN
+            CREATE TRIGGER activities_profile_counters
+            AFTER INSERT OR DELETE OR UPDATE OF created_at, profile_id, type, points ON activities
+            FOR EACH ROW EXECUTE FUNCTION profile_counters_apply();
+        END IF;
+    END
+    $$;
+"""
+
+# Correct every profile whose counters differ from activities. Both sides are
+# read in one statement snapshot and the counts are corrected by adding the
+# difference, so trigger increments committed meanwhile survive and writers
+# are never locked out; last_activity_at is only overwritten where no trigger
+# touched the row since the snapshot. Returns how many rows were repaired.
+RECONCILE_SQL = """
+    WITH actual AS (
+        SELECT profile_id,
+               MIN(quarter_id) AS quarter_id,
+               COUNT(*) FILTER (WHERE type::text = 'book')::int AS books,
+               COUNT(*) FILTER (WHERE type::text = 'opp')::int AS opps,
+               COUNT(*) FILTER (WHERE type::text = 'deal')::int AS deals,
+               COUNT(*)::int AS activity_count,
+               COALESCE(SUM(points), 0)::int AS points,
+               MAX(created_at) AS last_activity_at
+        FROM activities
+        GROUP BY profile_id
+    ), drift AS (
+        SELECT profile_id,
+               COALESCE(a.quarter_id, s.quarter_id) AS quarter_id,
+               COALESCE(a.books, 0) - COALESCE(s.books, 0) AS books,
+               COALESCE(a.opps, 0) - COALESCE(s.opps, 0) AS opps,
+               COALESCE(a.deals, 0) - COALESCE(s.deals, 0) AS deals,
+               COALESCE(a.activity_count, 0) - COALESCE(s.activity_count, 0) AS activity_count,
+               COALESCE(a.points, 0) - COALESCE(s.points, 0) AS points,
+               a.last_activity_at,
+               s.last_activity_at AS seen_last_activity_at,
+               s.profile_id IS NOT NULL AS stored
+        FROM actual a
+        FULL JOIN profile_counters s USING (profile_id)
+        WHERE (a.quarter_id, a.books, a.opps, a.deals, a.activity_count, a.points, a.last_activity_at)
+              IS DISTINCT FROM
+              (s.quarter_id, s.books, s.opps, s.deals, s.activity_count, s.points, s.last_activity_at)
+    ), updated AS (
+        UPDATE profile_counters c
+           SET quarter_id = d.quarter_id,
+               books = c.books + d.books,
+               opps = c.opps + d.opps,
+               deals = c.deals + d.deals,
+               activity_count = c.activity_count + d.activity_count,
+               points = c.points + d.points,
+               last_activity_at = CASE
+                   WHEN c.last_activity_at IS NOT DISTINCT FROM d.seen_last_activity_at THEN d.last_activity_at
+                   ELSE GREATEST(c.last_activity_at, d.last_activity_at)
+               END
+          FROM drift d
+         WHERE c.profile_id = d.profile_id AND d.stored
+        RETURNING c.profile_id
+    ), inserted AS (
+        INSERT INTO profile_counters AS c (profile_id, quarter_id, books, opps, deals, activity_count, points, last_activity_at)
+        SELECT profile_id, quarter_id, books, opps, deals, activity_count, points, last_activity_at
+        FROM drift
+        WHERE NOT stored
+        ON CONFLICT (profile_id) DO UPDATE
+           SET books = c.books + EXCLUDED.books,
+               opps = c.opps + EXCLUDED.opps,
+               deals = c.deals + EXCLUDED.deals,
+               activity_count = c.activity_count + EXCLUDED.activity_count,
+               points = c.points + EXCLUDED.points,
+               last_activity_at = GREATEST(c.last_activity_at, EXCLUDED.last_activity_at)
+        RETURNING c.profile_id
+    )
+    SELECT (SELECT COUNT(*) FROM updated) + (SELECT COUNT(*) FROM inserted)
+"""
+
+# Write replayed pace rows ($1-$7) where they differ from the rows read in the
+# replay's snapshot ($8-$14). The state is not additive, so a row is only
+# overwritten or removed if it still holds what the snapshot saw; rows the
+# trigger advanced meanwhile wait for the next run. Returns rows changed.
+REPAIR_PACE_SQL = """
+    WITH fresh AS (
+        SELECT * FROM unnest($1::int[], $2::text[], $3::float8[], $4::float8[], $5::int[], $6::date[], $7::float8[])
+            AS f(profile_id, metric, ewma, ewvar, days_observed, open_day, open_value)
+    ), seen AS (
+        SELECT * FROM unnest($8::int[], $9::text[], $10::float8[], $11::float8[], $12::int[], $13::date[], $14::float8[])
+            AS s(profile_id, metric, ewma, ewvar, days_observed, open_day, open_value)
+    ), drift AS (
+        SELECT profile_id, metric,
+               f.ewma, f.ewvar, f.days_observed, f.open_day, f.open_value,
+               s.ewma AS seen_ewma, s.ewvar AS seen_ewvar, s.days_observed AS seen_days,
+               s.open_day AS seen_open_day, s.open_value AS seen_open_value,
+               f.profile_id IS NOT NULL AS active,
+               s.profile_id IS NOT NULL AS stored
+        FROM fresh f
+        FULL JOIN seen s USING (profile_id, metric)
+        WHERE (f.ewma, f.ewvar, f.days_observed, f.open_day, f.open_value)
+              IS DISTINCT FROM (s.ewma, s.ewvar, s.days_observed, s.open_day, s.open_value)
+    ), updated AS (
+        UPDATE profile_pace p
+           SET ewma = d.ewma, ewvar = d.ewvar, days_observed = d.days_observed,
+               open_day = d.open_day, open_value = d.open_value
+          FROM drift d
+         WHERE p.profile_id = d.profile_id AND p.metric = d.metric AND d.active AND d.stored
+           AND (p.ewma, p.ewvar, p.days_observed, p.open_day, p.open_value)
+               IS NOT DISTINCT FROM (d.seen_ewma, d.seen_ewvar, d.seen_days, d.seen_open_day, d.seen_open_value)
+        RETURNING 1
+    ), inserted AS (
+        INSERT INTO profile_pace (profile_id, metric, ewma, ewvar, days_observed, open_day, open_value)
+        SELECT profile_id, metric, ewma, ewvar, days_observed, open_day, open_value
+        FROM drift
+        WHERE NOT stored
+        ON CONFLICT (profile_id, metric) DO NOTHING
+        RETURNING 1
+    ), removed AS (
+        DELETE FROM profile_pace p
+         USING drift d
+         WHERE p.profile_id = d.profile_id AND p.metric = d.metric AND NOT d.active
+           AND (p.ewma, p.ewvar, p.days_observed, p.open_day, p.open_value)
+               IS NOT DISTINCT FROM (d.seen_ewma, d.seen_ewvar, d.seen_days, d.seen_open_day, d.seen_open_value)
+        RETURNING 1
+    )
+    SELECT (SELECT COUNT(*) FROM updated) + (SELECT COUNT(*) FROM inserted) + (SELECT COUNT(*) FROM removed)
+"""
+
+_schema_ready = False
+
+
+async def ensure_profile_counters(conn: asyncpg.Connection):
+    """Create the counters table and trigger once per process, backfilling on first creation"""
+    global _schema_ready
+    if _schema_ready:
+        return
+    await ensure_local_time_columns(conn)
+    async with conn.transaction():
+        await conn.execute("SELECT pg_advisory_xact_lock($1)", COUNTERS_LOCK_KEY)
+        created = await conn.fetchval("SELECT to_regclass('profile_counters') IS NULL")
+        pace_created = await conn.fetchval("SELECT to_regclass('profile_pace') IS NULL")
+        # The trigger calls the pace functions, so they go first
+        await conn.execute(PACE_DDL)
+        await conn.execute(COUNTERS_DDL)
+        if created or pace_created:
+            await conn.execute("LOCK TABLE activities IN SHARE MODE")
+        if created:
+            await conn.fetchval(RECONCILE_SQL)
+        if pace_created:
+            await _rebuild_pace(conn)
+    _schema_ready = True
+
+
+async def reconcile_profile_counters(conn: asyncpg.Connection) -> int:
+    """Repair counters that drifted from activities; returns the number of profiles fixed"""
+    await ensure_profile_counters(conn)
+    async with conn.transaction():
+        fixed = await conn.fetchval(RECONCILE_SQL)
+        # Profiles left without activities (rechecked on the locked row)
+        await conn.execute(
+            """
+            DELETE FROM profile_counters
+             WHERE activity_count = 0 AND books = 0 AND opps = 0 AND deals = 0 AND points = 0
+            """
+        )
+    return fixed
+
+
+async def _replay_pace(conn: asyncpg.Connection,
+                       quarter_ids: Optional[List[int]] = None) -> Dict[Tuple[int, str], PaceState]:
+    """Pace state per (profile, metric) replayed from activities (of quarter_ids, or all)"""
+    rows = await conn.fetch(
+        """
+        SELECT a.profile_id, q.start_date, a.local_date, a.type::text AS activity_type,
+               COUNT(*)::int AS activity_count, COALESCE(SUM(a.points), 0)::int AS points
+        FROM activities a
+        LEFT JOIN quarters q ON q.id = a.quarter_id
+        WHERE $1::int[] IS NULL OR a.quarter_id = ANY($1::int[])
+        GROUP BY a.profile_id, q.start_date, a.local_date, a.type
+        ORDER BY a.local_date
+        """,
+        quarter_ids,
+    )
+    series: Dict[Tuple[int, str], List[Tuple[date, float]]] = defaultdict(list)
+    starts: Dict[int, date] = {}
+    for r in rows:
+        start = r["start_date"] or r["local_date"]
+        starts[r["profile_id"]] = min(starts.get(r["profile_id"], start), start, r["local_date"])
+        if r["activity_type"] in ("book", "opp", "deal"):
+            series[(r["profile_id"], r["activity_type"])].append((r["local_date"], float(r["activity_count"])))
+        series[(r["profile_id"], "points")].append((r["local_date"], float(r["points"])))
+
+    return {key: replay(daily, starts[key[0]]) for key, daily in series.items()}
+
+
+def _pace_columns(keys: List[Tuple[int, str]], states: List[PaceState]) -> List[list]:
+    """profile_pace rows as the column arrays unnest() takes"""
+    return [
+        [k[0] for k in keys], [k[1] for k in keys],
+        [s.ewma for s in states], [s.ewvar for s in states],
+        [s.days_observed for s in states], [s.open_day for s in states],
+        [s.open_value for s in states],
+    ]
+
+
+async def _rebuild_pace(conn: asyncpg.Connection) -> int:
+    # First creation only: caller holds a transaction with activities locked in SHARE mode
+    states = await _replay_pace(conn)
+    await conn.execute("DELETE FROM profile_pace")
+    await conn.execute(
+        """
+        INSERT INTO profile_pace (profile_id, metric, ewma, ewvar, days_observed, open_day, open_value)
+        SELECT * FROM unnest($1::int[], $2::text[], $3::float8[], $4::float8[], $5::int[], $6::date[], $7::float8[])
+        """,
+        *_pace_columns(list(states), list(states.values())),
+    )
+    return len(states)
+
+
+async def rebuild_profile_pace(conn: asyncpg.Connection) -> int:
+    """Replay the pace estimator for quarters that have not ended; returns the number of rows corrected"""
+    await ensure_profile_counters(conn)
+    # History and stored state from one snapshot, without blocking writers
+    async with conn.transaction(isolation="repeatable_read", readonly=True):
+        quarter_ids = [
+            r["id"] for r in await conn.fetch(f"SELECT id FROM quarters WHERE end_date >= {SQL_LOCAL_TODAY}")
+        ]
+        if not quarter_ids:
+            return 0
+        states = await _replay_pace(conn, quarter_ids)
+        seen = await conn.fetch(
+            """
+            SELECT p.profile_id, p.metric, p.ewma, p.ewvar, p.days_observed, p.open_day, p.open_value
+            FROM profile_pace p
+            JOIN profiles pr ON pr.id = p.profile_id
+            WHERE pr.quarter_id = ANY($1::int[])
+            """,
+            quarter_ids,
+        )
+    seen_keys = [(r["profile_id"], r["metric"]) for r in seen]
+    return await conn.fetchval(
+        REPAIR_PACE_SQL,
+        *_pace_columns(list(states), list(states.values())),
+        *_pace_columns(seen_keys, [PaceState.from_row(r) for r in seen]),
+    )
+
+
+async def profile_pace(conn: asyncpg.Connection, profile_id: int) -> Dict[str, PaceState]:
+    """Pace estimator state per metric for a profile (metrics without activity are absent)"""
+    await ensure_profile_counters(conn)
+    rows = await conn.fetch(
+        """
+        SELECT metric, ewma, ewvar, days_observed, open_day, open_value
+        FROM profile_pace
+        WHERE profile_id = $1
+        """,
+        profile_id,
+    )
+    return {r["metric"]: PaceState.from_row(r) for r in rows}
@@ -0,0 +1,111 @@
+# Rank Index for Quarter and Competition Standings
+# Keeps players ordered by score in memory so rank and neighbour lookups are
+# O(log n) bisects instead of a ROW_NUMBER() over every profile and activity.
+
+from typing import Dict, List, Optional, Tuple
+from bisect import bisect_left, insort
+import time
+
+from app.libs.competition_vfx import vfx_manager
+
+
+class RankIndex:
+    """Players sorted by score (highest first, then name)"""
+
+    def __init__(self):
+        self.keys: List[Tuple[int, str]] = []  # (-score, player_name), ascending
+        self.scores: Dict[str, int] = {}
+        self.loaded_at = time.time()
+
+    def load(self, scores: Dict[str, int]):
+        """Replace the whole index (silent, no rank events)"""
+        self.scores = dict(scores)
+        self.keys = sorted((-score, name) for name, score in self.scores.items())
+        self.loaded_at = time.time()
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def rank(self, player_name: str) -> Optional[int]:
+        """1-based competition rank: players with equal score share a rank"""
+        if player_name not in self.scores:
+            return None
+        return bisect_left(self.keys, (-self.scores[player_name],)) + 1
+
+    def neighbours(self, player_name: str, count: int = 1) -> Dict[str, List[Dict[str, int]]]:
+        """Players directly above and below in the ordering"""
+        if player_name not in self.scores:
+            return {"above": [], "below": []}
+        pos = bisect_left(self.keys, (-self.scores[player_name], player_name))
+        above = self.keys[max(0, pos - count):pos]
+        below = self.keys[pos + 1:pos + 1 + count]
+        return {
+            "above": [{"player_name": n, "score": -s} for s, n in above],
+            "below": [{"player_name": n, "score": -s} for s, n in below],
+        }
+
+    def set_score(self, player_name: str, score: int) -> Tuple[Optional[int], int]:
+        """Move a player to a new score and return (old_rank, new_rank)"""
+        old_rank = self.rank(player_name)
+        if player_name in self.scores:
+            pos = bisect_left(self.keys, (-self.scores[player_name], player_name))
+            del self.keys[pos]
+        self.scores[player_name] = score
+        insort(self.keys, (-score, player_name))
+        return old_rank, self.rank(player_name)
+
+    def add_points(self, player_name: str, delta: int) -> Tuple[Optional[int], int]:
+        return self.set_score(player_name, self.scores.get(player_name, 0) + delta)
+
+
+class RankIndexManager:
+    """Rank indexes per quarter and per competition"""
+
+    def __init__(self):
+        self.quarters: Dict[int, RankIndex] = {}
+        self.competitions: Dict[int, RankIndex] = {}
+        # Profiles can also change outside the logging path (admin edits, bonuses)
+        self.quarter_reload_seconds = 60
+
+    async def quarter(self, conn, quarter_id: int) -> RankIndex:
+        """Quarter index by profile points, loaded from profiles when missing or stale"""
+        index = self.quarters.get(quarter_id)
+        if index is None or time.time() - index.loaded_at > self.quarter_reload_seconds:
+            rows = await conn.fetch(
+                "SELECT name, points FROM profiles WHERE quarter_id = $1",
+                quarter_id,
+            )
+            index = index or RankIndex()
+            index.load({r["name"]: int(r["points"] or 0) for r in rows})
+            self.quarters[quarter_id] = index
+        return index
+
+    def set_quarter_points(self, quarter_id: int, player_name: str, points: int) -> Optional[Tuple[Optional[int], int]]:
+        """Apply a profile points change to a loaded quarter index"""
+        index = self.quarters.get(quarter_id)
+        if index is None:
+            return None
+        return index.set_score(player_name, points)
+
+    def load_competition(self, competition_id: int, scores: Dict[str, int]) -> RankIndex:
+        index = self.competitions.setdefault(competition_id, RankIndex())
+        index.load(scores)
+        return index
+
+    def add_competition_points(self, competition_id: int, player_name: str, delta: int) -> Optional[Tuple[Optional[int], int]]:
+        """Apply a scored write to a loaded competition index and emit rank-up VFX"""
+        index = self.competitions.get(competition_id)
+        if index is None:
+            return None
+        old_rank, new_rank = index.add_points(player_name, delta)
+        if old_rank is not None and new_rank < old_rank:
+            vfx_manager.trigger_rank_up_vfx(player_name, competition_id, old_rank, new_rank)
+        return old_rank, new_rank
+
+    def drop_competition(self, competition_id: int):
+        """Forget a competition index after writes that cannot be applied as a delta"""
+        self.competitions.pop(competition_id, None)
+
+
+# Global rank index manager instance
+rank_indexes = RankIndexManager()
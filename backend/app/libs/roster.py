@@ -0,0 +1,104 @@
+# Roster Provisioning
+# The team is a fixed roster of named players. Their profiles per quarter and
+# their challenge_participants rows for per-person challenges are created here
+# in bulk (one INSERT ... SELECT unnest(...) per table) at startup and when the
+# roster changes: a quarter is created or activated, or a challenge is created.
+# Read endpoints assume these rows exist and never provision themselves.
+
+from typing import List, Optional, Sequence
+import uuid
+
+import asyncpg
+import databutton as db
+
+# The 12 fixed named players for ES Oslo team
+NAMED_PLAYERS = [
+    "RIKKE", "SIGGEN", "GARD", "THEA", "ITHY", "EMILIE",
+    "SCHOLZ", "HEFF", "KAREN", "TOBIAS", "ANDREAS", "SONDRE"
+]
+
+# goal_books, goal_opps, goal_deals for newly created roster profiles
+DEFAULT_GOALS = (10, 5, 2)
+
+
+def player_user_id(player_name: str) -> str:
+    """Deterministic profile user_id for a named player"""
+    return str(uuid.uuid5(uuid.NAMESPACE_DNS, f"es-oslo-{player_name.lower()}"))
+
+
+async def provision_profiles(
+    conn: asyncpg.Connection,
+    quarter_ids: Sequence[int],
+    player_names: Optional[Sequence[str]] = None,
+    goals: Sequence[int] = DEFAULT_GOALS,
+) -> int:
+    """Create missing profiles for every (quarter, player); returns how many were created"""
+    names = list(player_names if player_names is not None else NAMED_PLAYERS)
+    if not names or not quarter_ids:
+        return 0
+    result = await conn.execute(
+        """
+        INSERT INTO profiles (user_id, quarter_id, name, points, goal_books, goal_opps, goal_deals)
+        SELECT t.user_id::uuid, q.id, t.name, 0, $4, $5, $6
+        FROM unnest($1::text[], $2::text[]) AS t(user_id, name)
+        CROSS JOIN unnest($3::int[]) AS q(id)
+        WHERE NOT EXISTS (
+            SELECT 1 FROM profiles p WHERE p.quarter_id = q.id AND p.name = t.name
+        )
+        ON CONFLICT DO NOTHING
+        """,
+        [player_user_id(n) for n in names], names, list(quarter_ids), *goals,
+    )
+    return int(result.split()[-1])
+
+
+async def provision_participants(
+    conn: asyncpg.Connection,
+    challenge_ids: Optional[List[int]] = None,
+    quarter_ids: Optional[List[int]] = None,
+) -> int:
+    """Create zero-contribution participants for active per-person challenges"""
+    result = await conn.execute(
+        """
+        INSERT INTO challenge_participants (challenge_id, player_name, contribution)
+        SELECT c.id, p.name, 0
+        FROM challenges c
+        JOIN profiles p ON p.quarter_id = c.quarter_id
+        WHERE c.progress_mode = 'per_person' AND c.status = 'active'
+          AND ($1::int[] IS NULL OR c.id = ANY($1::int[]))
+          AND ($2::int[] IS NULL OR c.quarter_id = ANY($2::int[]))
+        ON CONFLICT (challenge_id, player_name) DO NOTHING
+        """,
+        challenge_ids, quarter_ids,
+    )
+    return int(result.split()[-1])
+
+
+async def provision_roster(conn: asyncpg.Connection, quarter_ids: Optional[List[int]] = None) -> dict:
+    """Provision profiles and per-person participants for the given quarters.
+
+    Without quarter_ids this covers the active quarter and every quarter that
+    has not ended yet, which is what startup uses.
+    """
+    if quarter_ids is None:
+        quarter_ids = [
+            r["id"] for r in await conn.fetch(
+                "SELECT id FROM quarters WHERE is_active = TRUE OR end_date >= CURRENT_DATE"
+            )
+        ]
+    if not quarter_ids:
+        return {"profiles": 0, "participants": 0}
+    async with conn.transaction():
+        profiles = await provision_profiles(conn, quarter_ids)
+        participants = await provision_participants(conn, quarter_ids=quarter_ids)
+    return {"profiles": profiles, "participants": participants}
+
+
+async def provision_at_startup():
+    conn = await asyncpg.connect(db.secrets.get("DATABASE_URL_DEV"))
+    try:
+        created = await provision_roster(conn)
+        if created["profiles"] or created["participants"]:
+            print(f"Provisioned {created['profiles']} profiles and {created['participants']} challenge participants")
+    finally:
+        await conn.close()
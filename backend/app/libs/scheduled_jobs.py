@@ -0,0 +1,146 @@
+# Scheduled Maintenance Jobs
+# Job bodies for the app scheduler. Each takes the connection the scheduler
+# holds the job's advisory lock on, and register_default_jobs wires them up
+# from the app lifespan.
+
+import asyncpg
+
+from app.libs.scheduler import Scheduler
+from app.libs.leaderboard_service import note_competition_write
+from app.libs.scoreboard_snapshots import snapshot_scheduler, take_snapshot, SNAPSHOT_INTERVAL_SECONDS
+from app.libs.idempotency import idempotency_store
+from app.libs.outbox import purge_delivered
+from app.libs.activity_rollup import repair_activity_rollup
+from app.libs.activity_heatmap import repair_heatmap
+from app.libs.profile_counters import reconcile_profile_counters, rebuild_profile_pace
+from app.libs.streaks import rebuild_streaks
+from app.libs.models_competition_v2 import CompetitionState, SnapshotType
+
+# Finished rescoring jobs and periodic snapshots of closed competitions are kept this long
+RETENTION_DAYS = 30
+OUTBOX_RETENTION_DAYS = 7
+
+
+async def competition_state_transitions(conn: asyncpg.Connection):
+    """Open scheduled competitions and close ended ones"""
+    async with conn.transaction():
+        # Competitions 2.0: drafts with a start time open when it arrives
+        opened = await conn.fetch(
+            """
+            UPDATE booking_competitions
+               SET state = $1, is_active = TRUE, updated_at = NOW()
+             WHERE rules IS NOT NULL AND state = $2
+               AND start_time <= NOW() AND end_time > NOW()
+         RETURNING id
+            """,
+            CompetitionState.ACTIVE.value, CompetitionState.DRAFT.value,
+        )
+        # Competitions 2.0: stop accepting events once ended; finalizing (awards) stays manual
+        closed_v2 = await conn.fetch(
+            """
+            UPDATE booking_competitions
+               SET state = $1, is_active = FALSE, updated_at = NOW()
+             WHERE rules IS NOT NULL AND state = $2 AND end_time <= NOW()
+         RETURNING id
+            """,
+            CompetitionState.PAUSED.value, CompetitionState.ACTIVE.value,
+        )
+        closed_v1 = await conn.fetch(
+            """
+            UPDATE booking_competitions
+               SET is_active = FALSE, updated_at = NOW()
+             WHERE rules IS NULL AND is_active = TRUE AND end_time <= NOW()
+         RETURNING id
+            """
+        )
+    for r in closed_v2:
+        # Final periodic snapshot so historical standings end at the close
+        await take_snapshot(conn, r["id"])
+    for r in [*opened, *closed_v2, *closed_v1]:
+        note_competition_write(r["id"])
+
+
+async def expire_challenges(conn: asyncpg.Connection):
+    """Mark active challenges past their end time as expired"""
+    await conn.execute(
+        """
+        UPDATE challenges
+           SET status = 'expired', updated_at = CURRENT_TIMESTAMP
+         WHERE status = 'active' AND end_time < CURRENT_TIMESTAMP
+        """
+    )
+
+
+async def purge_tables(conn: asyncpg.Connection):
+    """Remove expired idempotency keys, delivered outbox rows, old rescoring jobs and stale snapshots"""
+    await idempotency_store.purge_expired(conn)
+    await purge_delivered(conn, OUTBOX_RETENTION_DAYS)
+    if await conn.fetchval("SELECT to_regclass('competition_rescore_jobs') IS NOT NULL"):
+        await conn.execute(
+            """
+            DELETE FROM competition_rescore_jobs
+             WHERE status IN ('completed', 'failed', 'superseded')
+               AND updated_at < NOW() - make_interval(days => $1)
+            """,
+            RETENTION_DAYS,
+        )
+    # Keep only the newest periodic snapshot of competitions that are no longer live
+    await conn.execute(
+        """
+        DELETE FROM booking_competition_results r
+         USING booking_competitions c
+         WHERE r.competition_id = c.id
+           AND r.snapshot_type = $1
+           AND c.state <> $2
+           AND r.created_at < NOW() - make_interval(days => $3)
+           AND r.created_at < (
+               SELECT MAX(created_at) FROM booking_competition_results
+                WHERE competition_id = r.competition_id AND snapshot_type = $1
+           )
+        """,
+        SnapshotType.PERIODIC.value, CompetitionState.ACTIVE.value, RETENTION_DAYS,
+    )
+
+
+async def activity_rollup_repair(conn: asyncpg.Connection):
+    """Rebuild the activity rollups (daily, hour-of-week) if they drifted from raw activities"""
+    drift = await repair_activity_rollup(conn)
+    if drift:
+        print(f"activity_daily_rollup: repaired {drift} drifted buckets")
+    drift = await repair_heatmap(conn)
+    if drift:
+        print(f"activity_hour_of_week: repaired {drift} drifted buckets")
+
+
+async def profile_counters_reconcile(conn: asyncpg.Connection):
+    """Repair per-profile counters that drifted from raw activities"""
+    fixed = await reconcile_profile_counters(conn)
+    if fixed:
+        print(f"profile_counters: repaired {fixed} drifted profiles")
+
+
+async def profile_pace_rebuild(conn: asyncpg.Connection):
+    """Replay the pace estimator from history (covers edits, deletes and backdated activities)"""
+    rows = await rebuild_profile_pace(conn)
+    if rows:
+        print(f"profile_pace: corrected {rows} rows")
+
+
+async def streaks_rebuild(conn: asyncpg.Connection):
+    """Recompute streaks from history (covers deletes and backdated activities)"""
+    rows = await rebuild_streaks(conn)
+    if rows:
+        print(f"streaks: corrected {rows} rows")
+
+
+def register_default_jobs(scheduler: Scheduler):
+    scheduler.add_job("competition_state_transitions", competition_state_transitions,
+                      interval_seconds=60, jitter_seconds=5, run_on_start=True)
+    scheduler.add_job("expire_challenges", expire_challenges, cron="*/5 * * * *", jitter_seconds=20)
+    scheduler.add_job("scoreboard_snapshots", snapshot_scheduler.run_periodic,
+                      interval_seconds=SNAPSHOT_INTERVAL_SECONDS, jitter_seconds=15)
+    scheduler.add_job("purge_tables", purge_tables, cron="30 3 * * *", timeout_seconds=900)
+    scheduler.add_job("activity_rollup_repair", activity_rollup_repair, cron="45 3 * * *", timeout_seconds=900)
+    scheduler.add_job("profile_counters_reconcile", profile_counters_reconcile, cron="20 * * * *", timeout_seconds=300)
+    scheduler.add_job("streaks_rebuild", streaks_rebuild, cron="55 3 * * *", timeout_seconds=900)
+    scheduler.add_job("profile_pace_rebuild", profile_pace_rebuild, cron="5 4 * * *", timeout_seconds=900)
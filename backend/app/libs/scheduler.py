@@ -0,0 +1,288 @@
+# In-process Job Scheduler
+# Runs periodic maintenance (competition state transitions, challenge expiry,
+# purges, snapshots) inside the API process. Every worker runs the loop, but a
+# run only happens on the worker that wins pg_try_advisory_lock for the job and
+# finds it due in scheduler_jobs, so each tick executes exactly once.
+
+from typing import Awaitable, Callable, Dict, List, Any, Optional
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+import asyncio
+import logging
+import random
+import time
+import zlib
+
+import asyncpg
+import databutton as db
+
+logger = logging.getLogger(__name__)
+
+JobFunc = Callable[[asyncpg.Connection], Awaitable[Any]]
+
+SCHEDULER_TICK_SECONDS = 5
+# Namespace for advisory lock keys so they don't collide with other lock users
+ADVISORY_LOCK_NAMESPACE = 0x5C4ED
+
+SCHEDULER_JOBS_DDL = """
+    CREATE TABLE IF NOT EXISTS scheduler_jobs (
+        name TEXT PRIMARY KEY,
+        last_started_at TIMESTAMPTZ,
+        last_finished_at TIMESTAMPTZ,
+        last_duration_ms INTEGER,
+        last_status TEXT,
+        last_error TEXT,
+        run_count INTEGER NOT NULL DEFAULT 0,
+        failure_count INTEGER NOT NULL DEFAULT 0
+    )
+"""
+
+
+class CronSchedule:
+    """Five-field cron expression (minute hour day month weekday; 0 = Sunday)"""
+
+    RANGES = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 6)]
+
+    def __init__(self, expression: str, tz: str = "Europe/Oslo"):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron expression needs 5 fields: {expression!r}")
+        self.expression = expression
+        self.tz = ZoneInfo(tz)
+        self.minutes, self.hours, self.days, self.months, self.weekdays = [
+            self._parse(field, lo, hi) for field, (lo, hi) in zip(fields, self.RANGES)
+        ]
+        self.any_day = fields[2] == "*"
+        self.any_weekday = fields[4] == "*"
+
+    @staticmethod
+    def _parse(field: str, lo: int, hi: int) -> set:
+        values = set()
+        for part in field.split(","):
+            step = 1
+            if "/" in part:
+                part, step_str = part.split("/", 1)
+                step = int(step_str)
+            if part in ("*", ""):
+                start, end = lo, hi
+            elif "-" in part:
+                start, end = (int(v) for v in part.split("-", 1))
+            else:
+                start = end = int(part)
+            if start < lo or end > hi or start > end:
+                raise ValueError(f"Cron field {field!r} out of range {lo}-{hi}")
+            values.update(range(start, end + 1, step))
+        return values
+
+    def _day_matches(self, dt: datetime) -> bool:
+        day_ok = dt.day in self.days
+        weekday_ok = (dt.isoweekday() % 7) in self.weekdays
+        # Standard cron: when both are restricted either one may match
+        if not self.any_day and not self.any_weekday:
+            return day_ok or weekday_ok
+        return day_ok and weekday_ok
+
+    def next_after(self, after: datetime) -> datetime:
+        """First matching minute strictly after `after`"""
+        dt = after.astimezone(self.tz).replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = dt + timedelta(days=366 * 4)
+        while dt < limit:
+            if dt.month not in self.months:
+                dt = (dt.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(dt):
+                dt = dt.replace(hour=0, minute=0) + timedelta(days=1)
+            elif dt.hour not in self.hours:
+                dt = dt.replace(minute=0) + timedelta(hours=1)
+            elif dt.minute not in self.minutes:
+                dt += timedelta(minutes=1)
+            else:
+                return dt.astimezone(timezone.utc)
+        raise ValueError(f"Cron expression never matches: {self.expression!r}")
+
+
+class ScheduledJob:
+    """A named job with an interval or cron schedule and run metrics"""
+
+    def __init__(self, name: str, func: JobFunc, interval_seconds: Optional[float] = None,
+                 cron: Optional[str] = None, jitter_seconds: float = 0, timeout_seconds: float = 300,
+                 run_on_start: bool = False):
+        if (interval_seconds is None) == (cron is None):
+            raise ValueError("A job needs exactly one of interval_seconds or cron")
+        self.name = name
+        self.func = func
+        self.interval_seconds = interval_seconds
+        self.cron = CronSchedule(cron) if cron else None
+        self.jitter_seconds = jitter_seconds
+        self.timeout_seconds = timeout_seconds
+        # pg_try_advisory_lock(int4, int4): keep the key in signed int4 range
+        self.lock_key = zlib.crc32(name.encode()) & 0x7FFFFFFF
+        self.next_run: datetime = datetime.now(timezone.utc) if run_on_start else self._next_due(datetime.now(timezone.utc))
+        self.task: Optional[asyncio.Task] = None
+        # Metrics for this process
+        self.runs = 0
+        self.failures = 0
+        self.skipped_overrun = 0
+        self.skipped_elsewhere = 0
+        self.last_started_at: Optional[datetime] = None
+        self.last_duration_ms: Optional[float] = None
+        self.max_duration_ms = 0.0
+        self.total_duration_ms = 0.0
+        self.last_error: Optional[str] = None
+
+    def _next_due(self, after: datetime) -> datetime:
+        if self.cron:
+            due = self.cron.next_after(after)
+        else:
+            due = after + timedelta(seconds=self.interval_seconds)
+        return due + timedelta(seconds=random.uniform(0, self.jitter_seconds)) if self.jitter_seconds else due
+
+    @property
+    def min_gap(self) -> timedelta:
+        """Another worker running the job more recently than this means this tick is done"""
+        if self.interval_seconds is not None:
+            return timedelta(seconds=self.interval_seconds / 2)
+        return timedelta(seconds=30)
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "schedule": self.cron.expression if self.cron else f"every {self.interval_seconds:g}s",
+            "next_run": self.next_run,
+            "running": self.task is not None and not self.task.done(),
+            "runs": self.runs,
+            "failures": self.failures,
+            "skipped_overrun": self.skipped_overrun,
+            "skipped_elsewhere": self.skipped_elsewhere,
+            "last_started_at": self.last_started_at,
+            "last_duration_ms": self.last_duration_ms,
+            "avg_duration_ms": round(self.total_duration_ms / self.runs, 1) if self.runs else None,
+            "max_duration_ms": self.max_duration_ms,
+            "last_error": self.last_error,
+        }
+
+
+class Scheduler:
+    """asyncio loop that starts due jobs under Postgres advisory-lock leadership"""
+
+    def __init__(self, tick_seconds: float = SCHEDULER_TICK_SECONDS):
+        self.tick_seconds = tick_seconds
+        self.jobs: Dict[str, ScheduledJob] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._schema_ready = False
+
+    def add_job(self, name: str, func: JobFunc, **kwargs) -> ScheduledJob:
+        job = ScheduledJob(name, func, **kwargs)
+        self.jobs[name] = job
+        return job
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        running = [j.task for j in self.jobs.values() if j.task and not j.task.done()]
+        for task in running:
+            task.cancel()
+        if running:
+            await asyncio.gather(*running, return_exceptions=True)
+
+    def metrics(self) -> List[Dict[str, Any]]:
+        return [job.metrics() for job in self.jobs.values()]
+
+    async def _run(self):
+        while True:
+            now = datetime.now(timezone.utc)
+            for job in self.jobs.values():
+                if now < job.next_run:
+                    continue
+                job.next_run = job._next_due(now)
+                if job.task is not None and not job.task.done():
+                    # Overrun protection: never start a job while its last run is still going
+                    job.skipped_overrun += 1
+                    logger.warning("scheduler job %s still running, skipping tick", job.name)
+                    continue
+                job.task = asyncio.create_task(self._execute(job))
+            await asyncio.sleep(self.tick_seconds)
+
+    async def _execute(self, job: ScheduledJob):
+        conn = await asyncpg.connect(db.secrets.get("DATABASE_URL_DEV"))
+        try:
+            if not self._schema_ready:
+                await conn.execute(SCHEDULER_JOBS_DDL)
+                self._schema_ready = True
+            locked = await conn.fetchval("SELECT pg_try_advisory_lock($1, $2)", ADVISORY_LOCK_NAMESPACE, job.lock_key)
+            if not locked:
+                job.skipped_elsewhere += 1
+                return
+            try:
+                # The lock only serialises runs; this claims the tick so workers
+                # whose loops are slightly behind don't repeat a finished run
+                claimed = await conn.fetchval(
+                    """
+                    INSERT INTO scheduler_jobs (name, last_started_at, last_status)
+                    VALUES ($1, NOW(), 'running')
+                    ON CONFLICT (name) DO UPDATE
+                       SET last_started_at = NOW(), last_status = 'running'
+                     WHERE scheduler_jobs.last_started_at IS NULL
+                        OR scheduler_jobs.last_started_at < NOW() - $2::interval
+                    RETURNING TRUE
+                    """,
+                    job.name, job.min_gap,
+                )
+                if not claimed:
+                    job.skipped_elsewhere += 1
+                    return
+                await self._run_job(conn, job)
+            finally:
+                await conn.execute("SELECT pg_advisory_unlock($1, $2)", ADVISORY_LOCK_NAMESPACE, job.lock_key)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            job.failures += 1
+            job.last_error = str(e)
+            logger.exception("scheduler job %s failed to start: %s", job.name, e)
+        finally:
+            await conn.close()
+
+    async def _run_job(self, conn: asyncpg.Connection, job: ScheduledJob):
+        job.last_started_at = datetime.now(timezone.utc)
+        started = time.perf_counter()
+        status, error = "ok", None
+        try:
+            await asyncio.wait_for(job.func(conn), timeout=job.timeout_seconds)
+        except asyncio.TimeoutError:
+            status, error = "timeout", f"timed out after {job.timeout_seconds}s"
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            status, error = "failed", str(e)
+            logger.exception("scheduler job %s failed", job.name)
+        duration_ms = (time.perf_counter() - started) * 1000
+        job.runs += 1
+        job.last_duration_ms = round(duration_ms, 1)
+        job.total_duration_ms += duration_ms
+        job.max_duration_ms = max(job.max_duration_ms, round(duration_ms, 1))
+        job.last_error = error
+        if error:
+            job.failures += 1
+        await conn.execute(
+            """
+            UPDATE scheduler_jobs
+               SET last_finished_at = NOW(), last_duration_ms = $2, last_status = $3, last_error = $4,
+                   run_count = run_count + 1,
+                   failure_count = failure_count + CASE WHEN $3 = 'ok' THEN 0 ELSE 1 END
+             WHERE name = $1
+            """,
+            job.name, int(duration_ms), status, error,
+        )
+
+
+# Global scheduler instance
+scheduler = Scheduler()
@@ -0,0 +1,255 @@
+# Scoreboard Snapshots for Competitions 2.0
+# Periodically folds each active competition's events into a compact snapshot in
+# booking_competition_results, so historical standings only replay the events
+# logged after the nearest snapshot instead of the whole history.
+
+from typing import Dict, Any, List, Optional
+from datetime import datetime, timezone
+import asyncio
+import json
+import logging
+import os
+import time
+
+import asyncpg
+import databutton as db
+
+from app.libs.models_competition_v2 import (
+    PlayerScore, ScoreboardResponse, BookingActivityType, SnapshotType
+)
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_INTERVAL_SECONDS = int(os.environ.get("SCOREBOARD_SNAPSHOT_INTERVAL", "300"))
+# Notable events may trigger an extra snapshot, but not more often than this
+SNAPSHOT_MIN_GAP_SECONDS = 30
+# Snapshots cover events up to this long ago: created_at is the writer's
+# transaction start, so an event can commit after a later snapshot's NOW()
+SNAPSHOT_WATERMARK_LAG_SECONDS = 120
+
+
+def _parse_ts(value: Optional[str]) -> Optional[datetime]:
+    return datetime.fromisoformat(value) if value else None
+
+def _empty_state() -> Dict[str, Any]:
+    return {"as_of": None, "event_count": 0, "players": {}}
+
+def apply_events(state: Dict[str, Any], events) -> Dict[str, Any]:
+    """Fold event rows (player_name, type, points, rule_triggered, ts) into a snapshot state"""
+    players = state["players"]
+    for event in events:
+        p = players.setdefault(event["player_name"], {
+            "points": 0, "events": 0, "breakdown": {}, "multipliers": [], "combos": [], "last_activity": None,
+        })
+        p["points"] += int(event["points"] or 0)
+        p["events"] += 1
+        if event["type"]:
+            p["breakdown"][event["type"]] = p["breakdown"].get(event["type"], 0) + 1
+        rule_info = event["rule_triggered"] or {}
+        if isinstance(rule_info, str):
+            rule_info = json.loads(rule_info)
+        for name in rule_info.get("applied_multipliers", []):
+            if name not in p["multipliers"]:
+                p["multipliers"].append(name)
+        for name in rule_info.get("achieved_combos", []):
+            if name not in p["combos"]:
+                p["combos"].append(name)
+        # Activity time, as on the live scoreboard
+        ts = event["ts"].isoformat()
+        if p["last_activity"] is None or ts > p["last_activity"]:
+            p["last_activity"] = ts
+        state["event_count"] += 1
+    return state
+
+def state_to_scoreboard(competition_id: int, state: Dict[str, Any], as_of: datetime) -> ScoreboardResponse:
+    """Convert a snapshot state into the public scoreboard shape"""
+    leaderboard = []
+    for player_name, p in state["players"].items():
+        breakdown = {}
+        for activity_type, count in p["breakdown"].items():
+            try:
+                breakdown[BookingActivityType(activity_type)] = count
+            except ValueError:
+                continue
+        leaderboard.append(PlayerScore(
+            player_name=player_name,
+            total_points=p["points"],
+            event_count=p["events"],
+            breakdown=breakdown,
+            multipliers_applied=p["multipliers"],
+            combos_achieved=p["combos"],
+            last_activity=_parse_ts(p["last_activity"]),
+        ))
+    # Same ordering as ScoringEngine.calculate_scoreboard
+    leaderboard.sort(key=lambda x: (
+        -x.total_points,
+        -x.breakdown.get(BookingActivityType.BOOK, 0),
+        x.last_activity.timestamp() if x.last_activity else 0,
+    ))
+    return ScoreboardResponse(competition_id=competition_id, individual_leaderboard=leaderboard, last_updated=as_of)
+
+async def _latest_snapshot(conn, competition_id: int, at: datetime) -> Dict[str, Any]:
+    row = await conn.fetchrow(
+        """
+        SELECT snapshot FROM booking_competition_results
+        WHERE competition_id = $1 AND snapshot_type = $2 AND created_at <= $3
+        ORDER BY created_at DESC
+        LIMIT 1
+        """,
+        competition_id, SnapshotType.PERIODIC.value, at,
+    )
+    if not row:
+        return _empty_state()
+    snapshot = row["snapshot"]
+    return json.loads(snapshot) if isinstance(snapshot, str) else dict(snapshot)
+
+async def _events_between(conn, competition_id: int, after: Optional[datetime], until: datetime):
+    return await conn.fetch(
+        """
+        SELECT player_name, type, points, rule_triggered, COALESCE(ts, created_at) AS ts
+        FROM booking_competition_events
+        WHERE competition_id = $1
+          AND ($2::timestamptz IS NULL OR created_at > $2)
+          AND created_at <= $3
+        ORDER BY created_at
+        """,
+        competition_id, after, until,
+    )
+
+async def take_snapshot(conn, competition_id: int) -> Optional[Dict[str, Any]]:
+    """Write a periodic snapshot built from the previous one plus newer events"""
+    async with conn.transaction():
+        as_of = await conn.fetchval(
+            "SELECT NOW() - $1::int * INTERVAL '1 second'", SNAPSHOT_WATERMARK_LAG_SECONDS
+        )
+        state = await _latest_snapshot(conn, competition_id, as_of)
+        events = await _events_between(conn, competition_id, _parse_ts(state["as_of"]), as_of)
+        if not events and state["as_of"] is not None:
+            return None  # nothing new since the last snapshot
+        apply_events(state, events)
+        state["as_of"] = as_of.isoformat()
+        await conn.execute(
+            """
+            INSERT INTO booking_competition_results (competition_id, snapshot, snapshot_type, created_at)
+            VALUES ($1, $2, $3, $4)
+            """,
+            competition_id, json.dumps(state), SnapshotType.PERIODIC.value, as_of,
+        )
+        return state
+
+async def scoreboard_at(conn, competition_id: int, at: datetime) -> ScoreboardResponse:
+    """Standings as of a point in time: nearest snapshot plus the events after it"""
+    if at.tzinfo is None:
+        at = at.replace(tzinfo=timezone.utc)
+    state = await _latest_snapshot(conn, competition_id, at)
+    events = await _events_between(conn, competition_id, _parse_ts(state["as_of"]), at)
+    apply_events(state, events)
+    return state_to_scoreboard(competition_id, state, at)
+
+async def invalidate_snapshots(conn, competition_id: int, since: Optional[datetime] = None):
+    """Drop periodic snapshots that include history which has since been rewritten"""
+    await conn.execute(
+        """
+        DELETE FROM booking_competition_results
+        WHERE competition_id = $1 AND snapshot_type = $2
+          AND ($3::timestamptz IS NULL OR created_at >= $3)
+        """,
+        competition_id, SnapshotType.PERIODIC.value, since,
+    )
+
+
+class SnapshotScheduler:
+    """Background loop writing event-triggered snapshots
+
+    Periodic snapshots are run by the app scheduler (see app.libs.scheduled_jobs)
+    so only one worker writes them.
+    """
+
+    def __init__(self):
+        # Competition id -> times (epoch seconds) requested snapshots are due
+        self.pending: Dict[int, List[float]] = {}
+        self.last_snapshot_at: Dict[int, float] = {}
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def request_snapshot(self, competition_id: int):
+        """Ask for a snapshot after a notable event (rate limited per competition).
+
+        Snapshots only cover events older than the watermark lag, so the
+        snapshot is due once the triggering event has fallen below it.
+        """
+        self.pending.setdefault(competition_id, []).append(time.time() + SNAPSHOT_WATERMARK_LAG_SECONDS)
+        self._wake.set()
+
+    async def run_periodic(self, conn):
+        """Snapshot every active Competitions 2.0 competition"""
+        rows = await conn.fetch(
+            "SELECT id FROM booking_competitions WHERE rules IS NOT NULL AND state = 'active'"
+        )
+        for r in rows:
+            await take_snapshot(conn, r["id"])
+            self.last_snapshot_at[r["id"]] = time.time()
+
+    def _next_due(self) -> Optional[float]:
+        return min((min(times) for times in self.pending.values()), default=None)
+
+    async def run_pending(self):
+        now = time.time()
+        due = [
+            c for c, times in self.pending.items()
+            if min(times) <= now and now - self.last_snapshot_at.get(c, 0) >= SNAPSHOT_MIN_GAP_SECONDS
+        ]
+        if not due:
+            return
+        conn = await asyncpg.connect(db.secrets.get("DATABASE_URL_DEV"))
+        try:
+            for competition_id in due:
+                started = time.time()
+                await take_snapshot(conn, competition_id)
+                self.last_snapshot_at[competition_id] = time.time()
+                # Requests due by now are covered; later ones wait for their turn
+                later = [t for t in self.pending.get(competition_id, []) if t > started]
+                if later:
+                    self.pending[competition_id] = later
+                else:
+                    self.pending.pop(competition_id, None)
+        finally:
+            await conn.close()
+
+    async def _run(self):
+        while True:
+            next_due = self._next_due()
+            timeout = SNAPSHOT_MIN_GAP_SECONDS if next_due is None else max(1.0, next_due - time.time())
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=min(timeout, SNAPSHOT_MIN_GAP_SECONDS))
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                if self.pending:
+                    await self.run_pending()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("scoreboard snapshot run failed")
+
+
+# Global snapshot scheduler instance
+snapshot_scheduler = SnapshotScheduler()
+
+def request_scoreboard_snapshot(competition_id: int):
+    """Helper to request a snapshot after a notable event"""
+    snapshot_scheduler.request_snapshot(competition_id)
@@ -1,7 +1,8 @@
 
 from typing import List, Dict, Any, Optional, Tuple
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, time
 from collections import defaultdict
+from functools import lru_cache
 import asyncio
 import asyncpg
 from uuid import UUID, uuid4
@@ -13,8 +14,19 @@ from app.libs.models_competition_v2 import (
     PlayerScore, ScoreboardResponse, BookingActivityType, Multiplier,
     Combo, TimeWindow, PointsConfig
 )
+from app.libs.leaderboard_service import note_competition_write, STORAGE_V2
+from app.libs.scoreboard_snapshots import request_scoreboard_snapshot
+from app.libs.streaks import player_streaks, live_streak
+from app.libs.local_time import local_today, sql_local_date
 import databutton as db
 
+
+@lru_cache(maxsize=256)
+def _clock_time(value: str) -> time:
+    """HH:MM of a time window bound (parsed once per distinct value)"""
+    return datetime.strptime(value, "%H:%M").time()
+
+
 class ScoringEngine:
     """Advanced scoring engine for Competitions 2.0"""
     
@@ -32,8 +44,9 @@ class ScoringEngine:
         key_string = f"{player_name}:{activity_type}:{rounded_ts}"
         return hashlib.sha1(key_string.encode()).hexdigest()
     
-    async def calculate_base_points(self, activity_type: BookingActivityType, rules: CompetitionRules) -> int:
-        """Calculate base points for activity type based on rules"""
+    @staticmethod
+    def base_points(activity_type: BookingActivityType, rules: CompetitionRules) -> int:
+        """Base points for an activity type under rules"""
         points_config = rules.points
         
         if activity_type == BookingActivityType.LIFT:
@@ -45,12 +58,17 @@ class ScoringEngine:
         
         return 0
     
-    def is_within_time_window(self, timestamp: datetime, window: TimeWindow) -> bool:
+    async def calculate_base_points(self, activity_type: BookingActivityType, rules: CompetitionRules) -> int:
+        """Calculate base points for activity type based on rules"""
+        return self.base_points(activity_type, rules)
+    
+    @staticmethod
+    def is_within_time_window(timestamp: datetime, window: TimeWindow) -> bool:
         """Check if timestamp is within time window"""
         try:
             time_part = timestamp.time()
-            start_time = datetime.strptime(window.start, "%H:%M").time()
-            end_time = datetime.strptime(window.end, "%H:%M").time()
+            start_time = _clock_time(window.start)
+            end_time = _clock_time(window.end)
             
             if start_time <= end_time:
                 return start_time <= time_part <= end_time
@@ -59,6 +77,63 @@ class ScoringEngine:
         except Exception:
             return False
     
+    # Rule evaluation given the counts read from the event history. The engine
+    # reads them from booking_competition_events and ScoringSimulator from its
+    # in-memory history, so both score with the same rules.
+    
+    @staticmethod
+    def within_caps(rules: CompetitionRules, daily_count: int, player_total: int, global_count: int) -> bool:
+        """Whether one more event fits the caps, given the events stored so far"""
+        caps = rules.caps
+        if not caps:
+            return True
+        if caps.per_player_per_day and daily_count >= caps.per_player_per_day:
+            return False
+        if caps.per_player_total and player_total >= caps.per_player_total:
+            return False
+        if caps.global_total and global_count >= caps.global_total:
+            return False
+        return True
+    
+    @staticmethod
+    def apply_multipliers(rules: CompetitionRules, timestamp: datetime,
+                          streak: int, daily_count: int) -> Tuple[float, List[str]]:
+        """(total multiplier, applied names) given the player's streak and the day's events before this one"""
+        total_multiplier = 1.0
+        applied_multipliers = []
+        for multiplier in rules.multipliers:
+            if multiplier.type == "time_window" and multiplier.window:
+                if ScoringEngine.is_within_time_window(timestamp, multiplier.window):
+                    total_multiplier *= multiplier.mult
+                    applied_multipliers.append(f"time_window_{multiplier.mult}x")
+            
+            elif multiplier.type == "streak" and multiplier.min:
+                if streak >= multiplier.min:
+                    total_multiplier *= multiplier.mult
+                    applied_multipliers.append(f"streak_{streak}_{multiplier.mult}x")
+            
+            elif multiplier.type == "early_bird":
+                if daily_count < (multiplier.min or 10):  # first 10 activities of the day
+                    total_multiplier *= multiplier.mult
+                    applied_multipliers.append(f"early_bird_{multiplier.mult}x")
+        return total_multiplier, applied_multipliers
+    
+    @staticmethod
+    def apply_combos(rules: CompetitionRules, windows: List[Tuple[set, int]]) -> Tuple[int, List[str]]:
+        """(bonus, achieved names) given, per combo, the types found and event count in its window"""
+        total_bonus = 0
+        achieved_combos = []
+        for combo, (found_types, count) in zip(rules.combos, windows):
+            if combo.required_types:
+                # All required types present in the time window
+                if {t.value for t in combo.required_types}.issubset(found_types):
+                    total_bonus += combo.bonus
+                    achieved_combos.append(combo.name)
+            elif count >= 3:  # rapid succession, including current event
+                total_bonus += combo.bonus
+                achieved_combos.append(combo.name)
+        return total_bonus, achieved_combos
+    
     async def calculate_multipliers(self, 
                                    player_name: str, 
                                    activity_type: BookingActivityType, 
@@ -66,70 +141,57 @@ class ScoringEngine:
                                    competition_id: int,
                                    rules: CompetitionRules) -> Tuple[float, List[str]]:
         """Calculate applicable multipliers and return (total_multiplier, applied_names)"""
-        total_multiplier = 1.0
-        applied_multipliers = []
+        current_streak = 0
+        daily_count = 0
         
         conn = await self.get_connection()
         try:
-            for multiplier in rules.multipliers:
-                if multiplier.type == "time_window" and multiplier.window:
-                    if self.is_within_time_window(timestamp, multiplier.window):
-                        total_multiplier *= multiplier.mult
-                        applied_multipliers.append(f"time_window_{multiplier.mult}x")
+            if any(m.type == "streak" and m.min for m in rules.multipliers):
+                # Check current streak for player
+                streak_query = """
+                    WITH recent_events AS (
+                        SELECT player_name, type, ts,
+                               LAG(ts) OVER (PARTITION BY player_name ORDER BY ts) as prev_ts
+                        FROM booking_competition_events 
+                        WHERE competition_id = $1 AND player_name = $2
+                        AND ts >= $3 - INTERVAL '24 hours'
+                        ORDER BY ts DESC
+                    ),
+                    streak_breaks AS (
+                        SELECT player_name, type, ts,
+                               CASE WHEN prev_ts IS NULL OR (ts - prev_ts) > INTERVAL '2 hours' 
+                                    THEN 1 ELSE 0 END as is_break
+                        FROM recent_events
+                    ),
+                    streak_groups AS (
+                        SELECT player_name, type, ts,
+                               SUM(is_break) OVER (PARTITION BY player_name ORDER BY ts DESC) as group_id
+                        FROM streak_breaks
+                    )
+                    SELECT COUNT(*) as streak_length
+                    FROM streak_groups 
+                    WHERE player_name = $2 AND group_id = 0
+                """
                 
-                elif multiplier.type == "streak" and multiplier.min:
-                    # Check current streak for player
-                    streak_query = """
-                        WITH recent_events AS (
-                            SELECT player_name, type, ts,
-                                   LAG(ts) OVER (PARTITION BY player_name ORDER BY ts) as prev_ts
-                            FROM booking_competition_events 
-                            WHERE competition_id = $1 AND player_name = $2
-                            AND ts >= $3 - INTERVAL '24 hours'
-                            ORDER BY ts DESC
-                        ),
-                        streak_breaks AS (
-                            SELECT player_name, type, ts,
-                                   CASE WHEN prev_ts IS NULL OR (ts - prev_ts) > INTERVAL '2 hours' 
-                                        THEN 1 ELSE 0 END as is_break
-                            FROM recent_events
-                        ),
-                        streak_groups AS (
-                            SELECT player_name, type, ts,
-                                   SUM(is_break) OVER (PARTITION BY player_name ORDER BY ts DESC) as group_id
-                            FROM streak_breaks
-                        )
-                        SELECT COUNT(*) as streak_length
-                        FROM streak_groups 
-                        WHERE player_name = $2 AND group_id = 0
-                    """
-                    
-                    result = await conn.fetchval(streak_query, competition_id, player_name, timestamp)
-                    current_streak = result or 0
-                    
-                    if current_streak >= multiplier.min:
-                        total_multiplier *= multiplier.mult
-                        applied_multipliers.append(f"streak_{current_streak}_{multiplier.mult}x")
+                result = await conn.fetchval(streak_query, competition_id, player_name, timestamp)
+                current_streak = result or 0
+            
+            if any(m.type == "early_bird" for m in rules.multipliers):
+                # Activities earlier today
+                early_query = f"""
+                    SELECT COUNT(*) 
+                    FROM booking_competition_events 
+                    WHERE competition_id = $1 
+                    AND local_date = {sql_local_date("$2::timestamptz")}
+                    AND ts < $2
+                """
                 
-                elif multiplier.type == "early_bird":
-                    # Check if this is among first N activities today
-                    early_query = """
-                        SELECT COUNT(*) 
-                        FROM booking_competition_events 
-                        WHERE competition_id = $1 
-                        AND DATE(ts AT TIME ZONE 'Europe/Oslo') = DATE($2 AT TIME ZONE 'Europe/Oslo')
-                        AND ts < $2
-                    """
-                    
-                    daily_count = await conn.fetchval(early_query, competition_id, timestamp)
-                    if daily_count < (multiplier.min or 10):  # first 10 activities of the day
-                        total_multiplier *= multiplier.mult
-                        applied_multipliers.append(f"early_bird_{multiplier.mult}x")
+                daily_count = await conn.fetchval(early_query, competition_id, timestamp)
         
         finally:
             await conn.close()
         
-        return total_multiplier, applied_multipliers
+        return self.apply_multipliers(rules, timestamp, current_streak, daily_count)
     
     async def check_combos(self, 
                           player_name: str, 
@@ -138,8 +200,7 @@ class ScoringEngine:
                           competition_id: int,
                           rules: CompetitionRules) -> Tuple[int, List[str]]:
         """Check for combo bonuses and return (bonus_points, achieved_combos)"""
-        total_bonus = 0
-        achieved_combos = []
+        windows = []
         
         conn = await self.get_connection()
         try:
@@ -147,7 +208,7 @@ class ScoringEngine:
                 window_start = timestamp - timedelta(minutes=combo.within_minutes)
                 
                 if combo.required_types:
-                    # Check if all required types are present in time window
+                    # Required types present in time window
                     combo_query = """
                         SELECT type, COUNT(*) as count
                         FROM booking_competition_events 
@@ -166,15 +227,10 @@ class ScoringEngine:
                         [t.value for t in combo.required_types]
                     )
                     
-                    found_types = {row['type'] for row in results}
-                    required_types = {t.value for t in combo.required_types}
-                    
-                    if required_types.issubset(found_types):
-                        total_bonus += combo.bonus
-                        achieved_combos.append(combo.name)
+                    windows.append(({row['type'] for row in results}, sum(row['count'] for row in results)))
                 
                 else:
-                    # Check for rapid succession (any 3+ activities in time window)
+                    # Activities in time window, for rapid succession
                     rapid_query = """
                         SELECT COUNT(*) as count
                         FROM booking_competition_events 
@@ -183,15 +239,12 @@ class ScoringEngine:
                     """
                     
                     count = await conn.fetchval(rapid_query, competition_id, player_name, window_start, timestamp)
-                    
-                    if count >= 3:  # including current event
-                        total_bonus += combo.bonus
-                        achieved_combos.append(combo.name)
+                    windows.append((set(), count))
         
         finally:
             await conn.close()
         
-        return total_bonus, achieved_combos
+        return self.apply_combos(rules, windows)
     
     async def check_caps(self, 
                         player_name: str, 
@@ -201,23 +254,22 @@ class ScoringEngine:
         """Check if adding this event would exceed any caps"""
         if not rules.caps:
             return True
+        daily_count = total_count = global_count = 0
         
         conn = await self.get_connection()
         try:
-            # Check daily cap
+            # Daily cap
             if rules.caps.per_player_per_day:
-                daily_query = """
+                daily_query = f"""
                     SELECT COUNT(*) 
                     FROM booking_competition_events 
                     WHERE competition_id = $1 AND player_name = $2
-                    AND DATE(ts AT TIME ZONE 'Europe/Oslo') = DATE($3 AT TIME ZONE 'Europe/Oslo')
+                    AND local_date = {sql_local_date("$3::timestamptz")}
                 """
                 
                 daily_count = await conn.fetchval(daily_query, competition_id, player_name, timestamp)
-                if daily_count >= rules.caps.per_player_per_day:
-                    return False
             
-            # Check total player cap
+            # Total player cap
             if rules.caps.per_player_total:
                 total_query = """
                     SELECT COUNT(*) 
@@ -226,10 +278,8 @@ class ScoringEngine:
                 """
                 
                 total_count = await conn.fetchval(total_query, competition_id, player_name)
-                if total_count >= rules.caps.per_player_total:
-                    return False
             
-            # Check global cap
+            # Global cap
             if rules.caps.global_total:
                 global_query = """
                     SELECT COUNT(*) 
@@ -238,13 +288,11 @@ class ScoringEngine:
                 """
                 
                 global_count = await conn.fetchval(global_query, competition_id)
-                if global_count >= rules.caps.global_total:
-                    return False
         
         finally:
             await conn.close()
         
-        return True
+        return self.within_caps(rules, daily_count, total_count, global_count)
     
     async def score_event(self, 
                          event: CompetitionEventCreate, 
@@ -298,6 +346,9 @@ class ScoringEngine:
             "final_points": final_points,
             "within_caps": within_caps
         }
+        if event.custom_points:
+            # Kept so retroactive rescoring can honour the override
+            rule_triggered["custom_points"] = event.custom_points
         
         return final_points, rule_triggered
     
@@ -335,6 +386,12 @@ class ScoringEngine:
                 final_points,
                 json.dumps(rule_triggered)
             )
+            if result is not None:
+                rank_change = note_competition_write(event.competition_id, STORAGE_V2, event.player_name, final_points)
+                # Combos, multipliers and lead changes are worth a scoreboard snapshot
+                took_lead = bool(rank_change) and rank_change[1] == 1 and rank_change[0] != 1
+                if rule_triggered.get("achieved_combos") or rule_triggered.get("multiplier", 1.0) > 1.0 or took_lead:
+                    request_scoreboard_snapshot(event.competition_id)
             
             if result is None:
                 # Event was duplicate, fetch existing
@@ -417,6 +474,14 @@ class ScoringEngine:
                     if 'achieved_combos' in rule_info:
                         score_data['combos_achieved'].update(rule_info['achieved_combos'])
             
+            # Daily activity streaks (workday-aware) from the streaks table
+            stored_streaks = await player_streaks(conn, list(player_scores))
+            today = local_today()
+            for player_name, row in stored_streaks.items():
+                player_scores[player_name]['current_streak'] = live_streak(
+                    row['current_streak'], row['last_local_date'], today
+                )
+            
             # Convert to PlayerScore objects
             leaderboard = []
             for player_name, data in player_scores.items():
@@ -0,0 +1,158 @@
+# In-memory Scoring Simulator for Competitions 2.0
+# Scores events like ScoringEngine.score_event, but reads the counts the rules
+# need (caps, streak, early bird, combo windows) from an in-memory event
+# history, so candidate rules can be replayed over thousands of events without
+# touching booking_competition_events (used by rule preview and retroactive
+# rescoring). The rules themselves are ScoringEngine's static helpers.
+
+from typing import Dict, List, Any, Optional, Tuple
+from datetime import datetime, timedelta, timezone
+from collections import defaultdict, deque
+from zoneinfo import ZoneInfo
+
+from app.libs.models_competition_v2 import CompetitionRules, BookingActivityType
+from app.libs.scoring_engine import ScoringEngine
+
+OSLO_TZ = ZoneInfo("Europe/Oslo")
+# Longest look-back any rule needs (streak multipliers look at the last 24 hours)
+HISTORY_WINDOW = timedelta(hours=24)
+# Largest gap between events that keeps a streak going
+STREAK_GAP = timedelta(hours=2)
+
+
+def oslo_date(ts: datetime):
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return ts.astimezone(OSLO_TZ).date()
+
+
+class ScoringSimulator:
+    """Scores a chronological event stream with the same rules as ScoringEngine"""
+
+    def __init__(self, rules: CompetitionRules):
+        self.rules = rules
+        self.player_history: Dict[str, deque] = defaultdict(deque)  # (ts, type) within HISTORY_WINDOW
+        self.player_day_counts: Dict[Tuple[str, Any], int] = defaultdict(int)
+        self.player_totals: Dict[str, int] = defaultdict(int)
+        self.day_counts: Dict[Any, int] = defaultdict(int)
+        self.global_count = 0
+        self.trigger_counts: Dict[str, int] = defaultdict(int)
+
+    def base_points(self, activity_type: BookingActivityType) -> int:
+        return ScoringEngine.base_points(activity_type, self.rules)
+
+    def _current_streak(self, history: deque) -> int:
+        # Same as the engine's SQL: count the newest run of events whose gap to
+        # the previous event (inside the 24h window) is at most two hours
+        streak = 0
+        newer = None
+        for event_ts, _ in reversed(history):
+            if newer is not None:
+                if newer - event_ts > STREAK_GAP:
+                    break
+                streak += 1
+            newer = event_ts
+        return streak
+
+    def _combo_windows(self, history: deque, ts: datetime) -> List[Tuple[set, int]]:
+        # Per combo, the types and count of the player's events in its window
+        # (the engine filters required-type combos to the required types)
+        windows = []
+        for combo in self.rules.combos:
+            window_start = ts - timedelta(minutes=combo.within_minutes)
+            # History is in ts order, so walk back from the newest event
+            recent = []
+            for event_ts, t in reversed(history):
+                if event_ts < window_start:
+                    break
+                if event_ts <= ts:
+                    recent.append(t)
+            if combo.required_types:
+                required = {t.value for t in combo.required_types}
+                recent = [t for t in recent if t in required]
+            windows.append((set(recent), len(recent)))
+        return windows
+
+    def score(self, player_name: str, activity_type: BookingActivityType, ts: datetime,
+              custom_points: Optional[int] = None) -> Tuple[int, Dict[str, Any]]:
+        """Score one event and add it to the history; events must arrive in ts order"""
+        if ts.tzinfo is None:
+            ts = ts.replace(tzinfo=timezone.utc)
+        day = oslo_date(ts)
+        history = self.player_history[player_name]
+        while history and ts - history[0][0] > HISTORY_WINDOW:
+            history.popleft()
+
+        within_caps = ScoringEngine.within_caps(
+            self.rules, self.player_day_counts[(player_name, day)], self.player_totals[player_name], self.global_count
+        )
+        if not within_caps:
+            points, rule_triggered = 0, {"capped": True, "reason": "Daily/total/global cap exceeded"}
+            self.trigger_counts["capped"] += 1
+        else:
+            base = custom_points or self.base_points(activity_type)
+            needs_streak = any(m.type == "streak" and m.min for m in self.rules.multipliers)
+            multiplier, applied = ScoringEngine.apply_multipliers(
+                self.rules, ts, self._current_streak(history) if needs_streak else 0, self.day_counts[day]
+            )
+            combo_bonus, achieved = ScoringEngine.apply_combos(self.rules, self._combo_windows(history, ts))
+            points = int((base * multiplier) + combo_bonus)
+            rule_triggered = {
+                "base_points": base,
+                "multiplier": multiplier,
+                "applied_multipliers": applied,
+                "combo_bonus": combo_bonus,
+                "achieved_combos": achieved,
+                "final_points": points,
+                "within_caps": True,
+            }
+            if custom_points:
+                rule_triggered["custom_points"] = custom_points
+            for name in applied:
+                # Streak names carry the streak length; count them per multiplier
+                if name.startswith("streak_"):
+                    name = "streak_" + name.rsplit("_", 1)[1]
+                self.trigger_counts[name] += 1
+            for name in achieved:
+                self.trigger_counts[f"combo:{name}"] += 1
+
+        # Capped events are still stored by the engine, so they count towards later rules
+        history.append((ts, activity_type.value))
+        self.player_day_counts[(player_name, day)] += 1
+        self.player_totals[player_name] += 1
+        self.day_counts[day] += 1
+        self.global_count += 1
+        return points, rule_triggered
+
+
+def simulate(rules: CompetitionRules, events: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Replay events (player_name, type, ts, optional points/custom_points) and summarise per player"""
+    simulator = ScoringSimulator(rules)
+    players: Dict[str, Dict[str, Any]] = {}
+    ordered = sorted(events, key=lambda e: e["ts"] if e["ts"].tzinfo else e["ts"].replace(tzinfo=timezone.utc))
+    for e in ordered:
+        activity_type = BookingActivityType(e["type"])
+        points, rule_triggered = simulator.score(e["player_name"], activity_type, e["ts"], e.get("custom_points"))
+        p = players.setdefault(e["player_name"], {
+            "player_name": e["player_name"],
+            "total_points": 0,
+            "current_points": 0,
+            "event_count": 0,
+            "breakdown": defaultdict(int),
+            "multipliers_applied": set(),
+            "combos_achieved": set(),
+            "last_activity": None,
+        })
+        p["total_points"] += points
+        p["current_points"] += int(e.get("points") or 0)
+        p["event_count"] += 1
+        p["breakdown"][activity_type] += 1
+        p["multipliers_applied"].update(rule_triggered.get("applied_multipliers", []))
+        p["combos_achieved"].update(rule_triggered.get("achieved_combos", []))
+        p["last_activity"] = e["ts"]
+
+    return {
+        "players": sorted(players.values(), key=lambda p: -p["total_points"]),
+        "trigger_counts": dict(simulator.trigger_counts),
+        "events_simulated": len(ordered),
+    }
@@ -0,0 +1,253 @@
+# Activity Streaks
+# streaks holds, per profile (scope 'profile', one player in one quarter) and
+# per team (scope 'team', scope_id = quarter id), the current and longest run
+# of active days and the last active Oslo day. A trigger on activities advances
+# the row in O(1) inside the logging transaction.
+#
+# Gap rule (workday-aware): a streak continues when the next active day is no
+# later than the next workday after the last one, so weekends never break a
+# streak, while activity on a weekend still counts as a day. The stored
+# current_streak is as of last_local_date; readers use live_streak to drop it
+# once the next workday has passed without activity.
+#
+# Backdated inserts and deletes are not replayed by the trigger; the nightly
+# rebuild recomputes every row from activities and corrects those that differ.
+
+from typing import Dict, List, Optional
+from datetime import date, timedelta
+
+import asyncpg
+
+from app.libs.local_time import ensure_local_time_columns
+
+# Serialises first-time creation across workers
+STREAKS_LOCK_KEY = 0x0A120
+
+STREAKS_DDL = """
+    CREATE TABLE IF NOT EXISTS streaks (
+        scope TEXT NOT NULL,
+        scope_id INTEGER NOT NULL,
+        current_streak INTEGER NOT NULL DEFAULT 0,
+        longest_streak INTEGER NOT NULL DEFAULT 0,
+        last_local_date DATE,
+        PRIMARY KEY (scope, scope_id)
+    );
+
+    -- Friday and Saturday roll over to Monday
+    CREATE OR REPLACE FUNCTION streak_next_workday(d DATE) RETURNS DATE AS $$
+        SELECT d + CASE EXTRACT(ISODOW FROM d)::int WHEN 5 THEN 3 WHEN 6 THEN 2 ELSE 1 END
+    $$ LANGUAGE sql IMMUTABLE;
+
+    CREATE OR REPLACE FUNCTION streaks_apply() RETURNS trigger AS $$
+    BEGIN
+        IF NEW.type::text NOT IN ('book', 'opp', 'deal') THEN
+            RETURN NULL;
+        END IF;
+        INSERT INTO streaks AS s (scope, scope_id, current_streak, longest_streak, last_local_date)
+        VALUES ('profile', NEW.profile_id, 1, 1, NEW.local_date),
+               ('team', NEW.quarter_id, 1, 1, NEW.local_date)
+        ON CONFLICT (scope, scope_id) DO UPDATE
+           SET current_streak = CASE
+                   WHEN EXCLUDED.last_local_date <= s.last_local_date THEN s.current_streak
+                   WHEN EXCLUDED.last_local_date <= streak_next_workday(s.last_local_date) THEN s.current_streak + 1
+                   ELSE 1
+               END,
+               longest_streak = GREATEST(s.longest_streak, CASE
+                   WHEN EXCLUDED.last_local_date <= s.last_local_date THEN s.current_streak
+                   WHEN EXCLUDED.last_local_date <= streak_next_workday(s.last_local_date) THEN s.current_streak + 1
+                   ELSE 1
+               END),
+               last_local_date = GREATEST(s.last_local_date, EXCLUDED.last_local_date);
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql;
+
+    DO $$
+    BEGIN
+        IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'activities_streaks') THEN
+            CREATE TRIGGER activities_streaks
+            AFTER INSERT ON activities
+            FOR EACH ROW EXECUTE FUNCTION streaks_apply();
+        END IF;
+    END
+    $$;
+"""
+
+# Streaks as they should be, from the distinct active days (gaps and islands)
+ACTUAL_STREAKS_SQL = """
+    WITH days AS (
+        SELECT 'profile' AS scope, profile_id AS scope_id, local_date AS d
+        FROM activities WHERE type::text IN ('book', 'opp', 'deal')
+        GROUP BY profile_id, local_date
+        UNION ALL
+        SELECT 'team', quarter_id, local_date
+        FROM activities WHERE type::text IN ('book', 'opp', 'deal')
+        GROUP BY quarter_id, local_date
+    ), marked AS (
+        SELECT scope, scope_id, d,
+               CASE WHEN d <= streak_next_workday(LAG(d) OVER w) THEN 0 ELSE 1 END AS starts
+        FROM days
+        WINDOW w AS (PARTITION BY scope, scope_id ORDER BY d)
+    ), islands AS (
+        SELECT scope, scope_id, d,
+               SUM(starts) OVER (PARTITION BY scope, scope_id ORDER BY d) AS island
+        FROM marked
+    ), runs AS (
+        SELECT scope, scope_id, island, COUNT(*)::int AS len, MAX(d) AS last_d
+        FROM islands
+        GROUP BY scope, scope_id, island
+    )
+    SELECT scope, scope_id,
+           (ARRAY_AGG(len ORDER BY island DESC))[1] AS current_streak,
+           MAX(len) AS longest_streak,
+           MAX(last_d) AS last_local_date
+    FROM runs
+    GROUP BY scope, scope_id
+"""
+
+# Write the recomputed row wherever it differs from the stored one. Streaks are
+# not additive, so a row is only overwritten if it still holds what the
+# snapshot saw; rows the trigger advanced meanwhile wait for the next run.
+# Runs without locking activities; returns the number of rows changed.
+REPAIR_STREAKS_SQL = f"""
+    WITH actual AS ({ACTUAL_STREAKS_SQL}),
+    drift AS (
+        SELECT scope, scope_id,
+               a.current_streak, a.longest_streak, a.last_local_date,
+               s.current_streak AS seen_current, s.longest_streak AS seen_longest,
+               s.last_local_date AS seen_last,
+               a.scope_id IS NOT NULL AS active,
+               s.scope_id IS NOT NULL AS stored
+        FROM actual a
+        FULL JOIN streaks s USING (scope, scope_id)
+        WHERE (a.current_streak, a.longest_streak, a.last_local_date)
+              IS DISTINCT FROM (s.current_streak, s.longest_streak, s.last_local_date)
+    ), updated AS (
+        UPDATE streaks s
+           SET current_streak = d.current_streak,
+               longest_streak = d.longest_streak,
+               last_local_date = d.last_local_date
+          FROM drift d
+         WHERE s.scope = d.scope AND s.scope_id = d.scope_id AND d.active AND d.stored
+           AND (s.current_streak, s.longest_streak, s.last_local_date)
+               IS NOT DISTINCT FROM (d.seen_current, d.seen_longest, d.seen_last)
+        RETURNING 1
+    ), inserted AS (
+        INSERT INTO streaks (scope, scope_id, current_streak, longest_streak, last_local_date)
+        SELECT scope, scope_id, current_streak, longest_streak, last_local_date
+        FROM drift
+        WHERE NOT stored
+        ON CONFLICT (scope, scope_id) DO NOTHING
+        RETURNING 1
+    ), removed AS (
+        DELETE FROM streaks s
+         USING drift d
+         WHERE s.scope = d.scope AND s.scope_id = d.scope_id AND NOT d.active
+           AND (s.current_streak, s.longest_streak, s.last_local_date)
+               IS NOT DISTINCT FROM (d.seen_current, d.seen_longest, d.seen_last)
+        RETURNING 1
+    )
+    SELECT (SELECT COUNT(*) FROM updated) + (SELECT COUNT(*) FROM inserted) + (SELECT COUNT(*) FROM removed)
+"""
+
+_schema_ready = False
+
+
+def next_workday(d: date) -> date:
+    """The day a streak must continue by (Friday and Saturday roll over to Monday)"""
+    return d + timedelta(days={4: 3, 5: 2}.get(d.weekday(), 1))
+
+
+def live_streak(current_streak: int, last_local_date: Optional[date], today: date) -> int:
+    """Stored streak as seen today: still alive until the next workday has passed"""
+    if not last_local_date or today > next_workday(last_local_date):
+        return 0
+    return current_streak
+
+
+def advance_streak(current_streak: int, last_local_date: Optional[date], day: date) -> int:
+    """Streak after activity on day (the trigger's rule, for callers holding the old row)"""
+    if last_local_date is None or day > next_workday(last_local_date):
+        return 1
+    if day <= last_local_date:
+        return current_streak
+    return current_streak + 1
+
+
+async def ensure_streaks(conn: asyncpg.Connection):
+    """Create the streaks table and trigger once per process, backfilling on first creation"""
+    global _schema_ready
+    if _schema_ready:
+        return
+    await ensure_local_time_columns(conn)
+    async with conn.transaction():
+        await conn.execute("SELECT pg_advisory_xact_lock($1)", STREAKS_LOCK_KEY)
+        created = await conn.fetchval("SELECT to_regclass('streaks') IS NULL")
+        await conn.execute(STREAKS_DDL)
+        if created:
+            await _rebuild(conn)
+    _schema_ready = True
+
+
+async def _rebuild(conn: asyncpg.Connection) -> int:
+    # First creation only: the caller's transaction just created the trigger,
+    # and SHARE mode keeps writers out until the backfill commits
+    await conn.execute("LOCK TABLE activities IN SHARE MODE")
+    await conn.execute("DELETE FROM streaks")
+    result = await conn.execute(
+        f"""
+        INSERT INTO streaks (scope, scope_id, current_streak, longest_streak, last_local_date)
+        {ACTUAL_STREAKS_SQL}
+        """
+    )
+    return int(result.split()[-1])
+
+
+async def rebuild_streaks(conn: asyncpg.Connection) -> int:
+    """Recompute every streak from activity history; returns the number of rows corrected"""
+    await ensure_streaks(conn)
+    return await conn.fetchval(REPAIR_STREAKS_SQL)
+
+
+async def profile_streaks(conn: asyncpg.Connection, profile_ids: List[int]) -> Dict[int, asyncpg.Record]:
+    """Stored streak rows keyed by profile id (profiles without activity are absent)"""
+    await ensure_streaks(conn)
+    rows = await conn.fetch(
+        """
+        SELECT scope_id, current_streak, longest_streak, last_local_date
+        FROM streaks
+        WHERE scope = 'profile' AND scope_id = ANY($1::int[])
+        """,
+        profile_ids,
+    )
+    return {r["scope_id"]: r for r in rows}
+
+
+async def team_streak(conn: asyncpg.Connection, quarter_id: int) -> Optional[asyncpg.Record]:
+    """Stored streak row for a quarter's team (days on which anyone logged activity)"""
+    await ensure_streaks(conn)
+    return await conn.fetchrow(
+        """
+        SELECT current_streak, longest_streak, last_local_date
+        FROM streaks
+        WHERE scope = 'team' AND scope_id = $1
+        """,
+        quarter_id,
+    )
+
+
+async def player_streaks(conn: asyncpg.Connection, player_names: List[str]) -> Dict[str, asyncpg.Record]:
+    """Stored streak rows of each player's latest profile, keyed by player name"""
+    await ensure_streaks(conn)
+    rows = await conn.fetch(
+        """
+        SELECT DISTINCT ON (p.name) p.name, s.current_streak, s.longest_streak, s.last_local_date
+        FROM profiles p
+        JOIN quarters q ON q.id = p.quarter_id
+        JOIN streaks s ON s.scope = 'profile' AND s.scope_id = p.id
+        WHERE p.name = ANY($1::text[])
+        ORDER BY p.name, q.created_at DESC
+        """,
+        player_names,
+    )
+    return {r["name"]: r for r in rows}
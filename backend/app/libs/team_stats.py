@@ -0,0 +1,121 @@
+# Team Stats Snapshots
+# The race dashboard polls /team-stats from every open browser. Team totals,
+# goals and pacing only change when activities or goals are written, so one
+# snapshot per quarter is kept in memory and served as is. Writes call
+# note_team_stats_write, which schedules a rebuild debounced to at most one
+# per MIN_REFRESH_SECONDS; MAX_AGE_SECONDS is the safety net for writes made
+# by other workers and for the day-based benchmark moving on.
+#
+# The snapshot itself is computed by the builder registered with
+# @team_stats_builder (activities owns the team-stats calculation).
+
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from datetime import datetime
+import asyncio
+import time
+
+import asyncpg
+import databutton as db
+
+MIN_REFRESH_SECONDS = 10
+MAX_AGE_SECONDS = 120
+# Writers may note a write before their transaction commits (outbox handlers do)
+WRITE_SETTLE_SECONDS = 1
+
+# builder(conn) -> (quarter_id, payload) for the current quarter
+TeamStatsBuilder = Callable[[asyncpg.Connection], Awaitable[Tuple[int, Dict[str, Any]]]]
+
+
+class TeamStatsSnapshots:
+    """Current quarter team stats, rebuilt after writes and served from memory"""
+
+    def __init__(self, min_refresh_seconds: float = MIN_REFRESH_SECONDS,
+                 max_age_seconds: float = MAX_AGE_SECONDS):
+        self.min_refresh_seconds = min_refresh_seconds
+        self.max_age_seconds = max_age_seconds
+        self.builder: Optional[TeamStatsBuilder] = None
+        # quarter_id -> (built_at monotonic, payload with generated_at)
+        self.snapshots: Dict[int, Tuple[float, Dict[str, Any]]] = {}
+        self.current_quarter_id: Optional[int] = None
+        self.last_build = 0.0
+        self._lock = asyncio.Lock()
+        self._refresh_task: Optional[asyncio.Task] = None
+        # Set by writes the scheduled rebuild may not see (noted once it started)
+        self._dirty = False
+
+    async def get(self) -> Dict[str, Any]:
+        """The current quarter's snapshot, building it first if missing or too old"""
+        snapshot = self.snapshots.get(self.current_quarter_id)
+        if snapshot and time.monotonic() - snapshot[0] < self.max_age_seconds:
+            return snapshot[1]
+        return await self.refresh(max_age=self.max_age_seconds)
+
+    def note_write(self, quarter_id: Optional[int] = None):
+        """Schedule a debounced rebuild after a write to quarter_id (None = any quarter)"""
+        if quarter_id is not None and self.current_quarter_id not in (None, quarter_id):
+            # Past quarters are not on the dashboard; drop their snapshot
+            self.snapshots.pop(quarter_id, None)
+            return
+        if not self.snapshots:
+            # Nothing served yet; the first get builds it
+            return
+        if self._refresh_task and not self._refresh_task.done():
+            # A rebuild is coming or running; have it go again if it already read
+            self._dirty = True
+            return
+        delay = max(WRITE_SETTLE_SECONDS, self.last_build + self.min_refresh_seconds - time.monotonic())
+        try:
+            self._refresh_task = asyncio.get_running_loop().create_task(self._refresh_later(delay))
+        except RuntimeError:
+            # No event loop (scripts); the max-age check picks the write up
+            self.snapshots.clear()
+
+    async def _refresh_later(self, delay: float):
+        await asyncio.sleep(delay)
+        while True:
+            # Writes noted from here on may be missed by this build's reads
+            self._dirty = False
+            try:
+                await self.refresh()
+            except Exception as e:
+                # Keep serving the previous snapshot; the next write or max age retries
+                print(f"Error refreshing team stats snapshot: {str(e)}")
+                return
+            if not self._dirty:
+                return
+            await asyncio.sleep(max(WRITE_SETTLE_SECONDS, self.last_build + self.min_refresh_seconds - time.monotonic()))
+
+    async def refresh(self, max_age: Optional[float] = None) -> Dict[str, Any]:
+        """Rebuild the current quarter's snapshot (single flight)"""
+        async with self._lock:
+            # Another caller may have rebuilt it while we waited
+            snapshot = self.snapshots.get(self.current_quarter_id)
+            if max_age is not None and snapshot and time.monotonic() - snapshot[0] < max_age:
+                return snapshot[1]
+            if self.builder is None:
+                raise RuntimeError("No team stats builder registered")
+            conn = await asyncpg.connect(db.secrets.get("DATABASE_URL_DEV"))
+            try:
+                quarter_id, payload = await self.builder(conn)
+            finally:
+                await conn.close()
+            payload["generated_at"] = datetime.now()
+            self.last_build = time.monotonic()
+            self.snapshots[quarter_id] = (self.last_build, payload)
+            self.current_quarter_id = quarter_id
+            return payload
+
+
+# Global snapshot instance
+team_stats_snapshots = TeamStatsSnapshots()
+
+
+def team_stats_builder(func: TeamStatsBuilder) -> TeamStatsBuilder:
+    """Register the function that computes the team stats snapshot"""
+    team_stats_snapshots.builder = func
+    return func
+
+
+def note_team_stats_write(quarter_id: Optional[int] = None):
+    """Helper to refresh the team stats snapshot after activities or goals change"""
+    team_stats_snapshots.note_write(quarter_id)
@@ -0,0 +1,121 @@
+# Time Series Helpers for Insights
+# Insights endpoints read sparse per-day buckets (activity_daily_rollup) and
+# turn them into chart series. Everything here works on dense NumPy arrays
+# indexed by day offset from the range start, so filling, weekly bucketing,
+# cumulative sums, rolling and previous-period averages are single O(days)
+# passes, and long ranges are downsampled with LTTB before they are sent.
+
+from typing import Iterable, List, Optional, Tuple
+from datetime import date, timedelta
+
+import numpy as np
+
+# Daily series longer than this are downsampled for charts
+MAX_CHART_POINTS = 240
+
+
+def day_count(start: date, end: date) -> int:
+    """Number of days in the inclusive range (0 when end is before start)"""
+    return max(0, (end - start).days + 1)
+
+
+def dense_daily(rows: Iterable, start: date, end: date,
+                date_key: str = "d", value_key: str = "value") -> np.ndarray:
+    """Per-day values from sparse (date, value) rows; days without rows are 0"""
+    n = day_count(start, end)
+    values = np.zeros(n, dtype=np.int64)
+    if n == 0:
+        return values
+    pairs = [(r[date_key], r[value_key]) for r in rows]
+    if not pairs:
+        return values
+    dates, counts = zip(*pairs)
+    offsets = (np.array(dates, dtype="datetime64[D]") - np.datetime64(start, "D")).astype(np.int64)
+    counts = np.array(counts, dtype=np.int64)
+    inside = (offsets >= 0) & (offsets < n)
+    # Accumulate, so several rows per day (e.g. per profile) are summed
+    np.add.at(values, offsets[inside], counts[inside])
+    return values
+
+
+def day_labels(start: date, n: int, step: int = 1) -> List[date]:
+    """Dates for positions 0, step, 2*step, ... of a series starting at start"""
+    return [start + timedelta(days=int(i)) for i in range(0, n, step)]
+
+
+def weekly_buckets(values: np.ndarray, start: date) -> Tuple[List[date], np.ndarray]:
+    """Sum a daily series into Monday-based weeks (like DATE_TRUNC('week'))"""
+    if len(values) == 0:
+        return [], np.zeros(0, dtype=values.dtype)
+    lead = start.weekday()
+    week_index = (np.arange(len(values)) + lead) // 7
+    sums = np.bincount(week_index, weights=values).astype(values.dtype)
+    first_monday = start - timedelta(days=lead)
+    return day_labels(first_monday, len(sums) * 7, 7), sums
+
+
+def cumulative(values: np.ndarray) -> np.ndarray:
+    """Running total of a series"""
+    return np.cumsum(values)
+
+
+def rolling_mean(values: np.ndarray, window: int) -> np.ndarray:
+    """Trailing mean over window points; the first window-1 points average what exists"""
+    if len(values) == 0:
+        return np.zeros(0, dtype=np.float64)
+    sums = np.cumsum(values, dtype=np.float64)
+    sums[window:] = sums[window:] - sums[:-window]
+    counts = np.minimum(np.arange(1, len(values) + 1), window)
+    return sums / counts
+
+
+def trailing_average(values: np.ndarray, window: int) -> Optional[float]:
+    """Mean of the last window points, None when the series is shorter"""
+    if window <= 0 or len(values) < window:
+        return None
+    return float(values[-window:].mean())
+
+
+def period_average(values: np.ndarray) -> Optional[float]:
+    """Mean per point of a whole series, None when empty"""
+    if len(values) == 0:
+        return None
+    return float(values.mean())
+
+
+def lttb_indices(y: np.ndarray, threshold: int) -> np.ndarray:
+    """Indices to keep when downsampling an evenly spaced series to threshold points.
+
+    Largest-Triangle-Three-Buckets: always keeps the first and last point and,
+    per bucket, the point forming the largest triangle with the previous kept
+    point and the next bucket's mean, so peaks and dips survive.
+    """
+    n = len(y)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    y = y.astype(np.float64)
+    x = np.arange(n, dtype=np.float64)
+    # Bucket boundaries for the n-2 inner points
+    edges = np.floor(np.linspace(1, n - 1, threshold - 1)).astype(np.int64)
+    # Mean of every bucket at once (next-bucket averages); the last point closes the series
+    bucket_sums = np.add.reduceat(y[:-1], edges[:-1])
+    bucket_lens = np.diff(edges)
+    next_y = np.append(bucket_sums[1:] / bucket_lens[1:], y[-1])
+    next_x = np.append((edges[1:-1] + edges[2:] - 1) / 2.0, x[-1])
+
+    keep = np.empty(threshold, dtype=np.int64)
+    keep[0] = 0
+    prev = 0
+    for b in range(threshold - 2):
+        lo, hi = edges[b], edges[b + 1]
+        xs, ys = x[lo:hi], y[lo:hi]
+        area = np.abs((x[prev] - next_x[b]) * (ys - y[prev]) - (x[prev] - xs) * (next_y[b] - y[prev]))
+        prev = lo + int(area.argmax())
+        keep[b + 1] = prev
+    keep[-1] = n - 1
+    return keep
+
+
+def downsample(values: np.ndarray, max_points: int = MAX_CHART_POINTS) -> np.ndarray:
+    """Indices of the points to chart: all of them, or an LTTB selection for long series"""
+    return lttb_indices(values, max_points)
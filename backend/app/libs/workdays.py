@@ -0,0 +1,137 @@
+# Workday Calendar
+# Pacing and goal targets are spread over workdays: Monday-Friday minus
+# Norwegian public holidays (the fixed 1 January, 1 May, 17 May, 25 and 26
+# December, and the Easter-based Maundy Thursday, Good Friday, Easter Monday,
+# Ascension Day and Whit Monday). Counting uses numpy.busday_count over a
+# busdaycalendar built from the computed holiday table, and per-quarter results
+# are memoized, so a request costs a dict lookup.
+#
+# Streaks keep their own weekend-only rule (streak_next_workday in SQL).
+
+from typing import Dict, List, Optional, Tuple
+from dataclasses import dataclass
+from datetime import date, timedelta
+
+import numpy as np
+
+MAX_MEMOIZED_QUARTERS = 256
+
+
+def easter_sunday(year: int) -> date:
+    """Gregorian Easter Sunday (anonymous Gregorian algorithm)"""
+    a = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return date(year, month, day + 1)
+
+
+def norwegian_holidays(year: int) -> List[date]:
+    """Norwegian public holidays (helligdager) in a year, Sundays included"""
+    easter = easter_sunday(year)
+    return sorted([
+        date(year, 1, 1),                 # Nyttårsdag
+        easter - timedelta(days=3),       # Skjærtorsdag
+        easter - timedelta(days=2),       # Langfredag
+        easter,                           # 1. påskedag
+        easter + timedelta(days=1),       # 2. påskedag
+        date(year, 5, 1),                 # Arbeidernes dag
+        date(year, 5, 17),                # Grunnlovsdag
+        easter + timedelta(days=39),      # Kristi himmelfartsdag
+        easter + timedelta(days=49),      # 1. pinsedag
+        easter + timedelta(days=50),      # 2. pinsedag
+        date(year, 12, 25),               # 1. juledag
+        date(year, 12, 26),               # 2. juledag
+    ])
+
+
+@dataclass(frozen=True)
+class QuarterWorkdays:
+    total: int              # workdays in the quarter
+    passed: int             # workdays before today
+    remaining: int          # workdays after today
+    today_is_workday: bool
+
+    @property
+    def left(self) -> int:
+        """Workdays still to work, today included"""
+        return self.remaining + int(self.today_is_workday)
+
+    @property
+    def progress(self) -> float:
+        """Share of the quarter's workdays already behind us (0-1)"""
+        return min(1.0, self.passed / self.total) if self.total > 0 else 0.0
+
+
+class WorkdayCalendar:
+    """Workday counts for the Norwegian calendar, memoized per quarter"""
+
+    def __init__(self):
+        # First and last year in the holiday table
+        self._years: Optional[Tuple[int, int]] = None
+        self._calendar: Optional[np.busdaycalendar] = None
+        self._quarters: Dict[Tuple[date, date, date], QuarterWorkdays] = {}
+
+    def _busdaycal(self, *days: date) -> np.busdaycalendar:
+        """The busday calendar, extended when days fall outside the holiday table"""
+        first = min(d.year for d in days)
+        last = max(d.year for d in days)
+        if self._years is None or first < self._years[0] or last > self._years[1]:
+            if self._years is not None:
+                first, last = min(first, self._years[0]), max(last, self._years[1])
+            # A year either side, so neighbouring quarters do not rebuild it
+            first, last = first - 1, last + 1
+            holidays = [h for year in range(first, last + 1) for h in norwegian_holidays(year)]
+            self._calendar = np.busdaycalendar(weekmask="1111100", holidays=holidays)
+            self._years = (first, last)
+            self._quarters.clear()
+        return self._calendar
+
+    def is_workday(self, day: date) -> bool:
+        return bool(np.is_busday(day, busdaycal=self._busdaycal(day)))
+
+    def count(self, start: date, end: date) -> int:
+        """Workdays from start to end, both inclusive (0 when end is before start)"""
+        if end < start:
+            return 0
+        return int(np.busday_count(start, end + timedelta(days=1), busdaycal=self._busdaycal(start, end)))
+
+    def mask(self, start: date, n_days: int) -> np.ndarray:
+        """Boolean workday flag for each of n_days days from start"""
+        first = np.datetime64(start, "D")
+        days = np.arange(first, first + np.timedelta64(n_days, "D"))
+        calendar = self._busdaycal(start, start + timedelta(days=max(0, n_days - 1)))
+        return np.is_busday(days, busdaycal=calendar)
+
+    def quarter(self, start: date, end: date, today: date) -> QuarterWorkdays:
+        """Total, passed and remaining workdays of a quarter as seen on today"""
+        key = (start, end, today)
+        cached = self._quarters.get(key)
+        if cached is None:
+            if len(self._quarters) >= MAX_MEMOIZED_QUARTERS:
+                # Keys carry the day, so old days pile up; start over
+                self._quarters.clear()
+            self._busdaycal(start, end, today)
+            cached = QuarterWorkdays(
+                total=self.count(start, end),
+                passed=self.count(start, min(end, today - timedelta(days=1))),
+                remaining=self.count(max(start, today + timedelta(days=1)), end),
+                today_is_workday=start <= today <= end and self.is_workday(today),
+            )
+            self._quarters[key] = cached
+        return cached
+
+
+# Global calendar instance
+workday_calendar = WorkdayCalendar()
+
+
+def quarter_workdays(start: date, end: date, today: date) -> QuarterWorkdays:
+    """Helper for the current calendar's view of a quarter"""
+    return workday_calendar.quarter(start, end, today)
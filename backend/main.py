@@ -2,6 +2,7 @@ import os
 import pathlib
 import json
 import dotenv
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, APIRouter, Depends
 
 dotenv.load_dotenv()
@@ -74,9 +75,48 @@ def get_firebase_config() -> dict | None:
     return None
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start and stop background workers with the app."""
+    from app.libs.scoreboard_snapshots import snapshot_scheduler
+    from app.libs.competition_rescoring import rescore_manager
+    from app.libs.scheduler import scheduler
+    from app.libs.scheduled_jobs import register_default_jobs
+    from app.libs.outbox import outbox_dispatcher
+    from app.libs.roster import provision_at_startup
+    from app.libs.local_time import migrate_at_startup
+    from app.libs.idempotency import idempotency_store
+
+    # Schema the queries below depend on; fail startup rather than serve without it
+    await migrate_at_startup()
+    register_default_jobs(scheduler)
+    scheduler.start()
+    snapshot_scheduler.start()
+    outbox_dispatcher.start()
+    try:
+        await provision_at_startup()
+    except Exception as e:
+        print(f"Could not provision roster: {e}")
+    try:
+        await rescore_manager.resume_pending()
+    except Exception as e:
+        print(f"Could not resume rescoring jobs: {e}")
+    try:
+        yield
+    finally:
+        await outbox_dispatcher.stop()
+        await rescore_manager.stop()
+        await snapshot_scheduler.stop()
+        await scheduler.stop()
+        await idempotency_store.close()
+
+
 def create_app() -> FastAPI:
     """Create the app. This is called by uvicorn with the factory option to construct the app object."""
-    app = FastAPI()
+    from app.libs.idempotency import IdempotencyMiddleware
+
+    app = FastAPI(lifespan=lifespan)
+    app.add_middleware(IdempotencyMiddleware)
     app.include_router(import_api_routers())
 
     for route in app.routes:
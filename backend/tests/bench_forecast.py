@@ -0,0 +1,55 @@
+# Quarter-end forecast benchmark
+# Times simulate_quarter_end with N_SIMULATIONS for a 25-player team 40
+# workdays into a quarter with 25 left, and asserts the best of REPEATS runs
+# stays within FORECAST_BUDGET_MS.
+#
+#   python tests/bench_forecast.py
+
+import os
+import sys
+import time
+
+import numpy as np
+import pytest
+
+pytest.importorskip("asyncpg")
+pytest.importorskip("databutton")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.libs.forecast import FORECAST_METRICS, N_SIMULATIONS, simulate_quarter_end  # noqa: E402
+
+PLAYERS = 25
+OBSERVED_DAYS = 40
+REMAINING_DAYS = 25
+REPEATS = 5
+FORECAST_BUDGET_MS = 100
+
+
+def sample_team(rng: np.random.Generator):
+    metrics = len(FORECAST_METRICS)
+    days = rng.poisson([3, 1, 0.3, 6], size=(PLAYERS, OBSERVED_DAYS, metrics)).astype(np.int64)
+    current = days.sum(axis=1)
+    goals = np.full((PLAYERS, metrics), 100, dtype=np.int64)
+    return days, current, goals
+
+
+def best_time_ms(days, current, goals) -> float:
+    simulate_quarter_end(days, current, goals, REMAINING_DAYS, N_SIMULATIONS, seed=0)
+    best = float("inf")
+    for seed in range(REPEATS):
+        started = time.perf_counter()
+        simulate_quarter_end(days, current, goals, REMAINING_DAYS, N_SIMULATIONS, seed=seed)
+        best = min(best, (time.perf_counter() - started) * 1000)
+    return best
+
+
+def test_forecast_within_budget():
+    days, current, goals = sample_team(np.random.default_rng(0))
+    assert best_time_ms(days, current, goals) <= FORECAST_BUDGET_MS
+
+
+if __name__ == "__main__":
+    ms = best_time_ms(*sample_team(np.random.default_rng(0)))
+    print(f"{N_SIMULATIONS} simulations, {PLAYERS} players x {OBSERVED_DAYS} days, "
+          f"{REMAINING_DAYS} left: {ms:.1f} ms (budget {FORECAST_BUDGET_MS} ms)")
@@ -0,0 +1,90 @@
+# Activity logging latency benchmark
+# Runs N_CALLS log_activity calls against a real database, MAX_CONNECTIONS at
+# a time, and asserts the p99 of the per-call times stays within
+# LOG_ACTIVITY_P99_BUDGET_MS. Each call includes its own connect, as in
+# production.
+#
+# Needs DATABASE_URL pointing at a disposable database with the app schema,
+# a quarter and a player mapping; the logged activities are removed again.
+
+import asyncio
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+pytest.importorskip("fastapi")
+asyncpg = pytest.importorskip("asyncpg")
+pytest.importorskip("databutton")
+
+from app.apis import activities  # noqa: E402
+
+pytestmark = pytest.mark.db
+
+N_CALLS = 300
+MAX_CONNECTIONS = 10
+LOG_ACTIVITY_P99_BUDGET_MS = 250
+
+
+async def _run(database_url: str) -> np.ndarray:
+    conn = await asyncpg.connect(database_url)
+    activity_ids, profile_id, earned = [], None, 0
+    try:
+        quarter = await activities.get_current_quarter(conn)
+        if not quarter:
+            pytest.skip("no quarter in the test database")
+        mapping = await conn.fetchrow(
+            """
+            SELECT m.user_id, p.id AS profile_id
+            FROM user_player_mapping m
+            JOIN profiles p ON p.name = m.player_name AND p.quarter_id = $1
+            LIMIT 1
+            """,
+            quarter["id"],
+        )
+        if not mapping:
+            pytest.skip("no mapped player in the current quarter")
+        profile_id = mapping["profile_id"]
+
+        user = SimpleNamespace(sub=str(mapping["user_id"]))
+        gate = asyncio.Semaphore(MAX_CONNECTIONS)
+        timings = []
+
+        async def log_one():
+            async with gate:
+                started = time.perf_counter()
+                result = await activities.log_activity(
+                    activities.LogActivityRequest(type=activities.ActivityType.BOOK), user
+                )
+                timings.append((time.perf_counter() - started) * 1000)
+                return result
+
+        # Warm up the per-process schema checks before timing
+        results = [await log_one()]
+        timings.clear()
+        results += await asyncio.gather(*(log_one() for _ in range(N_CALLS)))
+        activity_ids = [r.activity_id for r in results]
+        earned = sum(r.points_earned for r in results)
+        return np.array(timings)
+    finally:
+        if activity_ids:
+            await conn.execute(
+                "DELETE FROM outbox WHERE topic = 'activity.logged' AND (payload->>'activity_id')::int = ANY($1::int[])",
+                activity_ids,
+            )
+            await conn.execute("DELETE FROM activities WHERE id = ANY($1::int[])", activity_ids)
+            await conn.execute("UPDATE profiles SET points = points - $1 WHERE id = $2", earned, profile_id)
+        await conn.close()
+
+
+def test_log_activity_p99_within_budget(monkeypatch, database_url):
+    monkeypatch.setattr(activities, "db", SimpleNamespace(secrets=SimpleNamespace(get=lambda _name: database_url)))
+    # The snapshot rebuild would connect on its own; not part of this benchmark
+    monkeypatch.setattr(activities, "note_team_stats_write", lambda _quarter_id: None)
+    timings = asyncio.run(_run(database_url))
+
+    p50, p99 = np.percentile(timings, [50, 99])
+    print(f"log_activity: {len(timings)} calls, p50 {p50:.1f} ms, p99 {p99:.1f} ms")
+    assert len(timings) == N_CALLS
+    assert p99 <= LOG_ACTIVITY_P99_BUDGET_MS
@@ -0,0 +1,77 @@
+# Scoring simulator benchmark
+# Replays N_EVENTS events for 12 players through simulate() under a rule set
+# with every multiplier, combo and cap type, and asserts the best of REPEATS
+# runs stays within SIMULATE_BUDGET_MS.
+#
+#   python tests/bench_scoring_simulator.py
+
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+pytest.importorskip("pydantic")
+pytest.importorskip("asyncpg")
+pytest.importorskip("databutton")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.libs.models_competition_v2 import (  # noqa: E402
+    BookingActivityType, Caps, Combo, CompetitionRules, Multiplier, TimeWindow,
+)
+from app.libs.scoring_simulator import simulate  # noqa: E402
+
+N_EVENTS = 5000
+PLAYERS = 12
+REPEATS = 3
+SIMULATE_BUDGET_MS = 500
+
+RULES = CompetitionRules(
+    multipliers=[
+        Multiplier(type="time_window", mult=1.5, window=TimeWindow(start="07:00", end="09:30")),
+        Multiplier(type="streak", mult=2.0, min=3),
+        Multiplier(type="early_bird", mult=1.2, min=10),
+    ],
+    combos=[
+        Combo(name="full_funnel", within_minutes=60, bonus=15,
+              required_types=[BookingActivityType.CALL, BookingActivityType.BOOK]),
+        Combo(name="rapid_fire", within_minutes=30, bonus=5),
+    ],
+    caps=Caps(per_player_per_day=40, per_player_total=2000, global_total=20000),
+)
+
+
+def sample_events(seed: int = 0):
+    rng = random.Random(seed)
+    ts = datetime(2025, 1, 6, 6, 0, tzinfo=timezone.utc)
+    events = []
+    for _ in range(N_EVENTS):
+        ts += timedelta(seconds=rng.randint(30, 900))
+        events.append({
+            "player_name": f"Player {rng.randrange(PLAYERS)}",
+            "type": rng.choice(list(BookingActivityType)).value,
+            "ts": ts,
+            "points": 1,
+        })
+    return events
+
+
+def best_time_ms(events) -> float:
+    best = float("inf")
+    for _ in range(REPEATS):
+        started = time.perf_counter()
+        simulate(RULES, events)
+        best = min(best, (time.perf_counter() - started) * 1000)
+    return best
+
+
+def test_simulate_within_budget():
+    assert best_time_ms(sample_events()) <= SIMULATE_BUDGET_MS
+
+
+if __name__ == "__main__":
+    ms = best_time_ms(sample_events())
+    print(f"simulate: {N_EVENTS} events, {PLAYERS} players: {ms:.1f} ms (budget {SIMULATE_BUDGET_MS} ms)")
@@ -0,0 +1,57 @@
+# Time series benchmark
+# Times the insights pipeline (dense_daily, weekly_buckets, rolling_mean and
+# lttb_indices) on 1, 2, 4 and 8 years of per-profile rollup rows. Time per
+# day should stay roughly flat as the range doubles, i.e. linear overall.
+#
+#   python tests/bench_timeseries.py
+
+import os
+import sys
+import time
+from datetime import date, timedelta
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.libs.timeseries import (  # noqa: E402
+    MAX_CHART_POINTS, dense_daily, lttb_indices, rolling_mean, weekly_buckets,
+)
+
+PROFILES = 12
+REPEATS = 20
+
+
+def rows_for(start: date, days: int, rng: np.random.Generator):
+    return [
+        {"d": start + timedelta(days=i), "value": int(v)}
+        for i in range(days)
+        for v in rng.integers(0, 6, PROFILES)
+    ]
+
+
+def pipeline(rows, start: date, end: date):
+    daily = dense_daily(rows, start, end)
+    weekly_buckets(daily, start)
+    rolling_mean(daily, 7)
+    lttb_indices(daily, MAX_CHART_POINTS)
+
+
+def main():
+    rng = np.random.default_rng(0)
+    start = date(2024, 1, 1)
+    print(f"{'days':>6} {'rows':>7} {'ms':>8} {'us/day':>8}")
+    for years in (1, 2, 4, 8):
+        days = 365 * years
+        end = start + timedelta(days=days - 1)
+        rows = rows_for(start, days, rng)
+        pipeline(rows, start, end)
+        began = time.perf_counter()
+        for _ in range(REPEATS):
+            pipeline(rows, start, end)
+        ms = (time.perf_counter() - began) * 1000 / REPEATS
+        print(f"{days:>6} {len(rows):>7} {ms:>8.2f} {ms * 1000 / days:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,29 @@
+# Shared test setup
+# Makes `app` importable from the backend directory and provides the `db`
+# marker: tests marked with it talk to a real Postgres at DATABASE_URL and are
+# skipped when that is not set.
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "db: needs a Postgres database at DATABASE_URL")
+
+
+def pytest_collection_modifyitems(config, items):
+    if os.environ.get("DATABASE_URL"):
+        return
+    skip = pytest.mark.skip(reason="DATABASE_URL not set")
+    for item in items:
+        if "db" in item.keywords:
+            item.add_marker(skip)
+
+
+@pytest.fixture
+def database_url():
+    return os.environ["DATABASE_URL"]
@@ -0,0 +1,90 @@
+# Admin challenge listing: participants come from one batched query, so the
+# number of round trips does not grow with the number of challenges.
+
+import asyncio
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("asyncpg")
+pytest.importorskip("databutton")
+
+from app.apis import admin  # noqa: E402
+
+
+class FakeConnection:
+    """Counts fetch calls and answers them from canned rows"""
+
+    def __init__(self, challenges, participants):
+        self.challenges = challenges
+        self.participants = participants
+        self.fetch_calls = 0
+        self.closed = False
+
+    async def fetch(self, query, *args):
+        self.fetch_calls += 1
+        if "FROM challenge_participants" in query:
+            wanted = set(args[0])
+            return [p for p in self.participants if p["challenge_id"] in wanted]
+        return self.challenges
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeUser:
+    sub = admin.ADMIN_USER_IDS[0]
+
+
+def _challenge(challenge_id, type_="team_push", progress_mode=None):
+    now = datetime.now()
+    return {
+        "id": challenge_id, "template_id": None, "quarter_id": 1,
+        "title": f"Challenge {challenge_id}", "description": "", "type": type_, "icon": "🏆",
+        "target_value": 10, "target_type": "activities", "current_progress": 3,
+        "start_time": now, "end_time": now + timedelta(hours=5),
+        "reward_points": 5, "reward_description": None, "status": "active",
+        "completed_by": None, "completed_at": None, "auto_generated": False,
+        "generation_trigger": None, "created_at": now, "progress_mode": progress_mode,
+        "time_remaining_hours": 5.0, "progress_percentage": 30.0,
+    }
+
+
+def _list(monkeypatch, conn, **kwargs):
+    async def connect(*_args, **_kwargs):
+        return conn
+
+    monkeypatch.setattr(admin.asyncpg, "connect", connect)
+    monkeypatch.setattr(admin, "db", SimpleNamespace(secrets=SimpleNamespace(get=lambda _name: "postgresql://test")))
+    return asyncio.run(admin.get_active_challenges(user=FakeUser(), **kwargs))
+
+
+@pytest.mark.parametrize("n_challenges", [1, 5, 50])
+def test_active_challenges_use_two_queries(monkeypatch, n_challenges):
+    challenges = [
+        _challenge(i, progress_mode="per_person" if i % 2 else None)
+        for i in range(1, n_challenges + 1)
+    ]
+    participants = [
+        {"challenge_id": c["id"], "player_name": name, "contribution": k}
+        for c in challenges for k, name in enumerate(["Ada", "Bo"])
+    ]
+    conn = FakeConnection(challenges, participants)
+
+    result = _list(monkeypatch, conn, quarter_id=1)
+
+    assert conn.fetch_calls == 2
+    assert conn.closed
+    assert len(result) == n_challenges
+    assert all(len(c.participants) == 2 for c in result)
+
+
+def test_active_challenges_skip_participant_query_when_none_need_it(monkeypatch):
+    conn = FakeConnection([_challenge(1, type_="sprint"), _challenge(2, type_="sprint")], [])
+
+    result = _list(monkeypatch, conn)
+
+    assert conn.fetch_calls == 1
+    assert [c.participants for c in result] == [None, None]
@@ -0,0 +1,209 @@
+# Quarter-wide challenge recalculation against a real database: the dry run
+# must report exactly what the real run then writes, completed, expired and
+# non-activity challenges must come out untouched, and a full quarter must be
+# recalculated within RECALC_BUDGET_SECONDS.
+#
+# Needs DATABASE_URL pointing at a disposable database with the app schema;
+# the test seeds its own quarter, players, activities and challenges and
+# removes what it created afterwards.
+
+import asyncio
+import time
+import uuid
+
+import pytest
+
+asyncpg = pytest.importorskip("asyncpg")
+pytest.importorskip("databutton")
+
+from app.libs.challenges import recalc_challenges  # noqa: E402
+
+pytestmark = pytest.mark.db
+
+N_PLAYERS = 25
+# Roughly ten logs per workday over a quarter; player k logs k extra
+BASE_ACTIVITIES = 600
+RECALC_BUDGET_SECONDS = 2.0
+
+ACTIVITY_TYPES = ("book", "opp", "deal")
+
+# Tables filled by triggers on activities, keyed by profile id
+PROFILE_SIDE_TABLES = ("activity_daily_rollup", "activity_hour_of_week", "profile_counters", "profile_pace")
+
+
+def _player_counts(n_activities: int) -> dict:
+    """Per-type counts of the seeded activities (type cycles with the series index)"""
+    counts = dict.fromkeys(ACTIVITY_TYPES, 0)
+    for g in range(1, n_activities + 1):
+        counts[ACTIVITY_TYPES[g % 3]] += 1
+    return counts
+
+
+async def _create_challenge(conn, quarter_id: int, title: str, target_type: str, target: int,
+                            mode: str, status: str, progress: int) -> int:
+    return await conn.fetchval(
+        """
+        INSERT INTO challenges (
+            quarter_id, title, description, type, icon, target_value, target_type,
+            current_progress, start_time, end_time, reward_points, reward_description, status,
+            progress_mode, completed_by, completed_at
+        ) VALUES (
+            $1, $2, 'recalc test', 'team_push', '🧪', $3, $4,
+            $5, NOW() - INTERVAL '1 day', NOW() + INTERVAL '1 day', 10, NULL, $6,
+            $7, CASE WHEN $6 = 'completed' THEN 'TEAM' END,
+            CASE WHEN $6 = 'completed' THEN NOW() END
+        ) RETURNING id
+        """,
+        quarter_id, title, target, target_type, progress, status, mode,
+    )
+
+
+async def _snapshot(conn, challenge_ids):
+    challenges = {
+        r["id"]: dict(r) for r in await conn.fetch(
+            """
+            SELECT id, current_progress, status, completed_by, completed_at
+            FROM challenges WHERE id = ANY($1::int[])
+            """,
+            challenge_ids,
+        )
+    }
+    participants = {
+        (r["challenge_id"], r["player_name"]): r["contribution"] for r in await conn.fetch(
+            """
+            SELECT challenge_id, player_name, contribution
+            FROM challenge_participants WHERE challenge_id = ANY($1::int[])
+            """,
+            challenge_ids,
+        )
+    }
+    return challenges, participants
+
+
+async def _run(database_url: str):
+    conn = await asyncpg.connect(database_url)
+    tag = uuid.uuid4().hex[:8]
+    quarter_id, profile_ids, challenge_ids = None, [], []
+    try:
+        quarter_id = await conn.fetchval(
+            """
+            INSERT INTO quarters (name, start_date, end_date)
+            VALUES ($1, '2001-01-01', '2001-03-31')
+            RETURNING id
+            """,
+            f"recalc test {tag}",
+        )
+        names = [f"recalc-{tag}-{k:02d}" for k in range(N_PLAYERS)]
+        by_name = {
+            r["name"]: r["id"] for r in await conn.fetch(
+                """
+                INSERT INTO profiles (user_id, quarter_id, name, points)
+                SELECT gen_random_uuid(), $1, n, 0 FROM unnest($2::text[]) AS n
+                RETURNING id, name
+                """,
+                quarter_id, names,
+            )
+        }
+        profile_ids = [by_name[n] for n in names]
+        await conn.execute(
+            """
+            INSERT INTO activities (profile_id, quarter_id, type, points, created_at)
+            SELECT p.id, $1, (ARRAY['book', 'opp', 'deal'])[1 + g % 3], 1,
+                   TIMESTAMPTZ '2001-01-01 09:00+01' + (g % 90) * INTERVAL '1 day'
+            FROM unnest($2::int[]) WITH ORDINALITY AS p(id, k)
+            CROSS JOIN LATERAL generate_series(1, $3 + p.k::int - 1) AS g
+            """,
+            quarter_id, profile_ids, BASE_ACTIVITIES,
+        )
+        counts = [_player_counts(BASE_ACTIVITIES + k) for k in range(N_PLAYERS)]
+        team_deals = sum(c["deal"] for c in counts)
+
+        meetings_id = await _create_challenge(
+            conn, quarter_id, "per person meetings", "meetings", 10_000, "per_person", "active", 0)
+        activities_id = await _create_challenge(
+            conn, quarter_id, "team activities", "activities", 10 ** 6, "team_total", "active", 5)
+        deals_id = await _create_challenge(
+            conn, quarter_id, "team deals", "deals", team_deals // 2, "team_total", "active", 0)
+        completed_id = await _create_challenge(
+            conn, quarter_id, "completed opps", "opportunities", 5, "per_person", "completed", 5)
+        expired_id = await _create_challenge(
+            conn, quarter_id, "expired meetings", "meetings", 10_000, "team_total", "expired", 3)
+        points_id = await _create_challenge(
+            conn, quarter_id, "points", "points", 500, "per_person", "active", 11)
+        challenge_ids = [meetings_id, activities_id, deals_id, completed_id, expired_id, points_id]
+        untouched = [completed_id, expired_id, points_id]
+
+        # Stale contributions: one too high, one missing, and paid-out rows on
+        # the completed challenge that must survive the recalc
+        await conn.execute(
+            """
+            INSERT INTO challenge_participants (challenge_id, player_name, contribution)
+            VALUES ($1, $3, 999), ($2, $3, 5), ($2, $4, 1)
+            """,
+            meetings_id, completed_id, names[0], names[1],
+        )
+
+        before = await _snapshot(conn, challenge_ids)
+        dry = await recalc_challenges(conn, quarter_id=quarter_id, dry_run=True)
+        assert await _snapshot(conn, challenge_ids) == before
+
+        started = time.perf_counter()
+        real = await recalc_challenges(conn, quarter_id=quarter_id)
+        elapsed = time.perf_counter() - started
+
+        assert real == dry
+        assert set(real) == set(challenge_ids)
+        assert elapsed < RECALC_BUDGET_SECONDS, f"recalc took {elapsed:.2f}s"
+
+        meetings = real[meetings_id]
+        assert meetings["after_progress"] == max(c["book"] for c in counts)
+        assert meetings["after_status"] == "active"
+        assert meetings["player_diffs"][names[0]] == {"before": 999, "after": counts[0]["book"]}
+        assert len(meetings["player_diffs"]) == N_PLAYERS
+        assert real[activities_id]["after_progress"] == sum(sum(c.values()) for c in counts)
+        assert real[activities_id]["after_status"] == "active"
+        assert real[deals_id]["after_progress"] == team_deals
+        assert real[deals_id]["after_status"] == "completed"
+        for cid in untouched:
+            assert real[cid]["after_progress"] == real[cid]["before_progress"]
+            assert real[cid]["after_status"] == real[cid]["before_status"]
+            assert real[cid]["player_diffs"] == {}
+
+        challenges, participants = await _snapshot(conn, challenge_ids)
+        for cid in untouched:
+            assert challenges[cid] == before[0][cid]
+        assert {k: v for k, v in participants.items() if k[0] == completed_id} == {
+            k: v for k, v in before[1].items() if k[0] == completed_id
+        }
+        assert participants[(meetings_id, names[0])] == counts[0]["book"]
+        assert challenges[deals_id]["completed_by"] == "TEAM"
+
+        # Written state matches activities, so a second dry run finds nothing
+        again = await recalc_challenges(conn, quarter_id=quarter_id, dry_run=True)
+        assert all(not d["player_diffs"] for d in again.values())
+        assert all(d["before_progress"] == d["after_progress"] for d in again.values())
+    finally:
+        if challenge_ids:
+            await conn.execute("DELETE FROM challenge_participants WHERE challenge_id = ANY($1::int[])", challenge_ids)
+            await conn.execute("DELETE FROM challenges WHERE id = ANY($1::int[])", challenge_ids)
+        if profile_ids:
+            await conn.execute("DELETE FROM activities WHERE profile_id = ANY($1::int[])", profile_ids)
+            for table in PROFILE_SIDE_TABLES:
+                if await conn.fetchval("SELECT to_regclass($1) IS NOT NULL", table):
+                    await conn.execute(f"DELETE FROM {table} WHERE profile_id = ANY($1::int[])", profile_ids)
+            if await conn.fetchval("SELECT to_regclass('streaks') IS NOT NULL"):
+                await conn.execute(
+                    """
+                    DELETE FROM streaks
+                    WHERE (scope = 'profile' AND scope_id = ANY($1::int[])) OR (scope = 'team' AND scope_id = $2)
+                    """,
+                    profile_ids, quarter_id,
+                )
+            await conn.execute("DELETE FROM profiles WHERE id = ANY($1::int[])", profile_ids)
+        if quarter_id is not None:
+            await conn.execute("DELETE FROM quarters WHERE id = $1", quarter_id)
+        await conn.close()
+
+
+def test_dry_run_matches_real_run_and_keeps_closed_challenges(database_url):
+    asyncio.run(_run(database_url))
@@ -0,0 +1,84 @@
+# Oslo-day predicates on the stored local_date columns must be answerable
+# from the composite indexes ensure_local_time_columns creates. Each query is
+# EXPLAINed with sequential scans disabled: if no local_date index can serve
+# the predicate, the planner still falls back to a Seq Scan and the test fails.
+#
+# Needs DATABASE_URL pointing at a database with the app schema.
+
+import asyncio
+import json
+from datetime import datetime, timezone
+
+import pytest
+
+asyncpg = pytest.importorskip("asyncpg")
+pytest.importorskip("databutton")
+
+from app.libs.local_time import (  # noqa: E402
+    LOCAL_TIME_TABLES, SQL_LOCAL_TODAY, ensure_local_time_columns, sql_local_date,
+)
+
+pytestmark = pytest.mark.db
+
+NOW = datetime.now(timezone.utc)
+
+# (table, query with local_date predicates as the app writes them, sample args)
+QUERIES = [
+    ("activities",
+     f"SELECT COUNT(*) FROM activities WHERE profile_id = $1 AND local_date = {SQL_LOCAL_TODAY}",
+     [1]),
+    ("activities",
+     f"SELECT local_date, COUNT(*) FROM activities WHERE quarter_id = $1 "
+     f"AND local_date BETWEEN {SQL_LOCAL_TODAY} - 30 AND {SQL_LOCAL_TODAY} GROUP BY local_date",
+     [1]),
+    ("booking_competition_entries",
+     f"SELECT COUNT(*) FROM booking_competition_entries WHERE competition_id = $1 AND player_name = $2 "
+     f"AND local_date = {SQL_LOCAL_TODAY}",
+     [1, "Nobody"]),
+    ("booking_competition_events",
+     f"SELECT COUNT(*) FROM booking_competition_events WHERE competition_id = $1 AND player_name = $2 "
+     f"AND local_date = {sql_local_date('$3::timestamptz')}",
+     [1, "Nobody", NOW]),
+    ("booking_competition_events",
+     f"SELECT COUNT(*) FROM booking_competition_events WHERE competition_id = $1 "
+     f"AND local_date = {sql_local_date('$2::timestamptz')} AND ts < $2",
+     [1, NOW]),
+]
+
+
+def _scans(plan):
+    """(node type, index name) of every scan node in an EXPLAIN (FORMAT JSON) plan"""
+    found = []
+    if "Scan" in plan["Node Type"]:
+        found.append((plan["Node Type"], plan.get("Index Name")))
+    for child in plan.get("Plans", []):
+        found.extend(_scans(child))
+    return found
+
+
+async def _plans(database_url: str):
+    conn = await asyncpg.connect(database_url)
+    try:
+        await ensure_local_time_columns(conn)
+        plans = []
+        async with conn.transaction():
+            await conn.execute("SET LOCAL enable_seqscan = off")
+            for table, query, args in QUERIES:
+                if not await conn.fetchval("SELECT to_regclass($1) IS NOT NULL", table):
+                    continue
+                raw = await conn.fetchval(f"EXPLAIN (FORMAT JSON) {query}", *args)
+                plan = json.loads(raw) if isinstance(raw, str) else raw
+                plans.append((table, query, _scans(plan[0]["Plan"])))
+        return plans
+    finally:
+        await conn.close()
+
+
+def test_local_date_predicates_use_indexes(database_url):
+    plans = asyncio.run(_plans(database_url))
+    if not plans:
+        pytest.skip("none of the local_date tables exist in the test database")
+    for table, query, scans in plans:
+        index_names = {name for name, _ in LOCAL_TIME_TABLES[table][1]}
+        assert all(node != "Seq Scan" for node, _ in scans), (query, scans)
+        assert any(name in index_names for _, name in scans), (query, scans)
@@ -0,0 +1,169 @@
+# ScoringSimulator must score exactly like ScoringEngine. The engine's rule
+# methods run here against a fake connection that answers their queries from
+# an in-memory event table, and every event of a generated sequence must get
+# the same points and rule_triggered from both.
+
+import asyncio
+import random
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("pydantic")
+pytest.importorskip("asyncpg")
+pytest.importorskip("databutton")
+
+from app.libs import scoring_engine  # noqa: E402
+from app.libs.models_competition_v2 import (  # noqa: E402
+    BookingActivityType, Caps, Combo, CompetitionEventCreate, CompetitionRules,
+    Multiplier, PointsConfig, TimeWindow,
+)
+from app.libs.scoring_simulator import ScoringSimulator, oslo_date, simulate  # noqa: E402
+
+COMPETITION_ID = 7
+PLAYERS = ["Ada", "Bo", "Cy"]
+
+
+class EventTableConnection:
+    """Answers ScoringEngine's rule queries from a list of (player, type, ts) rows"""
+
+    def __init__(self):
+        self.events = []
+
+    async def close(self):
+        pass
+
+    def _player(self, player):
+        return [e for e in self.events if e[0] == player]
+
+    async def fetchval(self, query, *args):
+        if "streak_length" in query:
+            _, player, ts = args
+            # Gaps and islands over the player's last 24 hours, newest first
+            times = sorted(e[2] for e in self._player(player) if e[2] >= ts - timedelta(hours=24))
+            streak = 0
+            for i in range(len(times) - 1, -1, -1):
+                if i == 0 or times[i] - times[i - 1] > timedelta(hours=2):
+                    break
+                streak += 1
+            return streak
+        if "ts < $2" in query:
+            _, ts = args
+            return sum(1 for e in self.events if oslo_date(e[2]) == oslo_date(ts) and e[2] < ts)
+        if "ts BETWEEN" in query:
+            _, player, start, end = args
+            return sum(1 for e in self._player(player) if start <= e[2] <= end)
+        if "local_date" in query:
+            _, player, ts = args
+            return sum(1 for e in self._player(player) if oslo_date(e[2]) == oslo_date(ts))
+        if "player_name = $2" in query:
+            return len(self._player(args[1]))
+        return len(self.events)
+
+    async def fetch(self, query, *args):
+        assert "GROUP BY type" in query
+        _, player, start, end, types = args
+        counts = {}
+        for e in self._player(player):
+            if start <= e[2] <= end and e[1] in types:
+                counts[e[1]] = counts.get(e[1], 0) + 1
+        return [{"type": t, "count": n} for t, n in counts.items()]
+
+
+RULES = [
+    CompetitionRules(),
+    CompetitionRules(
+        points=PointsConfig(lift=2, call=5, book=12),
+        multipliers=[
+            Multiplier(type="time_window", mult=1.5, window=TimeWindow(start="07:00", end="09:30")),
+            Multiplier(type="streak", mult=2.0, min=3),
+            Multiplier(type="early_bird", mult=1.2, min=4),
+        ],
+        combos=[
+            Combo(name="full_funnel", within_minutes=60, bonus=15,
+                  required_types=[BookingActivityType.CALL, BookingActivityType.BOOK]),
+            Combo(name="rapid_fire", within_minutes=45, bonus=5),
+        ],
+    ),
+    CompetitionRules(
+        multipliers=[Multiplier(type="time_window", mult=3.0, window=TimeWindow(start="22:00", end="02:00"))],
+        caps=Caps(per_player_per_day=6, per_player_total=40, global_total=130),
+    ),
+]
+
+
+def _events(seed: int, n: int):
+    rng = random.Random(seed)
+    ts = datetime(2025, 3, 28, 5, 0, tzinfo=timezone.utc)
+    events = []
+    for _ in range(n):
+        # Mostly bursts, sometimes long gaps that cross days and break streaks
+        ts += timedelta(minutes=rng.choice([1, 3, 7, 15, 40, 130, 600]), seconds=rng.randint(1, 59))
+        events.append({
+            "player_name": rng.choice(PLAYERS),
+            "type": rng.choice(list(BookingActivityType)).value,
+            "ts": ts,
+            "custom_points": rng.choice([None] * 9 + [7]),
+        })
+    return events
+
+
+async def _engine_scores(monkeypatch, rules, events):
+    conn = EventTableConnection()
+    monkeypatch.setattr(scoring_engine, "db", SimpleNamespace(secrets=SimpleNamespace(get=lambda _name: "")))
+    engine = scoring_engine.ScoringEngine()
+
+    async def get_connection():
+        return conn
+
+    engine.get_connection = get_connection
+    scored = []
+    for e in events:
+        event = CompetitionEventCreate(
+            competition_id=COMPETITION_ID, player_name=e["player_name"],
+            type=BookingActivityType(e["type"]), custom_points=e["custom_points"],
+        )
+        scored.append(await engine.score_event(event, rules, e["ts"]))
+        # Capped events are stored too
+        conn.events.append((e["player_name"], e["type"], e["ts"]))
+    return scored
+
+
+@pytest.mark.parametrize("rules_index", range(len(RULES)))
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_simulator_matches_engine(monkeypatch, rules_index, seed):
+    rules = RULES[rules_index]
+    events = _events(seed, 150)
+
+    expected = asyncio.run(_engine_scores(monkeypatch, rules, events))
+    simulator = ScoringSimulator(rules)
+    actual = [
+        simulator.score(e["player_name"], BookingActivityType(e["type"]), e["ts"], e["custom_points"])
+        for e in events
+    ]
+
+    assert actual == expected
+
+
+def test_simulate_summarises_per_player_and_triggers():
+    rules = RULES[1]
+    events = _events(4, 200)
+    simulator = ScoringSimulator(rules)
+    scores = [
+        simulator.score(e["player_name"], BookingActivityType(e["type"]), e["ts"], e["custom_points"])
+        for e in events
+    ]
+
+    # simulate() sorts by ts itself
+    result = simulate(rules, list(reversed(events)))
+
+    assert result["events_simulated"] == len(events)
+    totals = {p["player_name"]: p["total_points"] for p in result["players"]}
+    for name in PLAYERS:
+        assert totals.get(name, 0) == sum(
+            points for e, (points, _) in zip(events, scores) if e["player_name"] == name
+        )
+    combos = sum(len(rt.get("achieved_combos", [])) for _, rt in scores)
+    assert combos == sum(n for k, n in result["trigger_counts"].items() if k.startswith("combo:"))
+    assert [p["total_points"] for p in result["players"]] == sorted(totals.values(), reverse=True)
@@ -0,0 +1,114 @@
+# Concurrent activity logging against a real database: team challenge
+# progress is one atomic UPDATE, so parallel log_activity calls must neither
+# lose increments nor push a challenge past completion.
+#
+# Needs DATABASE_URL pointing at a disposable database with the app schema,
+# a quarter and a player mapping; the test writes activities and challenges
+# and removes what it created afterwards.
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("fastapi")
+asyncpg = pytest.importorskip("asyncpg")
+pytest.importorskip("databutton")
+
+from app.apis import activities  # noqa: E402
+
+pytestmark = pytest.mark.db
+
+N_CALLS = 200
+MAX_CONNECTIONS = 20
+
+
+async def _create_challenge(conn, quarter_id: int, title: str, target: int) -> int:
+    return await conn.fetchval(
+        """
+        INSERT INTO challenges (
+            quarter_id, title, description, type, icon, target_value, target_type,
+            current_progress, start_time, end_time, reward_points, reward_description, status
+        ) VALUES (
+            $1, $2, 'concurrency test', 'team_push', '🧪', $3, 'activities',
+            0, NOW(), NOW() + INTERVAL '1 hour', 0, NULL, 'active'
+        ) RETURNING id
+        """,
+        quarter_id, title, target,
+    )
+
+
+async def _run(database_url: str):
+    conn = await asyncpg.connect(database_url)
+    challenge_ids, activity_ids, profile_id, earned = [], [], None, 0
+    try:
+        quarter = await activities.get_current_quarter(conn)
+        if not quarter:
+            pytest.skip("no quarter in the test database")
+        mapping = await conn.fetchrow(
+            """
+            SELECT m.user_id, p.id AS profile_id
+            FROM user_player_mapping m
+            JOIN profiles p ON p.name = m.player_name AND p.quarter_id = $1
+            LIMIT 1
+            """,
+            quarter["id"],
+        )
+        if not mapping:
+            pytest.skip("no mapped player in the current quarter")
+        profile_id = mapping["profile_id"]
+
+        open_id = await _create_challenge(conn, quarter["id"], "concurrency open", N_CALLS * 10)
+        capped_id = await _create_challenge(conn, quarter["id"], "concurrency capped", N_CALLS // 2)
+        challenge_ids = [open_id, capped_id]
+
+        user = SimpleNamespace(sub=str(mapping["user_id"]))
+        gate = asyncio.Semaphore(MAX_CONNECTIONS)
+
+        async def log_one():
+            async with gate:
+                return await activities.log_activity(
+                    activities.LogActivityRequest(type=activities.ActivityType.BOOK), user
+                )
+
+        results = await asyncio.gather(*(log_one() for _ in range(N_CALLS)))
+        activity_ids = [r.activity_id for r in results]
+        earned = sum(r.points_earned for r in results)
+
+        assert len(set(activity_ids)) == N_CALLS
+        rows = {
+            r["id"]: r for r in await conn.fetch(
+                """
+                SELECT c.id, c.current_progress, c.status,
+                       (SELECT COALESCE(SUM(contribution), 0) FROM challenge_participants
+                        WHERE challenge_id = c.id) AS contributed
+                FROM challenges c WHERE c.id = ANY($1::int[])
+                """,
+                challenge_ids,
+            )
+        }
+        assert rows[open_id]["current_progress"] == N_CALLS
+        assert rows[open_id]["contributed"] == N_CALLS
+        assert rows[open_id]["status"] == "active"
+        assert rows[capped_id]["current_progress"] == N_CALLS // 2
+        assert rows[capped_id]["contributed"] == N_CALLS // 2
+        assert rows[capped_id]["status"] == "completed"
+    finally:
+        if activity_ids:
+            await conn.execute(
+                "DELETE FROM outbox WHERE topic = 'activity.logged' AND (payload->>'activity_id')::int = ANY($1::int[])",
+                activity_ids,
+            )
+            await conn.execute("DELETE FROM activities WHERE id = ANY($1::int[])", activity_ids)
+            await conn.execute("UPDATE profiles SET points = points - $1 WHERE id = $2", earned, profile_id)
+        if challenge_ids:
+            await conn.execute("DELETE FROM challenge_participants WHERE challenge_id = ANY($1::int[])", challenge_ids)
+            await conn.execute("DELETE FROM challenges WHERE id = ANY($1::int[])", challenge_ids)
+        await conn.close()
+
+
+def test_parallel_logs_keep_exact_team_progress(monkeypatch, database_url):
+    monkeypatch.setattr(activities, "db", SimpleNamespace(secrets=SimpleNamespace(get=lambda _name: database_url)))
+    # The snapshot rebuild would connect on its own; not part of this test
+    monkeypatch.setattr(activities, "note_team_stats_write", lambda _quarter_id: None)
+    asyncio.run(_run(database_url))
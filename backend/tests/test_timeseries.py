@@ -0,0 +1,106 @@
+# Time series helpers checked against straightforward per-day loops
+
+from datetime import date, timedelta
+
+import numpy as np
+import pytest
+
+from app.libs.timeseries import dense_daily, lttb_indices, rolling_mean, weekly_buckets
+
+
+def reference_lttb(y, threshold):
+    """Textbook LTTB, one bucket at a time, on the same bucket edges"""
+    n = len(y)
+    if threshold >= n or threshold < 3:
+        return list(range(n))
+    edges = [int(e) for e in np.floor(np.linspace(1, n - 1, threshold - 1))]
+    keep = [0]
+    for b in range(threshold - 2):
+        lo, hi = edges[b], edges[b + 1]
+        if b + 2 < len(edges):
+            nxt = range(edges[b + 1], edges[b + 2])
+            avg_x = sum(nxt) / len(nxt)
+            avg_y = sum(float(y[i]) for i in nxt) / len(nxt)
+        else:
+            avg_x, avg_y = n - 1, float(y[-1])
+        a = keep[-1]
+        best, best_area = lo, -1.0
+        for i in range(lo, hi):
+            area = abs((a - avg_x) * (y[i] - y[a]) - (a - i) * (avg_y - y[a]))
+            if area > best_area:
+                best, best_area = i, area
+        keep.append(best)
+    keep.append(n - 1)
+    return keep
+
+
+@pytest.mark.parametrize("n,threshold", [(10, 5), (365, 60), (1000, 240), (241, 240), (500, 3)])
+def test_lttb_matches_reference(n, threshold):
+    y = np.random.default_rng(n).integers(0, 20, n)
+    assert lttb_indices(y, threshold).tolist() == reference_lttb(y, threshold)
+
+
+def test_lttb_keeps_ends_and_spike():
+    y = np.zeros(1000, dtype=np.int64)
+    y[517] = 50
+    keep = lttb_indices(y, 100)
+    assert len(keep) == 100
+    assert keep[0] == 0 and keep[-1] == 999
+    assert 517 in keep
+    assert np.all(np.diff(keep) > 0)
+
+
+def test_lttb_short_series_untouched():
+    assert lttb_indices(np.arange(5), 10).tolist() == [0, 1, 2, 3, 4]
+    assert lttb_indices(np.arange(5), 2).tolist() == [0, 1, 2, 3, 4]
+
+
+@pytest.mark.parametrize("start", [date(2024, 1, 1), date(2024, 1, 3), date(2024, 1, 7)])
+def test_weekly_buckets_match_monday_weeks(start):
+    values = np.random.default_rng(1).integers(0, 9, 40)
+    labels, sums = weekly_buckets(values, start)
+
+    expected = {}
+    for i, v in enumerate(values):
+        day = start + timedelta(days=i)
+        monday = day - timedelta(days=day.weekday())
+        expected[monday] = expected.get(monday, 0) + int(v)
+    assert labels == sorted(expected)
+    assert sums.tolist() == [expected[m] for m in labels]
+    assert all(m.weekday() == 0 for m in labels)
+
+
+def test_weekly_buckets_empty():
+    labels, sums = weekly_buckets(np.zeros(0, dtype=np.int64), date(2024, 1, 1))
+    assert labels == [] and len(sums) == 0
+
+
+@pytest.mark.parametrize("window", [1, 3, 7, 50])
+def test_rolling_mean_matches_trailing_window(window):
+    values = np.random.default_rng(window).integers(0, 30, 30)
+    expected = [values[max(0, i - window + 1):i + 1].mean() for i in range(len(values))]
+    assert np.allclose(rolling_mean(values, window), expected)
+
+
+def test_rolling_mean_empty():
+    assert len(rolling_mean(np.zeros(0), 7)) == 0
+
+
+def test_dense_daily_sums_rows_per_day_and_drops_outside():
+    start, end = date(2024, 3, 1), date(2024, 3, 10)
+    rows = [
+        {"d": date(2024, 3, 1), "value": 2},
+        {"d": date(2024, 3, 1), "value": 3},
+        {"d": date(2024, 3, 10), "value": 4},
+        {"d": date(2024, 2, 29), "value": 100},
+        {"d": date(2024, 3, 11), "value": 100},
+    ]
+    values = dense_daily(rows, start, end)
+    assert values.tolist() == [5, 0, 0, 0, 0, 0, 0, 0, 0, 4]
+
+
+def test_dense_daily_custom_keys_and_empty_ranges():
+    rows = [{"day": date(2024, 1, 2), "n": 7}]
+    assert dense_daily(rows, date(2024, 1, 1), date(2024, 1, 3), "day", "n").tolist() == [0, 7, 0]
+    assert dense_daily([], date(2024, 1, 1), date(2024, 1, 3)).tolist() == [0, 0, 0]
+    assert len(dense_daily(rows, date(2024, 1, 3), date(2024, 1, 1))) == 0
@@ -0,0 +1,106 @@
+# Workday calendar checked against known Easter dates and a day-by-day count
+
+from datetime import date, timedelta
+
+import numpy as np
+import pytest
+
+from app.libs.workdays import WorkdayCalendar, easter_sunday, norwegian_holidays
+
+
+def brute_force_workdays(start: date, end: date) -> int:
+    holidays = {h for year in range(start.year, end.year + 1) for h in norwegian_holidays(year)}
+    count = 0
+    day = start
+    while day <= end:
+        if day.weekday() < 5 and day not in holidays:
+            count += 1
+        day += timedelta(days=1)
+    return count
+
+
+@pytest.mark.parametrize("year,expected", [
+    (1818, date(1818, 3, 22)),
+    (1943, date(1943, 4, 25)),
+    (2000, date(2000, 4, 23)),
+    (2019, date(2019, 4, 21)),
+    (2024, date(2024, 3, 31)),
+    (2025, date(2025, 4, 20)),
+    (2026, date(2026, 4, 5)),
+    (2038, date(2038, 4, 25)),
+])
+def test_easter_sunday(year, expected):
+    assert easter_sunday(year) == expected
+
+
+def test_norwegian_holidays_2025():
+    assert norwegian_holidays(2025) == [
+        date(2025, 1, 1),
+        date(2025, 4, 17), date(2025, 4, 18), date(2025, 4, 20), date(2025, 4, 21),
+        date(2025, 5, 1), date(2025, 5, 17), date(2025, 5, 29),
+        date(2025, 6, 8), date(2025, 6, 9),
+        date(2025, 12, 25), date(2025, 12, 26),
+    ]
+
+
+def test_q2_2025_has_59_workdays():
+    assert WorkdayCalendar().count(date(2025, 4, 1), date(2025, 6, 30)) == 59
+
+
+def test_quarter_edges():
+    calendar = WorkdayCalendar()
+    start, end = date(2025, 4, 1), date(2025, 6, 30)  # Tuesday, Monday
+
+    before = calendar.quarter(start, end, start - timedelta(days=1))
+    assert (before.total, before.passed, before.remaining, before.left) == (59, 0, 59, 59)
+    assert not before.today_is_workday
+
+    first = calendar.quarter(start, end, start)
+    assert (first.passed, first.remaining, first.left) == (0, 58, 59)
+    assert first.today_is_workday and first.progress == 0.0
+
+    last = calendar.quarter(start, end, end)
+    assert (last.passed, last.remaining, last.left) == (58, 0, 1)
+
+    after = calendar.quarter(start, end, end + timedelta(days=1))
+    assert (after.passed, after.remaining, after.left) == (59, 0, 0)
+    assert after.progress == 1.0
+
+    # Good Friday: a weekday, but not a workday
+    holiday = calendar.quarter(start, end, date(2025, 4, 18))
+    assert not holiday.today_is_workday
+    assert holiday.passed + holiday.remaining == holiday.total
+
+
+def test_counts_match_brute_force():
+    calendar = WorkdayCalendar()
+    rng = np.random.default_rng(0)
+    first = date(2023, 1, 1)
+    for offset, length in zip(rng.integers(0, 1200, 200), rng.integers(0, 120, 200)):
+        start = first + timedelta(days=int(offset))
+        end = start + timedelta(days=int(length))
+        assert calendar.count(start, end) == brute_force_workdays(start, end), (start, end)
+    assert calendar.count(date(2025, 5, 2), date(2025, 5, 1)) == 0
+
+
+def test_mask_matches_brute_force():
+    calendar = WorkdayCalendar()
+    start = date(2025, 3, 25)
+    mask = calendar.mask(start, 60)
+    for i, flag in enumerate(mask):
+        day = start + timedelta(days=i)
+        assert bool(flag) == (brute_force_workdays(day, day) == 1), day
+
+
+def test_quarter_matches_brute_force_every_day():
+    calendar = WorkdayCalendar()
+    start, end = date(2026, 1, 1), date(2026, 3, 31)
+    total = brute_force_workdays(start, end)
+    day = start
+    while day <= end:
+        q = calendar.quarter(start, end, day)
+        assert q.total == total
+        assert q.passed == brute_force_workdays(start, day - timedelta(days=1))
+        assert q.remaining == brute_force_workdays(day + timedelta(days=1), end)
+        assert q.left == q.remaining + (brute_force_workdays(day, day) == 1)
+        day += timedelta(days=1)
@@ -0,0 +1,52 @@
+// Idempotency keys for logging calls.
+// The backend's IdempotencyMiddleware executes a keyed write once and replays
+// its response for repeats of the same key. A double tap (or a retry) sends
+// the same body to the same endpoint within a moment, so it reuses the key of
+// the first call; anything later gets a fresh key and is logged normally.
+
+const IDEMPOTENCY_HEADER = "X-Idempotency-Key";
+
+// Identical calls closer together than this are treated as one
+const DOUBLE_TAP_WINDOW_MS = 2000;
+
+// Write endpoints where a duplicate would double-count an activity
+const KEYED_PATHS = [
+  "/activities/log",
+  "/booking-competition/quick-log",
+  "/booking-competition/bulk-log",
+  "/competitions-v2/event",
+  "/mcp/tools/competitions/log-event",
+];
+
+// `${path} ${body}` -> key and when it was last used
+const recentKeys = new Map<string, { key: string; usedAt: number }>();
+
+const newKey = (): string =>
+  typeof crypto !== "undefined" && "randomUUID" in crypto
+    ? crypto.randomUUID()
+    : `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+
+const keyFor = (path: string, body: string): string => {
+  const now = Date.now();
+  for (const [signature, entry] of recentKeys) {
+    if (now - entry.usedAt > DOUBLE_TAP_WINDOW_MS) recentKeys.delete(signature);
+  }
+  const signature = `${path} ${body}`;
+  const recent = recentKeys.get(signature);
+  const key = recent ? recent.key : newKey();
+  recentKeys.set(signature, { key, usedAt: now });
+  return key;
+};
+
+/** Add an X-Idempotency-Key to logging POSTs (other requests pass through) */
+export const withIdempotencyKey = (url: RequestInfo | URL, options: RequestInit = {}): RequestInit => {
+  if ((options.method || "GET").toUpperCase() !== "POST") return options;
+  const path = new URL(url.toString(), window.location.origin).pathname;
+  if (!KEYED_PATHS.some((keyed) => path.endsWith(keyed))) return options;
+
+  const headers = new Headers(options.headers);
+  if (!headers.has(IDEMPOTENCY_HEADER)) {
+    headers.set(IDEMPOTENCY_HEADER, keyFor(path, typeof options.body === "string" ? options.body : ""));
+  }
+  return { ...options, headers };
+};
@@ -2,6 +2,7 @@ import { auth } from "app/auth";
 import { API_HOST, API_PATH, API_PREFIX_PATH } from "../constants";
 import { Brain } from "./Brain";
 import type { RequestParams } from "./http-client";
+import { withIdempotencyKey } from "./idempotency";
 
 const isDeployedToCustomApiPath = API_PREFIX_PATH !== API_PATH;
 
@@ -32,7 +33,9 @@ const constructClient = () => {
   return new Brain({
     baseUrl,
     baseApiParams,
-    customFetch: (url, options) => {
+    customFetch: (url, init) => {
+      // Logging calls carry an idempotency key so double taps count once
+      const options = withIdempotencyKey(url, init);
       if (isDeployedToCustomApiPath) {
         // Remove /routes/ segment from path if the api is deployed and made accessible through
         // another domain with custom path different from the databutton proxy path